@@ -26,4 +26,19 @@ else:
 # --- Bot Settings ---
 ADMIN_USER_IDS = [123456789, 987654321] # Example admin IDs
 
+# --- Scheduler Settings ---
+# Фоновое обновление отчетов в процессе бота (app/telegram_bot/scheduler.py)
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', '1') == '1'
+SCHEDULER_STATE_FILE = 'results/scheduler_state.json'
+# Сколько фоновых отчетов может строиться одновременно. Должно быть меньше
+# CRAWL_SERVICE_MAX_PARALLEL_CRAWLS, чтобы запросам пользователей оставались слоты
+SCHEDULER_MAX_CONCURRENT_JOBS = 1
+# Случайный сдвиг времени запуска (доля интервала)
+SCHEDULER_JITTER = 0.1
+# Отчеты и интервалы их обновления (секунды)
+SCHEDULED_REPORTS = [
+    {'search_query': 'lenovo thinkbook', 'search_mode': 'basic', 'interval': 3600},
+    {'search_query': 'lenovo thinkbook', 'search_mode': 'advanced', 'interval': 3 * 3600},
+]
+
 logger.info("Configuration loaded successfully.")
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, JSON
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 import datetime
@@ -19,4 +19,29 @@ class Product(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     def __repr__(self):
-        return f"<Product(name='{self.name}', price={self.price})>"
\ No newline at end of file
+        return f"<Product(name='{self.name}', price={self.price})>"
+
+
+class WatchRule(Base):
+    """
+    Правило наблюдения: какие предложения попадают в группу отчета.
+    Правила без chat_id общие, с chat_id - только для отчетов этого чата.
+    """
+    __tablename__ = 'watch_rules'
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String, nullable=True, index=True)
+    group_name = Column(String, nullable=False, default='default')
+    name = Column(String, nullable=False)
+    keywords = Column(JSON, nullable=False, default=list)
+    exclude = Column(JSON, nullable=False, default=list)
+    min_price = Column(Float, nullable=True)
+    max_price = Column(Float, nullable=True)
+    attributes = Column(JSON, nullable=False, default=dict)
+    limit = Column(Integer, nullable=False, default=3)
+    position = Column(Integer, nullable=False, default=0)
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f"<WatchRule(name='{self.name}', group='{self.group_name}', chat_id={self.chat_id})>"
@@ -0,0 +1,334 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Класс запроса, если вызывающий код его не указал
+DEFAULT_QUERY_CLASS = 'search'
+
+
+class CachedResult(list):
+    """
+    Список элементов из кэша с возрастом (секунды с момента обхода).
+    stale - срок жизни истек, результат отдан, пока идет фоновое обновление.
+    """
+    def __init__(self, items, age: float = 0.0, stale: bool = False):
+        super().__init__(items)
+        self.age = age
+        self.stale = stale
+
+
+def normalize_query(query: str) -> str:
+    """
+    Нормализует поисковый запрос для ключа кэша: регистр, пробелы и порядок
+    слов не влияют на выдачу, поэтому "Lenovo ThinkBook" и "thinkbook  lenovo"
+    дают один ключ.
+    """
+    return ' '.join(sorted(query.lower().split()))
+
+
+class SqliteCacheTier:
+    """
+    Постоянный уровень кэша: один SQLite-файл, значения - JSON без отступов,
+    сжатый zlib.
+
+    - Запись выполняется в транзакции, поэтому читатели (в том числе другие
+      процессы) никогда не видят частично записанное значение.
+    - Общий размер сжатых значений ограничен max_bytes: при превышении
+      удаляются записи, к которым дольше всего не обращались (LRU).
+    """
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, compression_level: int = 6):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            # Соединение общее для потоков бота, доступ к нему - под self._lock
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            self._db.commit()
+        return self._db
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        try:
+            with self._lock:
+                db = self._connect()
+                row = db.execute("SELECT stored_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+            stored_at, value = row
+            return stored_at, json.loads(zlib.decompress(value))
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке данных из кэша {self.path} ({key}): {e}", exc_info=True)
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                             self.compression_level)
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._connect()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, data, len(data), now, now),
+                    )
+                    evicted = self._evict(db)
+            if evicted:
+                logger.info(f"Из кэша {self.path} вытеснено {evicted} давно не использованных записей.")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных в кэш {self.path} ({key}): {e}", exc_info=True)
+
+    def _evict(self, db: sqlite3.Connection) -> int:
+        """
+        Удаляет самые давно использованные записи, пока кэш не уложится в max_bytes.
+        Только что записанное значение не удаляется, даже если оно одно больше лимита.
+        """
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        evicted = 0
+        if total <= self.max_bytes:
+            return evicted
+        rows = db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        for key, size in rows[:-1]:
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+
+class ResultCache:
+    """
+    Двухуровневый кэш результатов обходов.
+
+    - Первый уровень - LRU в памяти на memory_size ключей: повторные
+      попадания не читают и не разбирают файл.
+    - Второй уровень - постоянное хранилище (SqliteCacheTier), переживает
+      перезапуск бота; найденное в нем значение поднимается в память.
+    - Срок жизни задается по классу запроса (ttl_by_class), например
+      обычный поиск и цели наблюдения устаревают с разной скоростью.
+    - get_or_fetch объединяет одновременные одинаковые запросы: обход
+      выполняет первый вызов, остальные ждут его результат. Вызовы могут
+      приходить из разных потоков и циклов событий, поэтому ожидание
+      построено на concurrent.futures.Future под threading.Lock.
+    - Stale-while-revalidate: результат с истекшим сроком жизни, но не старше
+      max_stale_by_class, отдается сразу (CachedResult.stale), а обход для его
+      обновления запускается в фоне. Более старый результат не отдается,
+      и вызывающий код ждет обхода.
+    """
+    def __init__(self, persistent: SqliteCacheTier, memory_size: int = 32,
+                 ttl_by_class: Optional[Dict[str, float]] = None, default_ttl: float = 3600,
+                 max_stale_by_class: Optional[Dict[str, float]] = None, stale_while_revalidate: bool = True):
+        self.persistent = persistent
+        self.memory_size = memory_size
+        self.ttl_by_class = dict(ttl_by_class or {})
+        self.default_ttl = default_ttl
+        self.max_stale_by_class = dict(max_stale_by_class or {})
+        self.stale_while_revalidate = stale_while_revalidate
+
+        self._memory: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._in_flight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'persistent_hits': 0, 'stale_hits': 0, 'misses': 0,
+                         'coalesced': 0, 'revalidations': 0}
+
+    @classmethod
+    def from_settings(cls, settings) -> 'ResultCache':
+        return cls(
+            SqliteCacheTier(
+                settings.get('RESULT_CACHE_FILE'),
+                max_bytes=settings.getint('RESULT_CACHE_MAX_BYTES', 50 * 1024 * 1024),
+            ),
+            memory_size=settings.getint('RESULT_CACHE_MEMORY_SIZE', 32),
+            ttl_by_class=settings.getdict('RESULT_CACHE_TTL'),
+            default_ttl=settings.getfloat('RESULT_CACHE_DEFAULT_TTL', 3600),
+            max_stale_by_class=settings.getdict('RESULT_CACHE_MAX_STALE'),
+            stale_while_revalidate=settings.getbool('RESULT_CACHE_STALE_WHILE_REVALIDATE', True),
+        )
+
+    def ttl(self, query_class: str) -> float:
+        return float(self.ttl_by_class.get(query_class, self.default_ttl))
+
+    def max_stale(self, query_class: str) -> float:
+        """
+        Предельный возраст результата, который еще можно отдать устаревшим.
+        Если для класса он не задан, устаревшие результаты не отдаются.
+        """
+        return max(float(self.max_stale_by_class.get(query_class, 0)), self.ttl(query_class))
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        with self._lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _find(self, key: str) -> Optional[Tuple[float, Any, str]]:
+        """
+        Ищет запись сначала в памяти, затем в постоянном уровне.
+        Возвращает (время записи, значение, уровень) без проверки срока жизни.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry[0], entry[1], 'memory'
+
+        entry = self.persistent.get(key)
+        if entry is not None:
+            self._remember(key, *entry)
+            return entry[0], entry[1], 'persistent'
+        return None
+
+    def lookup(self, key: str, query_class: str = DEFAULT_QUERY_CLASS,
+               allow_stale: bool = False) -> Optional[Any]:
+        """
+        Возвращает значение из кэша или None. Списки возвращаются как CachedResult
+        с возрастом. При allow_stale отдается и устаревшее значение, если оно
+        не старше max_stale(query_class).
+        """
+        entry = self._find(key)
+        if entry is not None:
+            stored_at, value, tier = entry
+            age = time.time() - stored_at
+            if age < self.ttl(query_class):
+                self._count(f'{tier}_hits')
+                if tier == 'persistent':
+                    logger.info(f"Результаты для '{key}' загружены из постоянного кэша.")
+                return CachedResult(value, age) if isinstance(value, list) else value
+            if allow_stale and age < self.max_stale(query_class):
+                self._count('stale_hits')
+                logger.info(f"Результаты для '{key}' устарели ({age / 60:.0f} мин.), отдаем их и обновляем в фоне.")
+                return CachedResult(value, age, stale=True) if isinstance(value, list) else value
+
+        self._count('misses')
+        return None
+
+    def get(self, key: str, query_class: str = DEFAULT_QUERY_CLASS) -> Optional[Any]:
+        """
+        Возвращает действительное значение из памяти или постоянного уровня, иначе None.
+        """
+        return self.lookup(key, query_class)
+
+    def set(self, key: str, value: Any) -> None:
+        self._remember(key, time.time(), value)
+        self.persistent.set(key, value)
+
+    def begin(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        """
+        Регистрирует получение значения для ключа. Возвращает future и признак
+        "ведущего": ведущий выполняет обход и обязан вызвать complete(),
+        остальные ждут future.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.counters['coalesced'] += 1
+                return future, False
+            future = self._in_flight[key] = concurrent.futures.Future()
+            return future, True
+
+    def complete(self, key: str, future: concurrent.futures.Future, value: Any = None,
+                 error: Optional[BaseException] = None, store: bool = True) -> None:
+        """
+        Передает результат ведущего ожидающим и, если он не пустой, кэширует его.
+        """
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+            return
+        if store and value:
+            self.set(key, value)
+        future.set_result(value)
+        logger.info(f"Кэш результатов: {self.stats()}")
+
+    def revalidate(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Обновляет значение в фоне. Цикл событий вызывающего кода может закрыться
+        раньше, чем закончится обход, поэтому обновление идет в своем потоке.
+        Если обход для ключа уже выполняется, второй не запускается.
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            return
+        self._count('revalidations')
+
+        async def refresh():
+            try:
+                value = await fetch()
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления кэша для '{key}': {e}", exc_info=True)
+                self.complete(key, future, error=e)
+                return
+            self.complete(key, future, value)
+
+        threading.Thread(target=asyncio.run, args=(refresh(),), name="cache-revalidate", daemon=True).start()
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]],
+                           query_class: str = DEFAULT_QUERY_CLASS,
+                           stale_while_revalidate: Optional[bool] = None) -> Any:
+        """
+        Возвращает значение из кэша или получает его через fetch().
+        Пока fetch() для ключа выполняется, одинаковые вызовы ждут его результат.
+        Пустой результат не кэшируется (обход мог завершиться неудачей).
+        В режиме stale-while-revalidate устаревшее значение отдается сразу,
+        а fetch() выполняется в фоне.
+        """
+        if stale_while_revalidate is None:
+            stale_while_revalidate = self.stale_while_revalidate
+        value = self.lookup(key, query_class, allow_stale=stale_while_revalidate)
+        if value is not None:
+            if getattr(value, 'stale', False):
+                self.revalidate(key, fetch)
+            return value
+
+        future, leader = self.begin(key)
+        if not leader:
+            logger.info(f"Обход для '{key}' уже выполняется, ждем его результат.")
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await fetch()
+        except BaseException as e:
+            self.complete(key, future, error=e)
+            raise
+        self.complete(key, future, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            counters['memory_entries'] = len(self._memory)
+            counters['in_flight'] = len(self._in_flight)
+        hits = counters['memory_hits'] + counters['persistent_hits'] + counters['stale_hits']
+        lookups = hits + counters['misses']
+        counters['hit_rate'] = round(hits / lookups, 3) if lookups else 0.0
+        return counters
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+from .delta import offer_key
+
+logger = logging.getLogger(__name__)
+
+ITEMS_FILE = 'items.jl'
+PENDING_FILE = 'pending.pickle'
+
+# Задания, которые сейчас выполняются в этом процессе: два обхода
+# с одним и тем же JOBDIR испортили бы друг другу очередь запросов
+_active_jobs = set()
+
+
+class CrawlJob:
+    """
+    Каталог контрольной точки одного обхода (JOBDIR Scrapy).
+
+    В нем Scrapy хранит очередь ожидающих запросов и отпечатки уже
+    увиденных, а расширение ItemsCheckpoint - собранные элементы и запросы,
+    которые были в работе. Если процесс бота завершится посреди обхода,
+    следующий запуск с теми же аргументами продолжит его с места остановки.
+    Каталог удаляется после успешного завершения обхода.
+    """
+    def __init__(self, path: str, max_age: Optional[float] = None):
+        self.path = path
+        self.max_age = max_age
+        self.acquired = False
+
+    @classmethod
+    def for_spider(cls, jobs_dir: str, spider_name: str, spider_kwargs: Dict[str, Any],
+                   max_age: Optional[float] = None) -> 'CrawlJob':
+        """
+        Каталог задания определяется пауком и его аргументами.
+        """
+        key = json.dumps(spider_kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        job_id = f"{spider_name}-{hashlib.md5(key.encode('utf-8')).hexdigest()[:12]}"
+        return cls(os.path.join(jobs_dir, job_id), max_age)
+
+    @property
+    def items_path(self) -> str:
+        return os.path.join(self.path, ITEMS_FILE)
+
+    def acquire(self) -> bool:
+        """
+        Занимает задание. Возвращает False, если оно уже выполняется в этом процессе.
+        """
+        if self.path in _active_jobs:
+            return False
+        _active_jobs.add(self.path)
+        self.acquired = True
+
+        if os.path.isdir(self.path) and self.max_age and time.time() - os.path.getmtime(self.path) > self.max_age:
+            logger.info(f"Контрольная точка {self.path} устарела, обход начнется заново.")
+            self.discard()
+        elif os.path.isdir(self.path):
+            logger.info(f"Найдена контрольная точка {self.path}, обход продолжится с места остановки.")
+        return True
+
+    def release(self) -> None:
+        if self.acquired:
+            _active_jobs.discard(self.path)
+            self.acquired = False
+
+    def settings_overrides(self) -> Dict[str, Any]:
+        return {'JOBDIR': self.path}
+
+    def load_items(self) -> List[Dict[str, Any]]:
+        """
+        Элементы, собранные прерванными запусками этого задания.
+        """
+        if not os.path.exists(self.items_path):
+            return []
+        items = []
+        with open(self.items_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    # Последняя строка могла быть записана не полностью
+                    logger.warning(f"Пропущена поврежденная строка в {self.items_path}.")
+        return items
+
+    def discard(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def finish(self) -> None:
+        """
+        Обход завершен: контрольная точка больше не нужна.
+        """
+        self.discard()
+        self.release()
+
+
+def item_key(item: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Ключ элемента для отбрасывания повторов между прерванным и продолженным запусками.
+    Ссылка сравнивается по offer_key: остальные ее параметры меняются от запуска к запуску.
+    """
+    link = item.get('link')
+    return (item.get('source'), item.get('query'), offer_key(link) if link and link != 'N/A' else None,
+            item.get('title'))
+
+
+def merge_items(previous: List[Dict[str, Any]], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Объединяет элементы прерванного и продолженного запусков.
+    Страница, которая была в работе в момент остановки, обходится повторно,
+    поэтому ее элементы могут встретиться дважды.
+    """
+    merged = []
+    seen = set()
+    for item in previous + items:
+        key = item_key(item)
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(item)
+    return merged
+
+
+class CheckpointDupeFilter(RFPDupeFilter):
+    """
+    Фильтр повторов, который сразу сбрасывает новые отпечатки в JOBDIR/requests.seen.
+    Стандартный фильтр пишет их с буферизацией, и при аварийной остановке
+    отпечатки теряются: продолженный обход начинал бы заново с первой страницы.
+    """
+    def request_seen(self, request) -> bool:
+        seen = super().request_seen(request)
+        if not seen and self.file:
+            self.file.flush()
+        return seen
+
+
+class ItemsCheckpoint:
+    """
+    Расширение Scrapy, дополняющее JOBDIR до полноценной контрольной точки.
+
+    Scrapy сохраняет очередь запросов только при штатном закрытии паука,
+    а собранные элементы и запросы, уже извлеченные из очереди, не сохраняет
+    вовсе: при остановке процесса они теряются, а с ними и продолжение пагинации.
+    Расширение:
+    - дописывает каждый собранный элемент в JOBDIR/items.jl;
+    - хранит в JOBDIR/pending.pickle запросы от постановки в очередь до выхода
+      из загрузчика и при продолжении обхода ставит их в очередь повторно.
+    При штатном закрытии очередь сохраняет сам Scrapy, поэтому в pending.pickle
+    остаются только запросы, которые были в загрузчике.
+    pending.pickle перезаписывается не на каждый запрос, а по таймеру раз в
+    CHECKPOINT_FLUSH_INTERVAL секунд, если набор запросов изменился, и при закрытии.
+    Включается только если задан JOBDIR.
+    """
+    def __init__(self, crawler, jobdir: str):
+        self.crawler = crawler
+        self.jobdir = jobdir
+        self.items_file = None
+        # Отпечаток -> {'request': запрос в виде словаря, 'downloading': отправлен ли в загрузчик}
+        self.pending: Dict[bytes, Dict[str, Any]] = {}
+        self.pending_path = os.path.join(jobdir, PENDING_FILE)
+        self.flush_interval = crawler.settings.getfloat('CHECKPOINT_FLUSH_INTERVAL', 5)
+        self.dirty = False
+        self.flush_task = None
+
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(self.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.request_done, signal=signals.request_left_downloader)
+        crawler.signals.connect(self.request_done, signal=signals.request_dropped)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        if not jobdir:
+            raise NotConfigured
+        return cls(crawler, jobdir)
+
+    def spider_opened(self, spider):
+        os.makedirs(self.jobdir, exist_ok=True)
+        self.items_file = open(os.path.join(self.jobdir, ITEMS_FILE), 'a', encoding='utf-8')
+
+        resumed = 0
+        for request_dict in self.load_pending():
+            try:
+                request = request_from_dict(request_dict, spider=spider)
+            except Exception as e:
+                logger.warning(f"Не удалось восстановить запрос {request_dict.get('url')}: {e}")
+                continue
+            # Отпечаток запроса уже есть в requests.seen
+            request.dont_filter = True
+            self.crawler.engine.crawl(request)
+            resumed += 1
+        if resumed:
+            self.crawler.stats.set_value('checkpoint/resumed_requests', resumed)
+            logger.info(f"Повторно поставлено в очередь {resumed} запросов, прерванных при остановке.")
+
+        self.flush_task = task.LoopingCall(self.flush_pending)
+        self.flush_task.start(self.flush_interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.flush_task is not None and self.flush_task.running:
+            self.flush_task.stop()
+        self.flush_task = None
+        if self.items_file is not None:
+            self.items_file.close()
+            self.items_file = None
+        # Запросы из очереди Scrapy сохранил сам; остаются только недокачанные
+        self.pending = {fp: entry for fp, entry in self.pending.items() if entry['downloading']}
+        self.save_pending()
+
+    def item_scraped(self, item, response, spider):
+        self.items_file.write(json.dumps(ItemAdapter(item).asdict(), ensure_ascii=False) + '\n')
+        # Сбрасываем сразу: процесс может завершиться в любой момент
+        self.items_file.flush()
+        self.crawler.stats.inc_value('checkpoint/items_written')
+
+    def request_scheduled(self, request, spider):
+        self.pending[self.fingerprint(request)] = {'request': self.serializable(request, spider), 'downloading': False}
+        self.dirty = True
+
+    def request_reached_downloader(self, request, spider):
+        entry = self.pending.get(self.fingerprint(request))
+        if entry is not None:
+            entry['downloading'] = True
+
+    def request_done(self, request, spider):
+        if self.pending.pop(self.fingerprint(request), None) is not None:
+            self.dirty = True
+
+    def fingerprint(self, request) -> bytes:
+        return self.crawler.request_fingerprinter.fingerprint(request)
+
+    @staticmethod
+    def serializable(request, spider) -> Dict[str, Any]:
+        """
+        Словарь запроса без объектов, которые нельзя сохранить (страница Playwright и т.п.).
+        """
+        request_dict = request.to_dict(spider=spider)
+        meta = {}
+        for key, value in request_dict.get('meta', {}).items():
+            try:
+                pickle.dumps(value)
+            except Exception:
+                continue
+            meta[key] = value
+        request_dict['meta'] = meta
+        return request_dict
+
+    def load_pending(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.pending_path):
+            return []
+        try:
+            with open(self.pending_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке прерванных запросов {self.pending_path}: {e}", exc_info=True)
+            return []
+
+    def flush_pending(self) -> None:
+        """
+        Вызывается таймером: сохраняет запросы, если они изменились с прошлого сохранения.
+        """
+        if not self.dirty:
+            return
+        try:
+            self.save_pending()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении прерванных запросов {self.pending_path}: {e}", exc_info=True)
+            self.dirty = True
+
+    def save_pending(self) -> None:
+        self.dirty = False
+        tmp_path = f"{self.pending_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump([entry['request'] for entry in self.pending.values()], f, protocol=4)
+        os.replace(tmp_path, self.pending_path)
@@ -0,0 +1,417 @@
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд ждать запуска реактора и браузера
+STARTUP_TIMEOUT = 60
+
+
+def _find_free_port() -> int:
+    """
+    Находит свободный TCP-порт для отладочного (CDP) подключения к браузеру.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class CrawlHandle:
+    """
+    Управление запущенным обходом из другого потока: остановка паука до конца обхода.
+
+    В процессе с реактором обход привязывается через attach() (в потоке реактора),
+    и cancel() закрывает паука там же. Если обход идет в другом процессе,
+    bind() задает функцию, которая передает отмену туда.
+    """
+    def __init__(self):
+        self._crawler = None
+        self._reactor = None
+        self._canceller = None
+        self._stopping = False
+        self.cancelled = False
+
+    def attach(self, crawler, reactor) -> None:
+        """
+        Привязывает обработчик к краулеру (вызывается в потоке реактора).
+        """
+        self._crawler = crawler
+        self._reactor = reactor
+        # Отмена могла прийти, пока обход ждал места в семафоре
+        crawler.signals.connect(self._spider_opened, signal=signals.spider_opened, weak=False)
+
+    def bind(self, canceller: Callable[[], None]) -> None:
+        """
+        Задает функцию отмены обхода, идущего в другом процессе.
+        """
+        self._canceller = canceller
+        if self.cancelled:
+            canceller()
+
+    def cancel(self) -> None:
+        """
+        Останавливает обход: паук закрывается с причиной 'consumer_closed'.
+        Можно вызывать из любого потока.
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self._reactor is not None:
+            self._reactor.callFromThread(self._stop_crawl)
+        elif self._canceller is not None:
+            self._canceller()
+
+    def _spider_opened(self, spider) -> None:
+        # Выполняется в потоке реактора
+        if self.cancelled:
+            self._reactor.callLater(0, self._stop_crawl)
+
+    def _stop_crawl(self) -> None:
+        # Выполняется в потоке реактора
+        engine = getattr(self._crawler, 'engine', None)
+        spider = getattr(engine, 'spider', None)
+        if spider is None or self._stopping:
+            # Паук еще не открыт: его закроет _spider_opened
+            return
+        self._stopping = True
+        logger.info(f"Обход паука {spider.name} отменен, паук закрывается.")
+        engine.close_spider(spider, 'consumer_closed')
+
+
+class ItemStream(CrawlHandle):
+    """
+    Асинхронный итератор по элементам одного обхода с обратным давлением.
+
+    Элементы приходят из другого потока (реактора или диспетчера пула) и
+    передаются в очередь цикла событий потребителя. Когда потребитель отстает
+    и в буфере накапливается high_watermark элементов, движок Scrapy ставится
+    на паузу и снимается с нее, когда буфер опустеет до low_watermark.
+    Если потребитель прекратил чтение (aclose), обход отменяется.
+    """
+    _END = object()
+
+    def __init__(self, high_watermark: int = 100, low_watermark: Optional[int] = None):
+        super().__init__()
+        self.high_watermark = high_watermark
+        self.low_watermark = high_watermark // 2 if low_watermark is None else low_watermark
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._buffered = 0
+        self._paused = False
+        self._closed = False
+        self.pauses = 0
+
+    def push(self, item: Dict[str, Any]) -> None:
+        """
+        Передает элемент потребителю (вызывается из потока-производителя).
+        """
+        self._buffered += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        engine = getattr(self._crawler, 'engine', None)
+        if engine is not None and not (self._paused or self._closed) and self._buffered >= self.high_watermark:
+            self._paused = True
+            self.pauses += 1
+            engine.pause()
+            logger.debug(f"Потребитель отстает ({self._buffered} элементов в буфере), обход приостановлен.")
+
+    def _consumed(self) -> None:
+        # Выполняется в потоке реактора
+        self._buffered -= 1
+        engine = getattr(self._crawler, 'engine', None)
+        if engine is not None and self._paused and self._buffered <= self.low_watermark:
+            self._paused = False
+            engine.unpause()
+
+    def run(self, crawl_coro) -> None:
+        """
+        Запускает обход; по его завершении в очередь попадает признак конца.
+        """
+        self._task = asyncio.ensure_future(crawl_coro)
+        self._task.add_done_callback(lambda _: self._queue.put_nowait(self._END))
+
+    def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        item = await self._queue.get()
+        if item is self._END:
+            # Пробрасываем исключение обхода, если он завершился ошибкой
+            self._task.result()
+            raise StopAsyncIteration
+        if self._reactor is not None:
+            self._reactor.callFromThread(self._consumed)
+        else:
+            self._buffered -= 1
+        return item
+
+    async def aclose(self) -> None:
+        """
+        Потребитель прекратил чтение: отменяем обход, чтобы он не загружал
+        оставшиеся страницы и сразу освободил место в семафоре (или рабочий процесс пула).
+        """
+        self._closed = True
+        if self._task is not None and self._task.done():
+            return
+        self.cancel()
+
+    def _stop_crawl(self) -> None:
+        # Выполняется в потоке реактора
+        engine = getattr(self._crawler, 'engine', None)
+        if engine is not None and self._paused:
+            self._paused = False
+            engine.unpause()
+        super()._stop_crawl()
+
+
+class CrawlService:
+    """
+    Долгоживущий сервис обхода сайтов.
+
+    Реактор Twisted нельзя перезапустить, поэтому он запускается один раз
+    в отдельном потоке и живет до конца процесса. Вместе с ним запускается
+    один браузер Chromium, к которому каждый обход подключается по CDP
+    вместо холодного запуска нового браузера.
+    Запросы принимаются через awaitable-API из любого цикла событий.
+    """
+    def __init__(self, max_parallel_crawls: Optional[int] = None):
+        self.settings = get_project_settings()
+        self.settings.set('SPIDER_MODULES', ['app.scraping.spiders'])
+        self.max_parallel_crawls = max_parallel_crawls or self.settings.getint('CRAWL_SERVICE_MAX_PARALLEL_CRAWLS', 4)
+
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._startup_error = None
+
+        self._reactor = None
+        self._runner = None
+        self._semaphore = None
+        self._playwright = None
+        self._browser = None
+        self.cdp_url = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._ready.is_set()
+
+    def start(self) -> None:
+        """
+        Запускает поток реактора и браузер, если они еще не запущены.
+        Безопасно вызывать многократно и из разных потоков.
+        """
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._startup_error = None
+                self._thread = threading.Thread(target=self._run_reactor, name="crawl-reactor", daemon=True)
+                self._thread.start()
+
+        if not self._ready.wait(STARTUP_TIMEOUT):
+            raise RuntimeError("Сервис обхода не запустился за отведенное время.")
+        if self._startup_error:
+            raise RuntimeError(f"Не удалось запустить сервис обхода: {self._startup_error}")
+
+    def stop(self) -> None:
+        """
+        Закрывает браузер и останавливает реактор.
+        """
+        if not self.is_running:
+            return
+
+        from scrapy.utils.defer import deferred_from_coro
+
+        def shutdown():
+            d = deferred_from_coro(self._close_browser())
+            d.addBoth(lambda _: self._reactor.stop())
+
+        self._reactor.callFromThread(shutdown)
+        self._thread.join(timeout=STARTUP_TIMEOUT)
+        logger.info("Сервис обхода остановлен.")
+
+    def _run_reactor(self) -> None:
+        """
+        Тело потока реактора: свой цикл asyncio, реактор поверх него и браузер.
+        """
+        try:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            install_reactor(self.settings.get('TWISTED_REACTOR'))
+
+            from twisted.internet import reactor, defer
+            self._reactor = reactor
+            self._semaphore = defer.DeferredSemaphore(self.max_parallel_crawls)
+
+            # CrawlerRunner не настраивает логирование, как это делал CrawlerProcess,
+            # поэтому приглушаем логи Scrapy вручную, чтобы не засорять вывод
+            logging.getLogger('scrapy').setLevel(logging.ERROR)
+
+            reactor.callWhenRunning(self._on_reactor_started)
+            reactor.run(installSignalHandlers=False)
+        except Exception as e:
+            logger.error(f"Ошибка в потоке реактора: {e}", exc_info=True)
+            self._startup_error = e
+            self._ready.set()
+
+    def _on_reactor_started(self) -> None:
+        from scrapy.utils.defer import deferred_from_coro
+
+        d = deferred_from_coro(self._launch_browser())
+        d.addErrback(self._on_browser_failed)
+        d.addBoth(lambda _: self._create_runner())
+
+    async def _launch_browser(self) -> None:
+        """
+        Запускает общий браузер с открытым портом CDP.
+        """
+        if self.settings.get('REPLAY_MODE') == 'replay':
+            logger.info("Режим воспроизведения: общий браузер не запускается.")
+            return
+
+        browser_type_name = self.settings.get('PLAYWRIGHT_BROWSER_TYPE', 'chromium')
+        if browser_type_name != 'chromium':
+            logger.warning(f"Общий браузер поддерживается только для chromium, а не '{browser_type_name}'. "
+                           "Каждый обход будет запускать свой браузер.")
+            return
+
+        from playwright.async_api import async_playwright
+
+        port = _find_free_port()
+        launch_options = dict(self.settings.getdict('PLAYWRIGHT_LAUNCH_OPTIONS'))
+        args = list(launch_options.pop('args', [])) + [f'--remote-debugging-port={port}']
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(args=args, **launch_options)
+        self.cdp_url = f"http://127.0.0.1:{port}"
+        logger.info(f"Общий браузер запущен, CDP: {self.cdp_url}")
+
+    def _on_browser_failed(self, failure) -> None:
+        logger.error(f"Не удалось запустить общий браузер, обходы будут запускать свой: {failure.value}")
+        self.cdp_url = None
+
+    async def _close_browser(self) -> None:
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def _create_runner(self) -> None:
+        from scrapy.crawler import CrawlerRunner
+
+        try:
+            settings = self.settings.copy()
+            if self.cdp_url:
+                settings.set('PLAYWRIGHT_CDP_URL', self.cdp_url)
+            self._runner = CrawlerRunner(settings)
+        except Exception as e:
+            logger.error(f"Не удалось создать CrawlerRunner: {e}", exc_info=True)
+            self._startup_error = e
+        finally:
+            self._ready.set()
+
+    async def crawl(self, spider_cls, settings_overrides: Optional[Dict[str, Any]] = None,
+                    on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    collect_items: bool = True, handle: Optional[CrawlHandle] = None,
+                    **spider_kwargs) -> List[Dict[str, Any]]:
+        """
+        Запускает паука и возвращает собранные элементы.
+        Не блокирует цикл событий вызывающего кода; несколько вызовов
+        выполняются параллельно (не более max_parallel_crawls одновременно).
+
+        Args:
+            spider_cls: Класс паука.
+            settings_overrides (dict, optional): Настройки Scrapy только для этого обхода.
+            on_item (callable, optional): Вызывается для каждого элемента сразу после сбора
+                (в потоке реактора).
+            collect_items (bool): Копить ли элементы для возврата. При потоковой
+                обработке они не нужны, и обход возвращает пустой список.
+            handle (CrawlHandle, optional): Через него обход можно отменить до завершения.
+            **spider_kwargs: Аргументы паука.
+        """
+        if not self.is_running:
+            # Запуск реактора и браузера ждет готовности, поэтому уводим его из цикла событий
+            await asyncio.get_running_loop().run_in_executor(None, self.start)
+        future = concurrent.futures.Future()
+        self._reactor.callFromThread(self._schedule_crawl, future, spider_cls, spider_kwargs,
+                                     settings_overrides, on_item, collect_items, handle)
+        return await asyncio.wrap_future(future)
+
+    def stream(self, spider_cls, settings_overrides: Optional[Dict[str, Any]] = None,
+               max_buffered_items: Optional[int] = None, **spider_kwargs) -> ItemStream:
+        """
+        Запускает паука и отдает элементы по мере сбора:
+
+            async for item in crawl_service.stream(YandexMarketSpider, search_query=query):
+                ...
+
+        Если потребитель не успевает, обход приостанавливается (см. ItemStream).
+        Вызывается из работающего цикла событий.
+        """
+        item_stream = ItemStream(max_buffered_items or self.settings.getint('STREAM_MAX_BUFFERED_ITEMS', 100))
+        item_stream.run(self.crawl(spider_cls, settings_overrides, on_item=item_stream.push,
+                                   collect_items=False, handle=item_stream, **spider_kwargs))
+        return item_stream
+
+    def _create_crawler(self, spider_cls, settings_overrides: Optional[Dict[str, Any]] = None):
+        """
+        Создает краулер с общими настройками сервиса и, при необходимости, переопределениями.
+        """
+        if not settings_overrides:
+            return self._runner.create_crawler(spider_cls)
+
+        from scrapy.crawler import Crawler
+
+        settings = self._runner.settings.copy()
+        settings.setdict(settings_overrides, priority='cmdline')
+        return Crawler(spider_cls, settings)
+
+    def _schedule_crawl(self, future: concurrent.futures.Future, spider_cls, spider_kwargs: Dict[str, Any],
+                        settings_overrides: Optional[Dict[str, Any]] = None,
+                        on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        collect_items: bool = True, handle: Optional[CrawlHandle] = None) -> None:
+        """
+        Выполняется в потоке реактора. Ставит обход в очередь семафора.
+        """
+        items = []
+
+        def item_scraped(item, response, spider):
+            item_dict = ItemAdapter(item).asdict()
+            if collect_items:
+                items.append(item_dict)
+            if on_item is not None:
+                on_item(item_dict)
+
+        def run_crawl():
+            crawler = self._create_crawler(spider_cls, settings_overrides)
+            # Подписка на сигналы конкретного краулера, а не глобального dispatcher:
+            # элементы параллельных обходов не смешиваются между собой
+            crawler.signals.connect(item_scraped, signal=signals.item_scraped, weak=False)
+            if handle is not None:
+                handle.attach(crawler, self._reactor)
+            return self._runner.crawl(crawler, **spider_kwargs)
+
+        def on_success(_):
+            if not future.cancelled():
+                future.set_result(items)
+
+        def on_failure(failure):
+            if not future.cancelled():
+                future.set_exception(failure.value)
+
+        d = self._semaphore.run(run_crawl)
+        d.addCallbacks(on_success, on_failure)
+
+
+# Глобальный экземпляр сервиса; реактор и браузер запускаются при первом обходе
+crawl_service = CrawlService()
@@ -1,29 +1,265 @@
+import concurrent.futures
+import hashlib
+import json
+import math
+import multiprocessing
 import re
 import logging
-from typing import Dict, Any, Optional, List
+import threading
+import time
+from itertools import repeat
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+
+from .decomposition_cache import DecompositionMemo
+
+try:
+    import pandas as pd
+except ImportError:
+    # pandas нужен только для decompose_frame; колоночный API работает и без него
+    pd = None
 
 logger = logging.getLogger(__name__)
 
+# Словари ключевых слов по параметрам. Из них собираются и регулярные выражения,
+# и таблица ключевых слов однопроходного разборщика, поэтому списки общие
+BRANDS = ('Lenovo', 'HP', 'Dell', 'Asus', 'Acer', 'MSI', 'Apple', 'Samsung', 'Huawei', 'Xiaomi', 'Google',
+          'Microsoft', 'Razer', 'LG')
+SERIES = ('ThinkPad', 'ThinkBook', 'IdeaPad', 'Yoga', 'Legion', 'Ideapad', 'V系列', 'Flex', 'Chromebook', 'YOGA',
+          'LOQ', 'Pavilion', 'Spectre', 'Envy', 'EliteBook', 'ProBook', 'ZBook', 'Omen', 'Inspiron', 'XPS',
+          'Alienware', 'Vostro', 'Latitude', 'G', 'ROG', 'TUF', 'VivoBook', 'ZenBook', 'AsusPro', 'Chromebook',
+          'Predator', 'Nitro', 'Swift', 'TravelMate', 'Extensa', 'Aspire', 'Spin', 'ConceptD', 'Blade', 'Stealth',
+          'Katana', 'Creator', 'Modern', 'Prestige', 'Megaport', 'Surface', 'Pixelbook', 'Chromebox', 'MacBook',
+          'Mac', 'iPad', 'Pro', 'Air', 'Studio', 'Book', 'Gram', 'Ultra', 'Chromebook', 'MateBook', 'MediaPad',
+          'Honor', 'MagicBook', 'RedmiBook', 'Mi')
+CPU_LINES = ('Intel', 'AMD', 'Apple', 'Qualcomm', 'ARM', 'MediaTek', 'NVIDIA', 'Samsung', 'Snapdragon', 'Exynos',
+             'Kirin', 'Dimensity', 'Core', 'Celeron', 'Pentium', 'Xeon', 'Atom', 'Ryzen', 'Athlon', 'Turion',
+             'Sempron', 'Phenom', 'Opteron', 'EPYC', 'Threadripper', 'APU')
+CPU_MODEL_WORDS = ('Celeron', 'Pentium', 'Xeon', 'Atom', 'Athlon', 'Turion', 'Sempron', 'Phenom', 'Opteron', 'EPYC',
+                   'Threadripper')
+STORAGE_TYPES = ('SSD', 'HDD', 'eMMC', 'NVMe', 'SATA')
+GPU_BRANDS = ('NVIDIA', 'AMD', 'Intel', 'GeForce', 'RTX', 'GTX', 'Radeon', 'Iris', 'UHD', 'HD', 'Iris', 'Arc')
+GPU_MODEL_WORDS = ('Quadro', 'Tesla', 'Radeon', 'Vega', 'Instinct', 'FirePro', 'FireGL', 'FireMV', 'FireStream',
+                   'Stream', 'Pro', 'Mobility', 'Mobile', 'Discrete', 'Integrated', 'Graphics', 'GPU')
+
+# Кавычки, которыми в названиях обозначают дюймы
+INCH_MARKS = '"”\'’″'
+
+# Параметры, которые извлекаются из названия, в порядке колонок результата
+TITLE_FIELDS = ('brand', 'series', 'diagonal', 'cpu_line', 'cpu_model', 'memory', 'storage_type',
+                'storage_capacity', 'gpu_brand', 'gpu_model', 'gpu_memory')
+# Колонки результата декомпозиции
+DECOMPOSED_COLUMNS = ('full_title',) + TITLE_FIELDS + ('price_numeric',)
+
+
+def _words(words) -> str:
+    return '|'.join(words)
+
+
+# Регулярные выражения для извлечения параметров (эталонная реализация)
+PATTERNS = {
+    'brand': re.compile(rf'\b({_words(BRANDS)})\b', re.IGNORECASE),
+    'series': re.compile(rf'\b({_words(SERIES)})\b', re.IGNORECASE),
+    'diagonal': re.compile(rf'(\d{{1,2}}(\.\d{{1,2}})?)[{INCH_MARKS}]', re.IGNORECASE),
+    'cpu_line': re.compile(rf'\b({_words(CPU_LINES)})\b', re.IGNORECASE),
+    'cpu_model': re.compile(rf'\b([A-Z]\d{{3,5}}|i\d-\d{{4,5}}|R\d{{3,5}}U?|U\d{{3,5}}|H\d{{3,5}}|HX\d{{3,5}}|G\d{{3,5}}'
+                            rf'|M\d{{3,5}}|N\d{{3,5}}|{_words(CPU_MODEL_WORDS)})\b', re.IGNORECASE),
+    'memory': re.compile(r'(\d{1,3})\s*(GB|ГБ|Гб|Gb|gb)', re.IGNORECASE),
+    'storage_type': re.compile(rf'\b({_words(STORAGE_TYPES)}|M\.2)\b', re.IGNORECASE),
+    'storage_capacity': re.compile(r'(\d{1,4})\s*(GB|TB|ГБ|Гб|Gb|gb|ТБ|Тб|Tb|tb)', re.IGNORECASE),
+    'gpu_brand': re.compile(rf'\b({_words(GPU_BRANDS)})\b', re.IGNORECASE),
+    'gpu_model': re.compile(rf'\b(RTX|GTX|RTX\d{{3,4}}|GTX\d{{3,4}}|MX\d{{3,4}}|Quadro|Tesla|A\d{{3,4}}|R\d{{3,4}}'
+                            rf'|{_words(GPU_MODEL_WORDS[2:])})\b', re.IGNORECASE),
+    'gpu_memory': re.compile(r'(\d{1,2})\s*(GB|ГБ|Гб|Gb|gb)', re.IGNORECASE),
+}
+
+# Слово в смысле \b регулярных выражений: непрерывная последовательность \w
+_WORD_RE = re.compile(r'\w+')
+_DIGITS_RE = re.compile(r'\d+')
+# Формы моделей процессоров и видеокарт (по слову в нижнем регистре)
+_CPU_MODEL_SHAPE = re.compile(r'(?:[a-z]|hx)\d{3,5}|r\d{3,5}u')
+_GPU_MODEL_SHAPE = re.compile(r'(?:rtx|gtx|mx|a|r)\d{3,4}')
+# Символы, которые re.IGNORECASE считает равными латинским и кириллическим
+# буквам словарей, хотя lower() переводит их в другие символы
+_CASE_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k', '\u1c84': 'т', '\u1c85': 'т'})
+_CASE_FOLD_CHARS = re.compile('[\u0130\u0131\u017f\u212a\u1c84\u1c85]')
+# Единицы объема после числа: единица -> [(параметр, сколько последних цифр числа берется)]
+_SIZE_UNITS = {
+    'gb': (('memory', 3), ('storage_capacity', 4), ('gpu_memory', 2)),
+    'гб': (('memory', 3), ('storage_capacity', 4), ('gpu_memory', 2)),
+    'tb': (('storage_capacity', 4),),
+    'тб': (('storage_capacity', 4),),
+}
+
+
+def _fold(text: str) -> str:
+    """Приводит текст к виду, в котором его сравнивает re.IGNORECASE. Длина не меняется."""
+    if _CASE_FOLD_CHARS.search(text):
+        text = text.translate(_CASE_FOLD)
+    return text.lower()
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+def _diagonal_start(title: str, digits_start: int, digits_end: int) -> int:
+    """
+    Начало диагонали, которая заканчивается числом title[digits_start:digits_end]:
+    до двух цифр, а если перед ними точка и цифры - дробное значение вида 15.6.
+    """
+    point = digits_start - 1
+    if digits_end - digits_start <= 2 and point >= 1 and title[point] == '.' and title[point - 1].isdecimal():
+        start = point - 1
+        if start >= 1 and title[start - 1].isdecimal():
+            start -= 1
+        return start
+    return max(digits_start, digits_end - 2)
+
+
+def patterns_fingerprint() -> str:
+    """
+    Отпечаток набора правил декомпозиции. Меняется при любом изменении
+    выражений PATTERNS (а значит, и словарей ключевых слов) или форм моделей,
+    и по нему сбрасывается кэш результатов (app/scraping/decomposition_cache.py).
+    """
+    rules = [[name, pattern.pattern, pattern.flags] for name, pattern in PATTERNS.items()]
+    rules.append([_CPU_MODEL_SHAPE.pattern, _GPU_MODEL_SHAPE.pattern, sorted(_SIZE_UNITS)])
+    return hashlib.sha1(json.dumps(rules, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TitleTokenizer:
+    """
+    Однопроходный разбор названия ноутбука.
+
+    Название один раз разбивается на слова (в смысле \\b регулярных выражений),
+    и каждое слово относится к параметрам:
+    - по таблице ключевых слов (слово в нижнем регистре -> параметры);
+    - по форме слова: буква + цифры для моделей процессоров и видеокарт;
+    - по соседям: число перед GB/ТБ - объем памяти или накопителя,
+      число перед кавычкой - диагональ, "i5" + "-12450" - модель процессора,
+      "M" + ".2" - тип накопителя.
+    Каждый параметр получает первое подходящее значение, поэтому результат
+    совпадает с первым совпадением соответствующего выражения из PATTERNS.
+    """
+    def __init__(self):
+        self.keywords: Dict[str, Tuple[str, ...]] = {}
+        for field, words in (('brand', BRANDS), ('series', SERIES), ('cpu_line', CPU_LINES),
+                             ('cpu_model', CPU_MODEL_WORDS), ('storage_type', STORAGE_TYPES),
+                             ('gpu_brand', GPU_BRANDS), ('gpu_model', ('RTX', 'GTX') + GPU_MODEL_WORDS)):
+            for word in words:
+                key = _fold(word)
+                fields = self.keywords.get(key, ())
+                if field not in fields:
+                    self.keywords[key] = fields + (field,)
+
+    def extract(self, title: str) -> Dict[str, str]:
+        """
+        Извлекает параметры из названия. Не найденные параметры - пустые строки.
+        """
+        found = dict.fromkeys(TITLE_FIELDS, '')
+        keywords = self.keywords
+        # Сворачивание регистра сохраняет длину строки, поэтому позиции слов общие
+        folded_title = _fold(title)
+        length = len(title)
+
+        for match in _WORD_RE.finditer(title):
+            start, end = match.span()
+            folded = folded_title[start:end]
+
+            fields = keywords.get(folded)
+            if fields:
+                for field in fields:
+                    if not found[field]:
+                        found[field] = title[start:end]
+
+            if folded.isalpha():
+                # M.2 - два слова через точку
+                if (folded == 'm' and not found['storage_type'] and title.startswith('.2', end)
+                        and (end + 2 == length or not _is_word_char(title[end + 2]))):
+                    found['storage_type'] = title[start:end + 2]
+                continue
+
+            # Модели процессоров и видеокарт начинаются с буквы
+            if not folded[0].isdecimal():
+                if not found['cpu_model']:
+                    if _CPU_MODEL_SHAPE.fullmatch(folded):
+                        found['cpu_model'] = title[start:end]
+                    elif (len(folded) == 2 and folded[0] == 'i' and folded[1].isdecimal()
+                          and title.startswith('-', end)):
+                        # i5-12450: за дефисом должно идти отдельное число из 4-5 цифр
+                        digits_end = end + 1
+                        while digits_end < length and title[digits_end].isdecimal():
+                            digits_end += 1
+                        if (4 <= digits_end - end - 1 <= 5
+                                and (digits_end == length or not _is_word_char(title[digits_end]))):
+                            found['cpu_model'] = title[start:digits_end]
+                if not found['gpu_model'] and _GPU_MODEL_SHAPE.fullmatch(folded):
+                    found['gpu_model'] = title[start:end]
+
+            for digits in _DIGITS_RE.finditer(title, start, end):
+                # Число относится к параметрам по тому, что стоит после него
+                digits_start, digits_end = digits.span()
+                unit_start = digits_end
+                if digits_end == end:
+                    # Число в конце слова: дальше может быть кавычка или пробелы и единица
+                    if digits_end < length and title[digits_end] in INCH_MARKS and not found['diagonal']:
+                        found['diagonal'] = title[_diagonal_start(title, digits_start, digits_end):digits_end]
+                    while unit_start < length and title[unit_start].isspace():
+                        unit_start += 1
+                units = _SIZE_UNITS.get(folded_title[unit_start:unit_start + 2])
+                if units:
+                    for field, max_digits in units:
+                        if not found[field]:
+                            found[field] = title[max(digits_start, digits_end - max_digits):digits_end]
+
+        return found
+
+
+# Разборщик рабочего процесса пула (создается при первом задании в процессе)
+_worker_decomposer = None
+
+
+def _decompose_chunk(engine: str, titles: List[str]) -> List[Tuple[str, ...]]:
+    """
+    Задание рабочего процесса: параметры пачки названий. Возвращаются кортежи
+    в порядке TITLE_FIELDS, а не словари - их дешевле передавать между процессами.
+    """
+    global _worker_decomposer
+    if _worker_decomposer is None or _worker_decomposer.engine != engine:
+        _worker_decomposer = LaptopDecomposer(engine=engine)
+    rows = []
+    for title in titles:
+        fields = _worker_decomposer.extract_fields(title)
+        rows.append(tuple(fields[field] for field in TITLE_FIELDS))
+    return rows
+
+
 class LaptopDecomposer:
     """
     Класс для декомпозиции данных о ноутбуках на отдельные параметры.
+
+    По умолчанию параметры извлекаются однопроходным разборщиком TitleTokenizer;
+    engine='regex' включает эталонную реализацию на регулярных выражениях PATTERNS
+    (результаты совпадают, см. benchmarks/decomposer_benchmark.py).
+    С memo уже разобранные названия берутся из кэша.
     """
     
-    def __init__(self):
-        # Упрощенные регулярные выражения для извлечения параметров
-        self.patterns = {
-            'brand': re.compile(r'\b(Lenovo|HP|Dell|Asus|Acer|MSI|Apple|Samsung|Huawei|Xiaomi|Google|Microsoft|Razer|LG)\b', re.IGNORECASE),
-            'series': re.compile(r'\b(ThinkPad|ThinkBook|IdeaPad|Yoga|Legion|Ideapad|V系列|Flex|Chromebook|YOGA|LOQ|Pavilion|Spectre|Envy|EliteBook|ProBook|ZBook|Omen|Inspiron|XPS|Alienware|Vostro|Latitude|G|ROG|TUF|VivoBook|ZenBook|AsusPro|Chromebook|Predator|Nitro|Swift|TravelMate|Extensa|Aspire|Spin|ConceptD|Blade|Stealth|Katana|Creator|Modern|Prestige|Megaport|Surface|Pixelbook|Chromebox|MacBook|Mac|iPad|Pro|Air|Studio|Book|Gram|Ultra|Chromebook|MateBook|MediaPad|Honor|MagicBook|RedmiBook|Mi)\b', re.IGNORECASE),
-            'diagonal': re.compile(r'(\d{1,2}(\.\d{1,2})?)["”\'’″]', re.IGNORECASE),
-            'cpu_line': re.compile(r'\b(Intel|AMD|Apple|Qualcomm|ARM|MediaTek|NVIDIA|Samsung|Snapdragon|Exynos|Kirin|Dimensity|Core|Celeron|Pentium|Xeon|Atom|Ryzen|Athlon|Turion|Sempron|Phenom|Opteron|EPYC|Threadripper|APU)\b', re.IGNORECASE),
-            'cpu_model': re.compile(r'\b([A-Z]\d{3,5}|i\d-\d{4,5}|R\d{3,5}U?|U\d{3,5}|H\d{3,5}|HX\d{3,5}|G\d{3,5}|M\d{3,5}|N\d{3,5}|Celeron|Pentium|Xeon|Atom|Athlon|Turion|Sempron|Phenom|Opteron|EPYC|Threadripper)\b', re.IGNORECASE),
-            'memory': re.compile(r'(\d{1,3})\s*(GB|ГБ|Гб|Gb|gb)', re.IGNORECASE),
-            'storage_type': re.compile(r'\b(SSD|HDD|eMMC|NVMe|SATA|M\.2)\b', re.IGNORECASE),
-            'storage_capacity': re.compile(r'(\d{1,4})\s*(GB|TB|ГБ|Гб|Gb|gb|ТБ|Тб|Tb|tb)', re.IGNORECASE),
-            'gpu_brand': re.compile(r'\b(NVIDIA|AMD|Intel|GeForce|RTX|GTX|Radeon|Iris|UHD|HD|Iris|Arc)\b', re.IGNORECASE),
-            'gpu_model': re.compile(r'\b(RTX|GTX|RTX\d{3,4}|GTX\d{3,4}|MX\d{3,4}|Quadro|Tesla|A\d{3,4}|R\d{3,4}|Radeon|Vega|Instinct|FirePro|FireGL|FireMV|FireStream|Stream|Pro|Mobility|Mobile|Discrete|Integrated|Graphics|GPU)\b', re.IGNORECASE),
-            'gpu_memory': re.compile(r'(\d{1,2})\s*(GB|ГБ|Гб|Gb|gb)', re.IGNORECASE),
-        }
+    def __init__(self, engine: str = 'tokens', memo=None, processes: int = 1,
+                 parallel_threshold: int = 5000, chunk_size: int = 1000):
+        if engine not in ('tokens', 'regex'):
+            raise ValueError(f"Неизвестный способ разбора названий: {engine!r}")
+        self.engine = engine
+        self.patterns = PATTERNS
+        self.tokenizer = TitleTokenizer()
+        # Кэш результатов по названию (DecompositionMemo); None - разбирать всегда заново
+        self.memo = memo
+        # Параллельный разбор: пачки от parallel_threshold новых названий делятся
+        # между processes рабочими процессами кусками не меньше chunk_size
+        self.processes = processes
+        self.parallel_threshold = parallel_threshold
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
         
         # Словарь для преобразования числовых обозначений в слова
         self.number_words = {
@@ -34,6 +270,63 @@ class LaptopDecomposer:
             '17': 'семнадцати'
         }
 
+    @classmethod
+    def from_settings(cls, settings) -> 'LaptopDecomposer':
+        """
+        Разборщик с кэшем и параллельным режимом по настройкам DECOMPOSITION_CACHE_* и DECOMPOSER_*.
+        """
+        return cls(
+            memo=DecompositionMemo.from_settings(settings, patterns_fingerprint()),
+            processes=settings.getint('DECOMPOSER_PROCESSES', 1) or multiprocessing.cpu_count(),
+            parallel_threshold=settings.getint('DECOMPOSER_PARALLEL_THRESHOLD', 5000),
+            chunk_size=settings.getint('DECOMPOSER_CHUNK_SIZE', 1000),
+        )
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: рабочий процесс не должен наследовать потоки и реактор бота
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+                logger.info(f"Запущен пул декомпозиции на {self.processes} процессов.")
+            return self._pool
+
+    def close(self) -> None:
+        """
+        Останавливает рабочие процессы параллельного режима.
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _extract_many(self, titles: List[str]) -> List[Dict[str, str]]:
+        """
+        Параметры для списка названий в том же порядке. Большие списки
+        разбираются в пуле процессов, маленькие - в текущем процессе:
+        на них запуск заданий и передача данных дороже самого разбора.
+        """
+        if self.processes <= 1 or len(titles) < self.parallel_threshold:
+            return [self.extract_fields(title) for title in titles]
+
+        # Не меньше chunk_size названий на задание, чтобы окупить передачу между
+        # процессами, но и не больше, чем нужно для ~4 заданий на процесс:
+        # так процессы, закончившие раньше, берут оставшиеся куски
+        chunk_size = max(self.chunk_size, math.ceil(len(titles) / (self.processes * 4)))
+        chunks = [titles[i:i + chunk_size] for i in range(0, len(titles), chunk_size)]
+        try:
+            started = time.time()
+            # map отдает результаты в порядке кусков, поэтому порядок не зависит от процессов
+            rows = [row for chunk_rows in self._get_pool().map(_decompose_chunk, repeat(self.engine), chunks)
+                    for row in chunk_rows]
+            logger.info(f"Параллельная декомпозиция {len(titles)} названий: {len(chunks)} кусков "
+                        f"на {self.processes} процессах за {time.time() - started:.2f} сек.")
+            return [dict(zip(TITLE_FIELDS, row)) for row in rows]
+        except (concurrent.futures.process.BrokenProcessPool, OSError) as e:
+            logger.error(f"Пул декомпозиции недоступен, разбираем в текущем процессе: {e}", exc_info=True)
+            self.close()
+            return [self.extract_fields(title) for title in titles]
+
     def extract_price_numeric(self, price_str) -> int:
         """
         Извлекает числовое значение цены из строки или числа.
@@ -119,6 +412,32 @@ class LaptopDecomposer:
         match = self.patterns['gpu_memory'].search(title)
         return match.group(1).strip() if match else ''
     
+    def extract_fields_regex(self, title: str) -> Dict[str, str]:
+        """
+        Извлекает параметры из названия регулярными выражениями, по одному поиску на параметр.
+        """
+        return {
+            'brand': self.extract_brand(title),
+            'series': self.extract_series(title),
+            'diagonal': self.extract_diagonal(title),
+            'cpu_line': self.extract_cpu_line(title),
+            'cpu_model': self.extract_cpu_model(title),
+            'memory': self.extract_memory(title),
+            'storage_type': self.extract_storage_type(title),
+            'storage_capacity': self.extract_storage_capacity(title),
+            'gpu_brand': self.extract_gpu_brand(title),
+            'gpu_model': self.extract_gpu_model(title),
+            'gpu_memory': self.extract_gpu_memory(title),
+        }
+    
+    def extract_fields(self, title: str) -> Dict[str, str]:
+        """
+        Извлекает параметры из названия выбранным способом, без кэша.
+        """
+        if self.engine == 'tokens':
+            return self.tokenizer.extract(title)
+        return self.extract_fields_regex(title)
+    
     def decompose_laptop(self, title: str, price_str: str = '') -> Dict[str, str]:
         """
         Декомпозиция названия ноутбука на отдельные параметры.
@@ -131,36 +450,73 @@ class LaptopDecomposer:
             Dict[str, str]: Словарь с параметрами ноутбука
         """
         # Извлекаем все параметры
-        brand = self.extract_brand(title)
-        series = self.extract_series(title)
-        diagonal = self.extract_diagonal(title)
-        cpu_line = self.extract_cpu_line(title)
-        cpu_model = self.extract_cpu_model(title)
-        memory = self.extract_memory(title)
-        storage_type = self.extract_storage_type(title)
-        storage_capacity = self.extract_storage_capacity(title)
-        gpu_brand = self.extract_gpu_brand(title)
-        gpu_model = self.extract_gpu_model(title)
-        gpu_memory = self.extract_gpu_memory(title)
+        fields = self.memo.lookup_many([title]).get(title) if self.memo is not None else None
+        if fields is None:
+            fields = self.extract_fields(title)
+            if self.memo is not None:
+                self.memo.store_many({title: fields})
         price_numeric = self.extract_price_numeric(price_str)
         
         # Возвращаем словарь с параметрами
         return {
             'full_title': title,
-            'brand': brand,
-            'series': series,
-            'diagonal': diagonal,
-            'cpu_line': cpu_line,
-            'cpu_model': cpu_model,
-            'memory': memory,
-            'storage_type': storage_type,
-            'storage_capacity': storage_capacity,
-            'gpu_brand': gpu_brand,
-            'gpu_model': gpu_model,
-            'gpu_memory': gpu_memory,
+            **fields,
             'price_numeric': str(price_numeric)
         }
     
+    def _fields_by_title(self, titles: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Параметры для каждого различного названия. Каждое название разбирается
+        один раз; с кэшем разбираются только названия, которых в нем нет,
+        и сохраняются одной пачкой.
+        """
+        fields_by_title = self.memo.lookup_many(titles) if self.memo is not None else {}
+        missing = list(dict.fromkeys(title for title in titles if title not in fields_by_title))
+        parsed = dict(zip(missing, self._extract_many(missing)))
+        if self.memo is not None:
+            self.memo.store_many(parsed)
+            stats = self.memo.stats()
+            logger.info(f"Декомпозиция {len(titles)} названий: из кэша {len(fields_by_title)}, "
+                        f"разобрано {len(parsed)}. Доля попаданий в кэш за все время: {stats['hit_rate']:.0%}.")
+        fields_by_title.update(parsed)
+        return fields_by_title
+    
+    def decompose_columns(self, titles: Sequence[str], prices: Optional[Sequence[Any]] = None) -> Dict[str, List[str]]:
+        """
+        Колоночная декомпозиция: принимает колонки названий и цен и возвращает
+        колонки параметров без промежуточного словаря на каждую строку.
+        
+        Args:
+            titles (Sequence[str]): Названия ноутбуков
+            prices (Optional[Sequence[Any]]): Цены в том же порядке (строки или числа)
+            
+        Returns:
+            Dict[str, List[str]]: Колонка -> значения (колонки DECOMPOSED_COLUMNS)
+        """
+        titles = list(titles)
+        fields_by_title = self._fields_by_title(titles)
+        rows = [fields_by_title[title] for title in titles]
+        
+        columns = {'full_title': titles}
+        for field in TITLE_FIELDS:
+            columns[field] = [row[field] for row in rows]
+        if prices is None:
+            columns['price_numeric'] = ['0'] * len(titles)
+        else:
+            columns['price_numeric'] = [str(self.extract_price_numeric(price)) for price in prices]
+        return columns
+    
+    def decompose_frame(self, frame, title_column: str = 'title', price_column: str = 'price'):
+        """
+        Декомпозиция таблицы pandas: к копии таблицы добавляются колонки параметров.
+        Требует установленного pandas.
+        """
+        if pd is None:
+            raise RuntimeError("Для decompose_frame нужен pandas; без него используйте decompose_columns.")
+        prices = frame[price_column] if price_column in frame else None
+        columns = self.decompose_columns(frame[title_column].fillna('').astype(str), prices)
+        return frame.assign(**{name: pd.Series(values, index=frame.index) for name, values in columns.items()})
+    
     def decompose_all_laptops(self, laptops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Декомпозиция списка ноутбуков.
@@ -171,21 +527,9 @@ class LaptopDecomposer:
         Returns:
             List[Dict[str, Any]]: Список ноутбуков с декомпозированными данными
         """
-        decomposed_laptops = []
-        
-        for laptop in laptops:
-            # Получаем название ноутбука и цену
-            title = laptop.get('title', '')
-            price_str = laptop.get('price', '')
-            
-            # Декомпозиция названия и цены
-            decomposed_data = self.decompose_laptop(title, price_str)
-            
-            # Объединяем исходные данные с декомпозированными
-            result = {**laptop, **decomposed_data}
-            decomposed_laptops.append(result)
-        
-        return decomposed_laptops
+        columns = self.decompose_columns([laptop.get('title', '') for laptop in laptops],
+                                         [laptop.get('price', '') for laptop in laptops])
+        return columns_to_records(columns, laptops)
     
     def test_decomposition(self):
         """
@@ -213,4 +557,17 @@ class LaptopDecomposer:
             for key, value in result.items():
                 if key != 'full_title':  # Не выводим полное название дважды
                     print(f"  {key}: {value}")
-            print("-" * 30)
\ No newline at end of file
+            print("-" * 30)
+
+
+def columns_to_records(columns: Dict[str, List[str]], laptops: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Переводит колонки LaptopDecomposer.decompose_columns в список словарей
+    (формат decompose_all_laptops). Если переданы исходные ноутбуки,
+    параметры объединяются с их данными.
+    """
+    names = list(columns)
+    rows = zip(*columns.values())
+    if laptops is None:
+        return [dict(zip(names, row)) for row in rows]
+    return [{**laptop, **dict(zip(names, row))} for laptop, row in zip(laptops, rows)]
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько ключей передавать в один запрос SELECT ... IN (...)
+LOOKUP_CHUNK_SIZE = 500
+
+
+def title_key(title: str) -> str:
+    """
+    Ключ названия в постоянном хранилище.
+    """
+    return hashlib.sha1(title.encode('utf-8')).hexdigest()
+
+
+class DecompositionMemo:
+    """
+    Кэш результатов декомпозиции названий: название -> параметры ноутбука.
+
+    Одни и те же предложения приходят при каждом обновлении отчета и в разных
+    запросах расширенного режима, а параметры зависят только от названия.
+    - Первый уровень - LRU в памяти на memory_size названий.
+    - Второй уровень - SQLite-файл (ключ - SHA-1 названия), переживает перезапуск
+      бота; в нем хранится не больше max_entries записей, лишние вытесняются
+      по времени последнего использования.
+    - Результаты действительны только для набора правил, с которым они получены:
+      fingerprint набора хранится в файле, и при его изменении файл очищается.
+    Поиск и запись выполняются пачками, одним запросом и одной транзакцией на пачку.
+    """
+    def __init__(self, path: Optional[str], fingerprint: str, memory_size: int = 20000, max_entries: int = 200000):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+
+        self._memory: 'OrderedDict[str, Dict[str, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0}
+
+    @classmethod
+    def from_settings(cls, settings, fingerprint: str) -> 'DecompositionMemo':
+        return cls(
+            settings.get('DECOMPOSITION_CACHE_FILE'),
+            fingerprint,
+            memory_size=settings.getint('DECOMPOSITION_CACHE_MEMORY_SIZE', 20000),
+            max_entries=settings.getint('DECOMPOSITION_CACHE_MAX_ENTRIES', 200000),
+        )
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """
+        Открывает файл кэша (под self._lock). Без пути кэш работает только в памяти.
+        """
+        if self._db is not None or not self.path:
+            return self._db
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS decompositions ("
+            "title_hash TEXT PRIMARY KEY, fields TEXT NOT NULL, used_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS decompositions_used_at ON decompositions (used_at)")
+        row = db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint:
+            with db:
+                deleted = db.execute("DELETE FROM decompositions").rowcount
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (self.fingerprint,))
+            if row is not None:
+                logger.info(f"Правила декомпозиции изменились, кэш {self.path} очищен ({deleted} записей).")
+        db.commit()
+        self._db = db
+        return db
+
+    def _remember(self, title: str, fields: Dict[str, str]) -> None:
+        self._memory[title] = fields
+        self._memory.move_to_end(title)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def lookup_many(self, titles: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Находит сохраненные параметры для названий. Возвращает только найденные.
+        """
+        found: Dict[str, Dict[str, str]] = {}
+        wanted: Dict[str, str] = {}
+        seen = set()
+        with self._lock:
+            for title in titles:
+                if title in seen:
+                    continue
+                seen.add(title)
+                fields = self._memory.get(title)
+                if fields is not None:
+                    self._memory.move_to_end(title)
+                    found[title] = fields
+                    self.counters['memory_hits'] += 1
+                else:
+                    wanted[title_key(title)] = title
+
+            if wanted:
+                try:
+                    self._lookup_persistent(wanted, found)
+                except Exception as e:
+                    logger.error(f"Ошибка при чтении кэша декомпозиции {self.path}: {e}", exc_info=True)
+                self.counters['misses'] += sum(1 for title in wanted.values() if title not in found)
+        return found
+
+    def _lookup_persistent(self, wanted: Dict[str, str], found: Dict[str, Dict[str, str]]) -> None:
+        db = self._connect()
+        if db is None:
+            return
+        keys = list(wanted)
+        hits = []
+        for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[i:i + LOOKUP_CHUNK_SIZE]
+            rows = db.execute(
+                f"SELECT title_hash, fields FROM decompositions WHERE title_hash IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for key, fields in rows:
+                title = wanted[key]
+                found[title] = json.loads(fields)
+                self._remember(title, found[title])
+                hits.append(key)
+        if hits:
+            self.counters['persistent_hits'] += len(hits)
+            now = time.time()
+            with db:
+                db.executemany("UPDATE decompositions SET used_at = ? WHERE title_hash = ?",
+                               [(now, key) for key in hits])
+
+    def store_many(self, entries: Dict[str, Dict[str, str]]) -> None:
+        """
+        Сохраняет параметры новых названий одной транзакцией.
+        """
+        if not entries:
+            return
+        with self._lock:
+            for title, fields in entries.items():
+                self._remember(title, fields)
+            try:
+                db = self._connect()
+                if db is None:
+                    return
+                now = time.time()
+                with db:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO decompositions (title_hash, fields, used_at) VALUES (?, ?, ?)",
+                        [(title_key(title), json.dumps(fields, ensure_ascii=False), now)
+                         for title, fields in entries.items()],
+                    )
+                    evicted = self._evict(db)
+                if evicted:
+                    logger.info(f"Из кэша декомпозиции вытеснено {evicted} давно не встречавшихся названий.")
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении кэша декомпозиции {self.path}: {e}", exc_info=True)
+
+    def _evict(self, db: sqlite3.Connection) -> int:
+        total = db.execute("SELECT COUNT(*) FROM decompositions").fetchone()[0]
+        if total <= self.max_entries:
+            return 0
+        return db.execute(
+            "DELETE FROM decompositions WHERE title_hash IN "
+            "(SELECT title_hash FROM decompositions ORDER BY used_at LIMIT ?)",
+            (total - self.max_entries,),
+        ).rowcount
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.counters)
+        hits = stats['memory_hits'] + stats['persistent_hits']
+        total = hits + stats['misses']
+        stats['hit_rate'] = hits / total if total else 0.0
+        return stats
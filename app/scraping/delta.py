@@ -0,0 +1,60 @@
+import logging
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def offer_key(link: str) -> str:
+    """
+    Ключ предложения для сравнения со снимком: путь ссылки и, если есть, sku.
+    Остальные параметры ссылки меняются от запуска к запуску и в ключ не входят.
+    """
+    parsed = urlparse(link)
+    sku = parse_qs(parsed.query).get('sku')
+    return f"{parsed.path}?sku={sku[0]}" if sku else parsed.path
+
+
+class PriceSnapshot:
+    """
+    Последний известный снимок цен: ключ предложения -> цена.
+    Используется инкрементальным обходом, чтобы отдавать только новые
+    и изменившиеся предложения.
+    """
+    def __init__(self, prices: Optional[Dict[str, int]] = None):
+        self.prices = prices or {}
+
+    @classmethod
+    def from_database(cls) -> 'PriceSnapshot':
+        """
+        Загружает снимок из таблицы products (последние сохраненные цены).
+        """
+        from ..database.database import init_db, SessionLocal
+        from ..database.models import Product
+
+        init_db()
+        db = SessionLocal()
+        try:
+            prices = {offer_key(url): int(price) for url, price in db.query(Product.url, Product.price)}
+            logger.info(f"Загружен снимок цен: {len(prices)} предложений.")
+            return cls(prices)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке снимка цен из базы данных: {e}", exc_info=True)
+            return cls()
+        finally:
+            db.close()
+
+    def compare(self, link: str, price) -> str:
+        """
+        Сравнивает предложение со снимком и запоминает новую цену.
+
+        Returns:
+            str: 'new', 'changed' или 'unchanged'.
+        """
+        key = offer_key(link)
+        price = int(price or 0)
+        known_price = self.prices.get(key)
+        self.prices[key] = price
+        if known_price is None:
+            return 'new'
+        return 'unchanged' if known_price == price else 'changed'
@@ -8,12 +8,16 @@ class ProductItem(scrapy.Item):
     price = scrapy.Field()
     link = scrapy.Field()
     source = scrapy.Field()
+    # Поисковый запрос, по которому найден товар (мульти-запросный режим)
+    query = scrapy.Field()
 
 class BrandItem(scrapy.Item):
     """
     Элемент данных для хранения названия бренда.
     """
     brand = scrapy.Field()
+    # ID значения в фильтре "Производитель" (из data-auto="filter-list-item-<id>")
+    brand_id = scrapy.Field()
 
 class FilterInfoItem(scrapy.Item):
     """
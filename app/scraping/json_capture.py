@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# URL запросов страницы, ответы которых содержат данные о товарах и фильтрах
+DEFAULT_CAPTURE_PATTERNS = [
+    r'/api/resolve/',
+    r'/api/render-lazy',
+    r'/api/.*search',
+]
+
+MARKET_BASE_URL = "https://market.yandex.ru"
+
+# Карточки результатов поиска в DOM
+PRODUCT_CARD_SELECTOR = "article[data-auto='searchOrganic']"
+
+
+async def start_json_capture(page, request) -> None:
+    """
+    Callback инициализации страницы (playwright_page_init_callback).
+
+    Подписывается на сетевые ответы страницы и складывает разобранный JSON
+    подходящих ответов в request.meta['captured_json'] еще до загрузки страницы.
+    Незавершенные чтения тел ответов сохраняются в request.meta['json_capture_tasks'].
+    """
+    patterns = [re.compile(pattern) for pattern in request.meta.get('json_capture_patterns', DEFAULT_CAPTURE_PATTERNS)]
+    payloads = request.meta.setdefault('captured_json', [])
+    tasks = request.meta.setdefault('json_capture_tasks', [])
+
+    async def read_payload(response) -> None:
+        try:
+            payloads.append(await response.json())
+        except Exception as e:
+            logger.debug(f"Не удалось разобрать JSON из {response.url}: {e}")
+
+    def on_response(response) -> None:
+        if not any(pattern.search(response.url) for pattern in patterns):
+            return
+        if 'json' not in response.headers.get('content-type', ''):
+            return
+        tasks.append(asyncio.ensure_future(read_payload(response)))
+
+    page.on("response", on_response)
+
+
+async def wait_for_product_cards(page, selector: str = PRODUCT_CARD_SELECTOR, timeout: float = 5000) -> bool:
+    """
+    Метод страницы для playwright_page_methods в режиме перехвата JSON:
+    ждет карточки товаров не дольше timeout мс и не прерывает загрузку, если их нет.
+    Так запасной разбор DOM получает отрисованные карточки, а страницы,
+    данные которых пришли только в JSON, не падают по таймауту.
+    """
+    try:
+        await page.wait_for_selector(selector, timeout=timeout)
+        return True
+    except Exception as e:
+        logger.debug(f"Карточки товаров не появились за {timeout} мс на {page.url}: {e}")
+        return False
+
+
+async def collect_captured_json(response) -> List[Any]:
+    """
+    Возвращает JSON-ответы, перехваченные при загрузке страницы,
+    дождавшись чтения тех, что еще не дочитаны.
+    """
+    tasks = response.meta.pop('json_capture_tasks', [])
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return response.meta.pop('captured_json', [])
+
+
+def _walk(node: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Обходит вложенную JSON-структуру в ширину и отдает все словари
+    в порядке следования в документе.
+    """
+    queue = deque([node])
+    while queue:
+        current = queue.popleft()
+        if isinstance(current, dict):
+            yield current
+            queue.extend(current.values())
+        elif isinstance(current, list):
+            queue.extend(current)
+
+
+def _get_title(entity: Dict[str, Any]) -> Optional[str]:
+    titles = entity.get('titles')
+    if isinstance(titles, dict) and isinstance(titles.get('raw'), str) and titles['raw'].strip():
+        return titles['raw']
+    return None
+
+
+def _get_price(entity: Dict[str, Any]) -> Optional[str]:
+    price = entity.get('prices')
+    if isinstance(price, dict):
+        price = price.get('value', price.get('min'))
+    if isinstance(price, bool):
+        return None
+    if isinstance(price, (int, float)) or (isinstance(price, str) and price.isdigit()):
+        return str(int(price))
+    return None
+
+
+def _is_result_list(node: Any) -> bool:
+    """
+    Список результатов поиска: непустой список, каждый элемент которого -
+    сущность товара с titles.raw и prices. Одиночные словари с названием и ценой
+    (реклама, блоки похожих товаров, хлебные крошки) так не попадают в выдачу.
+    """
+    return (isinstance(node, list) and bool(node)
+            and all(isinstance(entity, dict) and _get_title(entity) and _get_price(entity) for entity in node))
+
+
+def _result_lists(payloads: List[Any]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Обходит JSON-ответы в ширину и отдает списки результатов, не заходя внутрь них.
+    """
+    queue = deque([payloads])
+    while queue:
+        current = queue.popleft()
+        if _is_result_list(current):
+            yield current
+        elif isinstance(current, dict):
+            queue.extend(current.values())
+        elif isinstance(current, list):
+            queue.extend(current)
+
+
+def _get_link(entity: Dict[str, Any]) -> Optional[str]:
+    urls = entity.get('urls')
+    if isinstance(urls, dict) and isinstance(urls.get('direct'), str):
+        link = urls['direct']
+    elif isinstance(entity.get('url'), str):
+        link = entity['url']
+    elif entity.get('slug') and entity.get('id'):
+        link = f"/product--{entity['slug']}/{entity['id']}"
+    else:
+        return None
+    return MARKET_BASE_URL + link if link.startswith('/') else link
+
+
+def extract_products_from_json(payloads: List[Any]) -> List[Dict[str, str]]:
+    """
+    Находит в JSON-ответах списки результатов (см. _is_result_list) и приводит
+    их товары к полям ProductItem: title, price, link, сохраняя порядок выдачи.
+    """
+    products = []
+    seen = set()
+    for entity in (entity for result_list in _result_lists(payloads) for entity in result_list):
+        title = _get_title(entity)
+        price = _get_price(entity)
+        link = _get_link(entity) or 'N/A'
+        key = (title, link)
+        if key in seen:
+            continue
+        seen.add(key)
+        products.append({'title': title.strip(), 'price': price, 'link': link})
+    return products
+
+
+def extract_filters_from_json(payloads: List[Any]) -> List[Dict[str, str]]:
+    """
+    Находит в JSON-ответах описания фильтров и приводит их к полям
+    FilterInfoItem: filter_id, filter_name, filter_type.
+    """
+    filters = {}
+    for entity in _walk(payloads):
+        filter_id = entity.get('filterId') or (entity.get('id') if 'values' in entity else None)
+        filter_name = entity.get('filterName') or entity.get('name')
+        filter_type = entity.get('filterType') or entity.get('type')
+        if not (filter_id and isinstance(filter_name, str) and isinstance(filter_type, str)):
+            continue
+        filters.setdefault(str(filter_id), {
+            'filter_id': str(filter_id),
+            'filter_name': filter_name,
+            'filter_type': filter_type,
+        })
+    return list(filters.values())
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд ждать ответа страницы при проверке ее работоспособности
+HEALTH_CHECK_TIMEOUT = 5
+# Сколько миллисекунд ждать появления кнопки согласия при прогреве
+CONSENT_TIMEOUT_MS = 3000
+# Служебный ключ meta: страница, выданная пулом (playwright_page может быть
+# заменен scrapy-playwright, если страница пула закрылась во время запроса)
+POOLED_PAGE_META_KEY = '_page_pool_page'
+
+
+class PlaywrightPagePool:
+    """
+    Пул заранее созданных и прогретых страниц Playwright.
+
+    Все страницы живут в одном контексте браузера: при прогреве открывается
+    стартовая страница, закрывается диалог согласия, и полученные cookies
+    достаются всем страницам пула. Страницы выдаются на запрос и возвращаются
+    после него; упавшие и зависшие страницы заменяются новыми.
+    """
+    def __init__(self, size: int, browser_type: str = 'chromium', cdp_url: Optional[str] = None,
+                 launch_options: Optional[Dict[str, Any]] = None, context_kwargs: Optional[Dict[str, Any]] = None,
+                 warmup_url: Optional[str] = None, consent_selectors: Optional[List[str]] = None):
+        self.size = size
+        self.browser_type = browser_type
+        self.cdp_url = cdp_url
+        self.launch_options = launch_options or {}
+        self.context_kwargs = context_kwargs or {}
+        self.warmup_url = warmup_url
+        self.consent_selectors = consent_selectors or []
+
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._idle = asyncio.Queue()
+        self._pages = set()
+        self._crashed = set()
+        # Пул готов выдавать страницы: False до запуска и после неудачного запуска
+        self.ready = False
+        self.stats = {'created': 0, 'acquired': 0, 'recycled': 0, 'acquire_timeouts': 0}
+
+    async def start(self) -> None:
+        """
+        Запускает пул. Если подключиться к браузеру или создать страницы не удалось,
+        пул остается выключенным (ready=False), а запросы получают собственные
+        страницы scrapy-playwright.
+        """
+        try:
+            await self._start()
+        except Exception as e:
+            logger.error(f"Не удалось запустить пул страниц Playwright, работаем без него: {e}", exc_info=True)
+            await self.close()
+            return
+        self.ready = True
+
+    async def _start(self) -> None:
+        """
+        Подключается к браузеру, прогревает контекст и создает страницы пула.
+        """
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        browser_type = getattr(self._playwright, self.browser_type)
+        if self.cdp_url:
+            self._browser = await browser_type.connect_over_cdp(self.cdp_url)
+        else:
+            self._browser = await browser_type.launch(**self.launch_options)
+        self._context = await self._browser.new_context(**self.context_kwargs)
+
+        if self.warmup_url:
+            await self._warm_up()
+
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._new_page())
+        logger.info(f"Пул страниц Playwright готов: {self.size} страниц.")
+
+    async def _warm_up(self) -> None:
+        """
+        Открывает стартовую страницу и закрывает диалог согласия, чтобы cookies
+        попали в общий контекст до первого настоящего запроса.
+        """
+        page = await self._context.new_page()
+        try:
+            await page.goto(self.warmup_url)
+            for selector in self.consent_selectors:
+                try:
+                    await page.click(selector, timeout=CONSENT_TIMEOUT_MS)
+                    logger.info(f"Диалог согласия закрыт кнопкой '{selector}'.")
+                    break
+                except Exception:
+                    continue
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть контекст на {self.warmup_url}: {e}")
+        finally:
+            await page.close()
+
+    async def _new_page(self):
+        page = await self._context.new_page()
+        page.on("crash", lambda crashed_page: self._crashed.add(crashed_page))
+        self._pages.add(page)
+        self.stats['created'] += 1
+        return page
+
+    async def _is_healthy(self, page) -> bool:
+        if page.is_closed() or page in self._crashed:
+            return False
+        try:
+            await asyncio.wait_for(page.evaluate("1"), timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def _recycle(self, page):
+        """
+        Закрывает неисправную страницу и создает вместо нее новую.
+        """
+        self._pages.discard(page)
+        self._crashed.discard(page)
+        self.stats['recycled'] += 1
+        if not page.is_closed():
+            try:
+                await page.close()
+            except Exception:
+                pass
+        return await self._new_page()
+
+    def owns(self, page) -> bool:
+        return page in self._pages
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """
+        Выдает исправную страницу из пула, ожидая освобождения, если все заняты.
+        Если за timeout секунд страница не освободилась, выбрасывает asyncio.TimeoutError.
+        """
+        try:
+            page = await asyncio.wait_for(self._idle.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.stats['acquire_timeouts'] += 1
+            raise
+        if not await self._is_healthy(page):
+            logger.warning("Страница пула не отвечает, заменяем ее новой.")
+            page = await self._recycle(page)
+        self.stats['acquired'] += 1
+        return page
+
+    async def release(self, page) -> None:
+        """
+        Возвращает страницу в пул. Упавшая или закрытая страница заменяется новой.
+        """
+        if not self.owns(page):
+            return
+        if page.is_closed() or page in self._crashed:
+            try:
+                page = await self._recycle(page)
+            except Exception as e:
+                logger.error(f"Не удалось заменить страницу пула: {e}")
+                return
+        else:
+            # Слушатели ответов (перехват JSON) относятся к прошлому запросу
+            page.remove_all_listeners("response")
+        self._idle.put_nowait(page)
+
+    async def close(self) -> None:
+        self.ready = False
+        for resource, method in ((self._context, 'close'), (self._browser, 'close'), (self._playwright, 'stop')):
+            if resource is None:
+                continue
+            try:
+                await getattr(resource, method)()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии пула страниц Playwright: {e}")
+        self._context = self._browser = self._playwright = None
+        logger.info(f"Пул страниц Playwright закрыт. Статистика: {self.stats}")
+
+
+async def _close_page(page) -> None:
+    if page is not None and not page.is_closed():
+        try:
+            await page.close()
+        except Exception:
+            pass
+
+
+async def release_page(spider, page, meta: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Возвращает страницу в пул паука или закрывает ее, если пул не используется.
+    Пауки вызывают эту функцию вместо page.close() для страниц из playwright_include_page
+    и передают meta запроса: если страница пула закрылась во время запроса,
+    в playwright_page лежит новая страница scrapy-playwright - она закрывается,
+    а в пул возвращается (и там заменяется) выданная им страница.
+    """
+    pool = getattr(spider, 'page_pool', None)
+    pooled_page = meta.pop(POOLED_PAGE_META_KEY, None) if meta is not None else None
+    if pooled_page is not None and pooled_page is not page:
+        await _close_page(page)
+        page = pooled_page
+    if pool is not None and pool.owns(page):
+        await pool.release(page)
+    else:
+        await _close_page(page)
+
+
+class PlaywrightPagePoolMiddleware:
+    """
+    Downloader middleware, подставляющий страницы из пула в запросы Playwright.
+
+    Если паук сам запросил страницу (playwright_include_page), он возвращает ее
+    через release_page(). Иначе страница возвращается в пул сразу после загрузки.
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        context_kwargs = {
+            'viewport': settings.getdict('PLAYWRIGHT_PAGE_POOL_VIEWPORT') or None,
+            'user_agent': settings.getdict('DEFAULT_REQUEST_HEADERS').get('User-Agent'),
+        }
+        self.pool = PlaywrightPagePool(
+            size=settings.getint('PLAYWRIGHT_PAGE_POOL_SIZE', 4),
+            browser_type=settings.get('PLAYWRIGHT_BROWSER_TYPE', 'chromium'),
+            cdp_url=settings.get('PLAYWRIGHT_CDP_URL'),
+            launch_options=settings.getdict('PLAYWRIGHT_LAUNCH_OPTIONS'),
+            context_kwargs={k: v for k, v in context_kwargs.items() if v},
+            warmup_url=settings.get('PLAYWRIGHT_PAGE_POOL_WARMUP_URL'),
+            consent_selectors=settings.getlist('PLAYWRIGHT_PAGE_POOL_CONSENT_SELECTORS'),
+        )
+        self.acquire_timeout = settings.getfloat('PLAYWRIGHT_PAGE_POOL_ACQUIRE_TIMEOUT', 30)
+        self.stats = crawler.stats
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PLAYWRIGHT_PAGE_POOL_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        spider.page_pool = self.pool
+        return deferred_from_coro(self.pool.start())
+
+    def spider_closed(self, spider):
+        for key, value in self.pool.stats.items():
+            self.stats.set_value(f'page_pool/{key}', value)
+        return deferred_from_coro(self.pool.close())
+
+    async def process_request(self, request, spider):
+        if not request.meta.get('playwright') or request.meta.get('playwright_page') is not None:
+            return None
+        if not self.pool.ready:
+            # Пул не запустился: страницу создаст сам scrapy-playwright
+            return None
+        try:
+            page = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Свободная страница пула не появилась за {self.acquire_timeout} с, "
+                           f"{request.url} загрузится на отдельной странице.")
+            return None
+        except Exception as e:
+            logger.warning(f"Не удалось получить страницу из пула ({e}), "
+                           f"{request.url} загрузится на отдельной странице.")
+            return None
+        request.meta['playwright_page'] = page
+        request.meta[POOLED_PAGE_META_KEY] = page
+        # Без playwright_include_page обработчик закрыл бы страницу после загрузки
+        request.meta['page_pool_release_on_response'] = not request.meta.get('playwright_include_page')
+        request.meta['playwright_include_page'] = True
+        return None
+
+    async def process_response(self, request, response, spider):
+        await self._release_if_owned(request)
+        return response
+
+    async def process_exception(self, request, exception, spider):
+        await self._release_if_owned(request)
+        return None
+
+    async def _release_if_owned(self, request) -> None:
+        if request.meta.pop('page_pool_release_on_response', False):
+            page = request.meta.pop('playwright_page', None)
+            request.meta['playwright_include_page'] = False
+            pooled_page = request.meta.pop(POOLED_PAGE_META_KEY, None)
+            if pooled_page is not None and pooled_page is not page:
+                # Страница пула закрылась во время запроса, и scrapy-playwright открыл новую
+                await _close_page(page)
+            if pooled_page is not None:
+                await self.pool.release(pooled_page)
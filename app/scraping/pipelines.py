@@ -25,10 +25,11 @@ class SaveToCsvPipeline:
         self.search_writer = csv.writer(self.search_file)
         self.search_writer.writerow(['title', 'price', 'link'])
 
-        # Файл для брендов
-        self.brands_file = open(os.path.join(self.dictionaries_dir, 'brands.csv'), 'w', newline='', encoding='utf-8')
-        self.brands_writer = csv.writer(self.brands_file)
-        self.brands_writer.writerow(['brand'])
+        # Файл для брендов открывается только при первом бренде: словарь нужен
+        # QueryPlanner и не должен стираться обходами, которые брендов не собирают
+        self.brands_path = spider.settings.get('BRANDS_FILE') or os.path.join(self.dictionaries_dir, 'brands.csv')
+        self.brands_file = None
+        self.brands_writer = None
 
     def close_spider(self, spider):
         """
@@ -37,7 +38,8 @@ class SaveToCsvPipeline:
         """
         self.catalog_file.close()
         self.search_file.close()
-        self.brands_file.close()
+        if self.brands_file is not None:
+            self.brands_file.close()
 
     async def process_item(self, item, spider):
         """
@@ -52,6 +54,10 @@ class SaveToCsvPipeline:
             elif source == 'search':
                 self.search_writer.writerow(line)
         elif isinstance(item, BrandItem):
-            self.brands_writer.writerow([item.get('brand')])
+            if self.brands_writer is None:
+                self.brands_file = open(self.brands_path, 'w', newline='', encoding='utf-8')
+                self.brands_writer = csv.writer(self.brands_file)
+                self.brands_writer.writerow(['brand', 'brand_id'])
+            self.brands_writer.writerow([item.get('brand'), item.get('brand_id')])
         
         return item
\ No newline at end of file
@@ -0,0 +1,133 @@
+import csv
+import logging
+import os
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# Категория "Ноутбуки" на Яндекс.Маркете
+LAPTOPS_HID = 91013
+SEARCH_URL = "https://market.yandex.ru/search"
+
+# Названия фильтров в filters_ID.csv, которым соответствуют поля цели наблюдения
+TARGET_FILTER_NAMES = {
+    'brand': ['Производитель', 'Бренд'],
+    'diagonal': ['Диагональ экрана', 'Диагональ экрана (дюйм)', 'Диагональ'],
+}
+
+# Порядок, в котором поля цели попадают в текст запроса, если их нельзя выразить фильтром
+TEXT_FIELDS = ['brand', 'series', 'cpu', 'gpu', 'diagonal']
+
+
+class FilterDictionary:
+    """
+    Словари Маркета, собранные пауками: карта фильтров (StructureSpider,
+    filters_ID.csv) и значения фильтра "Производитель" (FilterSpider, brands.csv).
+    """
+    def __init__(self, filters: Optional[List[Dict[str, str]]] = None, brands: Optional[Dict[str, str]] = None):
+        self.filters = filters or []
+        # Название бренда в нижнем регистре -> ID значения фильтра
+        self.brands = {name.lower(): brand_id for name, brand_id in (brands or {}).items() if brand_id}
+
+    @classmethod
+    def from_files(cls, filters_path: str, brands_path: str) -> 'FilterDictionary':
+        filters = cls._read_csv(filters_path)
+        brands = {row.get('brand', ''): row.get('brand_id', '') for row in cls._read_csv(brands_path)}
+        logger.info(f"Загружены словари: {len(filters)} фильтров, {len(brands)} брендов.")
+        return cls(filters, brands)
+
+    @staticmethod
+    def _read_csv(path: str) -> List[Dict[str, str]]:
+        if not path or not os.path.exists(path):
+            logger.warning(f"Словарь {path} не найден, соответствующие параметры уйдут в текст запроса.")
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                return list(csv.DictReader(f))
+        except Exception as e:
+            logger.error(f"Ошибка при чтении словаря {path}: {e}", exc_info=True)
+            return []
+
+    def find_filter(self, names: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Находит фильтр по одному из возможных названий (без учета регистра).
+        """
+        wanted = {name.lower() for name in names}
+        for filter_data in self.filters:
+            if filter_data.get('filter_name', '').strip().lower() in wanted:
+                return filter_data
+        return None
+
+    def brand_id(self, brand: str) -> Optional[str]:
+        return self.brands.get(brand.strip().lower())
+
+
+class QueryPlanner:
+    """
+    Превращает цель наблюдения в URL поиска Маркета с фильтрами на стороне сайта.
+
+    Цель - словарь с полями brand, series, cpu, gpu, diagonal, например
+    {'brand': 'Lenovo', 'series': 'ThinkBook 16', 'cpu': 'Ryzen AI 9 365', 'gpu': 'RTX 5060'}.
+    Бренд и диагональ, если они есть в словарях, превращаются в параметры glfilter;
+    все, что выразить фильтром нельзя, уходит в text=. Так сайт сам отбирает
+    подходящие товары, и обход проходит только по их страницам.
+    """
+    def __init__(self, dictionary: FilterDictionary, hid: int = LAPTOPS_HID):
+        self.dictionary = dictionary
+        self.hid = hid
+
+    @classmethod
+    def from_settings(cls, settings) -> 'QueryPlanner':
+        return cls(FilterDictionary.from_files(
+            settings.get('FILTERS_ID_FILE'),
+            settings.get('BRANDS_FILE'),
+        ))
+
+    def glfilters(self, target: Dict[str, str]) -> Dict[str, str]:
+        """
+        Возвращает поля цели, выраженные фильтрами: поле -> значение glfilter.
+        """
+        glfilters = {}
+
+        brand = target.get('brand')
+        brand_filter = self.dictionary.find_filter(TARGET_FILTER_NAMES['brand'])
+        if brand and brand_filter:
+            brand_id = self.dictionary.brand_id(brand)
+            if brand_id:
+                glfilters['brand'] = f"{brand_filter['filter_id']}:{brand_id}"
+
+        diagonal = target.get('diagonal')
+        diagonal_filter = self.dictionary.find_filter(TARGET_FILTER_NAMES['diagonal'])
+        if diagonal and diagonal_filter:
+            try:
+                size = float(str(diagonal).replace(',', '.'))
+            except ValueError:
+                size = None
+            if size is not None:
+                # Диагональ - числовой фильтр, задается диапазоном "от~до"
+                glfilters['diagonal'] = f"{diagonal_filter['filter_id']}:{size:g}~{size + 0.9:g}"
+
+        return glfilters
+
+    def plan(self, target: Dict[str, str]) -> str:
+        """
+        Строит URL поиска для цели наблюдения.
+        """
+        glfilters = self.glfilters(target)
+        text = ' '.join(str(target[field]) for field in TEXT_FIELDS
+                        if target.get(field) and field not in glfilters)
+
+        params = [('hid', self.hid)]
+        if text:
+            params.append(('text', text))
+        params.extend(('glfilter', value) for value in glfilters.values())
+        url = f"{SEARCH_URL}?{urlencode(params)}"
+        logger.info(f"План запроса для {target}: фильтры {list(glfilters)}, текст '{text}' -> {url}")
+        return url
+
+    def plan_all(self, targets: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """
+        Строит URL для набора целей: название цели -> URL.
+        """
+        return {label: self.plan(target) for label, target in targets.items()}
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Optional, Set
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+
+class DomainRate:
+    """
+    Текущий темп обхода одного сайта: задержка между запросами и число
+    параллельных запросов на весь сайт, плюс счетчики текущего окна.
+    Если запросы к сайту идут через несколько download slot (мульти-запросный
+    обход), бюджет делится между ними (см. AdaptiveRateController.apply).
+    """
+    def __init__(self, delay: float, concurrency: int):
+        self.delay = delay
+        self.concurrency = concurrency
+        # Номер "эпохи" темпа: растет при каждом замедлении. Ответы на запросы,
+        # отправленные до замедления, повторно темп не снижают
+        self.epoch = 0
+        self.reset_window()
+
+    def reset_window(self) -> None:
+        self.responses = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.concurrency / self.delay if self.delay else float(self.concurrency)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'delay': round(self.delay, 3),
+            'concurrency': self.concurrency,
+            'safe_rate': round(self.requests_per_second, 3),
+            'updated_at': int(time.time()),
+        }
+
+
+class AdaptiveRateController:
+    """
+    Расширение Scrapy: подбирает темп обхода по обратной связи от сайта (AIMD).
+
+    Каждые RATE_CONTROL_WINDOW ответов темп сайта пересматривается:
+    - окно без ошибок и с приемлемой задержкой - аддитивное ускорение:
+      сначала +1 параллельный запрос, на максимуме - уменьшение задержки;
+    - капча, редирект на капчу, 403/429 - немедленное мультипликативное
+      замедление, не дожидаясь конца окна;
+    - доля 5xx выше RATE_CONTROL_MAX_ERROR_RATE или слишком медленные ответы -
+      мультипликативное замедление в конце окна.
+    Найденный безопасный темп сохраняется в RATE_CONTROL_STATE_FILE и служит
+    отправной точкой для следующего обхода. Пока расширение включено,
+    AutoThrottle не меняет задержку (autothrottle_dont_adjust_delay).
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_delay = settings.getfloat('RATE_CONTROL_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('RATE_CONTROL_MAX_DELAY', 30.0)
+        self.start_delay = settings.getfloat('RATE_CONTROL_START_DELAY', settings.getfloat('DOWNLOAD_DELAY'))
+        self.max_concurrency = settings.getint('RATE_CONTROL_MAX_CONCURRENCY', 8)
+        self.delay_step = settings.getfloat('RATE_CONTROL_DELAY_STEP', 0.25)
+        self.backoff_factor = settings.getfloat('RATE_CONTROL_BACKOFF_FACTOR', 0.5)
+        self.window = settings.getint('RATE_CONTROL_WINDOW', 10)
+        self.max_error_rate = settings.getfloat('RATE_CONTROL_MAX_ERROR_RATE', 0.1)
+        self.max_latency = settings.getfloat('RATE_CONTROL_MAX_LATENCY', 10.0)
+        self.block_http_codes = {int(code) for code in settings.getlist('RATE_CONTROL_BLOCK_HTTP_CODES', [403, 429])}
+        self.captcha_patterns = [re.compile(pattern, re.IGNORECASE)
+                                 for pattern in settings.getlist('RATE_CONTROL_CAPTCHA_PATTERNS', ['showcaptcha'])]
+        self.state_file = settings.get('RATE_CONTROL_STATE_FILE')
+
+        self.rates: Dict[str, DomainRate] = {}
+        # Слоты каждого сайта, через которые шли запросы этого обхода
+        self.domain_slots: Dict[str, Set[str]] = {}
+        self.saved_state = self.load_state()
+
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('RATE_CONTROL_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def load_state(self) -> Dict[str, Dict[str, float]]:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке состояния темпа {self.state_file}: {e}", exc_info=True)
+            return {}
+
+    def save_state(self) -> None:
+        if not self.state_file:
+            return
+        state = dict(self.saved_state)
+        state.update({domain: rate.to_dict() for domain, rate in self.rates.items()})
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+            tmp_path = f"{self.state_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния темпа {self.state_file}: {e}", exc_info=True)
+
+    @staticmethod
+    def domain_of(slot_key: str) -> str:
+        # У мульти-запросного обхода слоты вида market.yandex.ru#<запрос>:
+        # темп общий для всего сайта
+        return slot_key.split('#', 1)[0]
+
+    def get_rate(self, domain: str) -> DomainRate:
+        rate = self.rates.get(domain)
+        if rate is None:
+            saved = self.saved_state.get(domain, {})
+            delay = min(max(saved.get('delay', self.start_delay), self.min_delay), self.max_delay)
+            concurrency = min(max(int(saved.get('concurrency', 1)), 1), self.max_concurrency)
+            rate = self.rates[domain] = DomainRate(delay, concurrency)
+            if saved:
+                logger.info(f"Темп для {domain} восстановлен: задержка {delay:.2f} с, "
+                            f"{concurrency} параллельных запросов.")
+        return rate
+
+    def request_reached_downloader(self, request, spider):
+        request.meta['autothrottle_dont_adjust_delay'] = True
+        slot_key = request.meta.get('download_slot')
+        if slot_key is not None:
+            domain = self.domain_of(slot_key)
+            rate = self.get_rate(domain)
+            request.meta['rate_control_epoch'] = rate.epoch
+            self.domain_slots.setdefault(domain, set()).add(slot_key)
+            self.apply(domain, rate, current_slot=slot_key)
+
+    def apply(self, domain: str, rate: DomainRate, current_slot: Optional[str] = None) -> None:
+        """
+        Делит темп сайта между его активными слотами: каждый получает
+        concurrency // n параллельных запросов и задержку delay * n,
+        так что суммарная нагрузка на сайт остается в пределах бюджета.
+        Слот текущего запроса считается активным, даже если Scrapy его еще не создал.
+        """
+        downloader_slots = self.crawler.engine.downloader.slots
+        active = [key for key in self.domain_slots.get(domain, ())
+                  if key == current_slot or key in downloader_slots]
+        slots_count = max(1, len(active))
+        for key in active:
+            slot = downloader_slots.get(key)
+            if slot is not None:
+                slot.delay = rate.delay * slots_count
+                slot.concurrency = max(1, rate.concurrency // slots_count)
+
+    def is_blocked(self, request, response) -> bool:
+        if response.status in self.block_http_codes:
+            return True
+        urls = [response.url] + list(request.meta.get('redirect_urls', []))
+        return any(pattern.search(url) for pattern in self.captcha_patterns for url in urls)
+
+    def response_downloaded(self, response, request, spider):
+        slot_key = request.meta.get('download_slot')
+        if slot_key is None:
+            return
+        domain = self.domain_of(slot_key)
+        rate = self.get_rate(domain)
+
+        if self.is_blocked(request, response):
+            self.stats.inc_value('rate_control/blocked_responses')
+            if request.meta.get('rate_control_epoch', rate.epoch) == rate.epoch:
+                self.back_off(domain, rate, reason=f"признаки блокировки ({response.status}, {response.url})")
+            return
+
+        rate.responses += 1
+        rate.latency_sum += request.meta.get('download_latency', 0.0)
+        if response.status >= 500:
+            rate.errors += 1
+        if rate.responses < self.window:
+            return
+
+        error_rate = rate.errors / rate.responses
+        mean_latency = rate.latency_sum / rate.responses
+        if error_rate > self.max_error_rate:
+            self.back_off(domain, rate, reason=f"доля ошибок {error_rate:.0%}")
+        elif mean_latency > self.max_latency:
+            self.back_off(domain, rate, reason=f"средняя задержка ответа {mean_latency:.1f} с")
+        else:
+            self.speed_up(domain, rate)
+
+    def back_off(self, domain: str, rate: DomainRate, reason: str) -> None:
+        """
+        Мультипликативное замедление: меньше параллельных запросов и больше задержка.
+        """
+        rate.concurrency = max(1, int(rate.concurrency * self.backoff_factor))
+        rate.delay = min(self.max_delay, max(rate.delay, self.min_delay) / self.backoff_factor)
+        rate.epoch += 1
+        rate.reset_window()
+        self.stats.inc_value('rate_control/backoffs')
+        self.update_metrics(domain, rate)
+        logger.warning(f"Замедляем обход {domain}: {reason}. Задержка {rate.delay:.2f} с, "
+                       f"{rate.concurrency} параллельных запросов.")
+
+    def speed_up(self, domain: str, rate: DomainRate) -> None:
+        """
+        Аддитивное ускорение после окна без проблем.
+        """
+        if rate.concurrency < self.max_concurrency:
+            rate.concurrency += 1
+        else:
+            rate.delay = max(self.min_delay, rate.delay - self.delay_step)
+        rate.reset_window()
+        self.stats.inc_value('rate_control/increases')
+        self.update_metrics(domain, rate)
+
+    def update_metrics(self, domain: str, rate: DomainRate) -> None:
+        self.stats.set_value(f'rate_control/{domain}/delay', round(rate.delay, 3))
+        self.stats.set_value(f'rate_control/{domain}/concurrency', rate.concurrency)
+        self.stats.set_value(f'rate_control/{domain}/safe_rate', round(rate.requests_per_second, 3))
+
+    def spider_closed(self, spider):
+        for domain, rate in self.rates.items():
+            self.update_metrics(domain, rate)
+            logger.info(f"Темп для {domain}: {rate.requests_per_second:.2f} запросов/с "
+                        f"(задержка {rate.delay:.2f} с, {rate.concurrency} параллельных запросов).")
+        self.save_state()
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MODES = ('record', 'replay')
+
+
+class CompactCacheStorage:
+    """
+    Хранилище HTTPCACHE для записи и воспроизведения обходов.
+
+    Ответы (для Playwright - уже отрисованный HTML) хранятся в одном
+    SQLite-файле на паука в каталоге HTTPCACHE_DIR, тела и заголовки сжаты zlib.
+    Ключ - отпечаток запроса Scrapy, поэтому цепочки пагинации и страницы
+    фильтров воспроизводятся в том же порядке, что и при записи.
+
+    Режим задается настройкой REPLAY_MODE:
+    - 'record' - сайт запрашивается всегда, ответы перезаписываются в хранилище;
+    - 'replay' - ответы отдаются только из хранилища, сеть не используется.
+    """
+    def __init__(self, settings):
+        self.mode = settings.get('REPLAY_MODE')
+        if self.mode not in REPLAY_MODES:
+            raise NotConfigured(f"CompactCacheStorage требует REPLAY_MODE из {REPLAY_MODES}, получено: {self.mode!r}")
+        self.cache_dir = data_path(settings.get('HTTPCACHE_DIR'), createdir=True)
+        self.compression_level = settings.getint('REPLAY_COMPRESSION_LEVEL', 6)
+        self.db = None
+        self.fingerprinter = None
+        self.stored = 0
+        self.served = 0
+
+    def open_spider(self, spider) -> None:
+        path = os.path.join(self.cache_dir, f"{spider.name}.sqlite")
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "fingerprint TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, "
+            "headers BLOB NOT NULL, body BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self.db.commit()
+        logger.info(f"Хранилище ответов {path} открыто в режиме '{self.mode}'.")
+
+    def close_spider(self, spider) -> None:
+        if self.db is None:
+            return
+        self.db.close()
+        self.db = None
+        stats = spider.crawler.stats
+        stats.set_value('replay/stored', self.stored)
+        stats.set_value('replay/served', self.served)
+        logger.info(f"Хранилище ответов закрыто: записано {self.stored}, воспроизведено {self.served}.")
+
+    def _key(self, request) -> str:
+        return self.fingerprinter.fingerprint(request).hex()
+
+    def retrieve_response(self, spider, request):
+        # При записи всегда идем на сайт, чтобы хранилище отражало текущее состояние
+        if self.mode != 'replay':
+            return None
+
+        row = self.db.execute(
+            "SELECT url, status, headers, body FROM responses WHERE fingerprint = ?",
+            (self._key(request),),
+        ).fetchone()
+        if row is None:
+            return None
+
+        url, status, headers, body = row
+        headers = Headers(json.loads(zlib.decompress(headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        self.served += 1
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response) -> None:
+        if self.mode != 'record':
+            return
+
+        headers = {
+            key.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for key, values in response.headers.items()
+        }
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (fingerprint, url, status, headers, body, stored_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                self._key(request),
+                response.url,
+                response.status,
+                zlib.compress(json.dumps(headers).encode('utf-8'), self.compression_level),
+                zlib.compress(response.body, self.compression_level),
+                time.time(),
+            ),
+        )
+        self.db.commit()
+        self.stored += 1
+
@@ -1,5 +1,7 @@
 # Scrapy settings for MyNewTelegramBot project
 
+import os
+
 BOT_NAME = 'MyNewTelegramBot'
 
 SPIDER_MODULES = ['app.scraping.spiders']
@@ -40,14 +42,21 @@ DEFAULT_REQUEST_HEADERS = {
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    'app.scraping.middlewares.MyNewTelegramBotDownloaderMiddleware': 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+   # Сначала пробует простой HTTP, браузер - только если ответ не прошел проверку (app/scraping/tiered_fetch.py)
+   'app.scraping.tiered_fetch.TieredFetchMiddleware': 940,
+   # Выдает запросам Playwright страницы из пула (app/scraping/page_pool.py)
+   'app.scraping.page_pool.PlaywrightPagePoolMiddleware': 950,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 EXTENSIONS = {
    'scrapy.extensions.telnet.TelnetConsole': None,
+   # Подбор темпа обхода по обратной связи от сайта (app/scraping/rate_control.py)
+   'app.scraping.rate_control.AdaptiveRateController': 500,
+   # Сохраняет собранные элементы и запросы в работе в JOBDIR (app/scraping/checkpoint.py)
+   'app.scraping.checkpoint.ItemsCheckpoint': 510,
 }
 
 # Configure item pipelines
@@ -69,6 +78,27 @@ AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
 # Enable showing throttling stats for every response received:
 AUTOTHROTTLE_DEBUG = False
 
+# Адаптивный темп обхода (app/scraping/rate_control.py), AIMD по ответам сайта.
+# Пока он включен, AutoThrottle задержку не меняет, а DOWNLOAD_DELAY служит
+# только стартовой задержкой для первого обхода.
+RATE_CONTROL_ENABLED = True
+RATE_CONTROL_MIN_DELAY = 0.25
+RATE_CONTROL_MAX_DELAY = 30
+RATE_CONTROL_MAX_CONCURRENCY = 8
+# Шаг уменьшения задержки, когда параллельность уже максимальна (секунды)
+RATE_CONTROL_DELAY_STEP = 0.25
+# Во сколько раз сокращается темп при замедлении
+RATE_CONTROL_BACKOFF_FACTOR = 0.5
+# Через сколько ответов пересматривается темп
+RATE_CONTROL_WINDOW = 10
+RATE_CONTROL_MAX_ERROR_RATE = 0.1
+# Средняя задержка ответа (секунды), выше которой обход замедляется
+RATE_CONTROL_MAX_LATENCY = 10
+RATE_CONTROL_BLOCK_HTTP_CODES = [403, 429]
+RATE_CONTROL_CAPTCHA_PATTERNS = [r'showcaptcha', r'/captcha']
+# Найденный безопасный темп по сайтам; с него начинается следующий обход
+RATE_CONTROL_STATE_FILE = 'results/rate_control.json'
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 # HTTPCACHE_ENABLED = True
@@ -77,22 +107,165 @@ AUTOTHROTTLE_DEBUG = False
 # HTTPCACHE_IGNORE_HTTP_CODES = []
 # HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
 
+# Запись и воспроизведение обходов (app/scraping/replay.py).
+# REPLAY_MODE=record - ответы сайта (отрисованный HTML) сохраняются в .scrapy/<REPLAY_DIR>/<паук>.sqlite;
+# REPLAY_MODE=replay - обход идет только по сохраненным ответам, без сети и браузера.
+REPLAY_MODE = os.getenv('REPLAY_MODE') or None
+REPLAY_DIR = os.getenv('REPLAY_DIR', 'replay')
+if REPLAY_MODE:
+    HTTPCACHE_ENABLED = True
+    HTTPCACHE_STORAGE = 'app.scraping.replay.CompactCacheStorage'
+    HTTPCACHE_POLICY = 'scrapy.extensions.httpcache.DummyPolicy'
+    HTTPCACHE_DIR = REPLAY_DIR
+    HTTPCACHE_EXPIRATION_SECS = 0
+    # Блокировки и ошибки сервера не записываются
+    HTTPCACHE_IGNORE_HTTP_CODES = [403, 429, 500, 502, 503, 504]
+    # При воспроизведении отсутствующий ответ не запрашивается с сайта, а отбрасывается
+    HTTPCACHE_IGNORE_MISSING = REPLAY_MODE == 'replay'
+
 # Set the reactor to match the installed one
 TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
 
+# Обработчик scrapy-playwright с блокировкой лишних ресурсов (app/scraping/resource_blocking.py)
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
-    "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
+    "http": "app.scraping.resource_blocking.BlockingPlaywrightDownloadHandler",
+    "https": "app.scraping.resource_blocking.BlockingPlaywrightDownloadHandler",
 }
 
 PLAYWRIGHT_BROWSER_TYPE = "chromium"
+
+# Двухуровневая загрузка: HTTP, затем браузер (app/scraping/tiered_fetch.py)
+TIERED_FETCH_ENABLED = True
+# Ответ HTTP считается пригодным, если в нем есть хотя бы один элемент по этому селектору
+TIERED_FETCH_VALIDATE_SELECTOR = "article[data-auto='searchOrganic']"
+# После скольких попыток HTTP по шаблону URL начинать доверять статистике
+TIERED_FETCH_MIN_SAMPLES = 5
+# Если доля удачных HTTP-ответов ниже порога, шаблон сразу идет в браузер
+TIERED_FETCH_MIN_SUCCESS_RATE = 0.5
+# Каждый N-й запрос такого шаблона все равно пробует HTTP
+TIERED_FETCH_REPROBE_EVERY = 20
+TIERED_FETCH_STATE_FILE = 'results/fetch_tiers.json'
+
+# Блокировка ресурсов, которые не нужны для разбора карточек товаров и фильтров.
+# Пауки могут переопределить эти настройки через custom_settings.
+RESOURCE_BLOCKING_ENABLED = True
+# Типы ресурсов Playwright: document, stylesheet, image, media, font, script, xhr, fetch, ...
+RESOURCE_BLOCKING_TYPES = ['image', 'media', 'font', 'stylesheet']
+# Регулярные выражения для URL аналитики и рекламы
+RESOURCE_BLOCKING_URL_PATTERNS = [
+    r'mc\.yandex\.',
+    r'an\.yandex\.',
+    r'yandex\.[a-z]+/ads/',
+    r'adfox',
+    r'google-analytics\.com',
+    r'googletagmanager\.com',
+    r'top-fwz1\.mail\.ru',
+]
+# Оценка размера ресурса каждого типа для подсчета сэкономленного трафика (байты)
+# RESOURCE_BLOCKING_SIZE_ESTIMATES = {'image': 40000}
+
+# Перехват JSON-ответов API страницы (app/scraping/json_capture.py).
+# Товары и фильтры берутся из JSON, разбор DOM остается запасным вариантом.
+JSON_CAPTURE_ENABLED = True
+# Сколько миллисекунд в этом режиме ждать карточки товаров в DOM для запасного разбора
+JSON_CAPTURE_CARDS_WAIT_MS = 5000
+
+# Сбор виртуализированного списка брендов в FilterSpider (внутри страницы).
+# Сбор завершается, если список прокручен до конца и за FILTER_HARVEST_IDLE_MS
+# не появилось новых брендов; FILTER_HARVEST_MAX_MS - общий лимит времени (мс)
+FILTER_HARVEST_IDLE_MS = 700
+FILTER_HARVEST_MAX_MS = 60000
+
+# Инкрементальный обход (YandexMarketSpider, incremental=True, app/scraping/delta.py).
+# Цены сравниваются со снимком из таблицы products; пагинация останавливается
+# после стольких страниц подряд без новых и изменившихся предложений.
+INCREMENTAL_UNCHANGED_PAGES_LIMIT = 2
+
+# Пул заранее прогретых страниц Playwright (app/scraping/page_pool.py)
+# При воспроизведении (REPLAY_MODE=replay) браузер не нужен
+PLAYWRIGHT_PAGE_POOL_ENABLED = REPLAY_MODE != 'replay'
+PLAYWRIGHT_PAGE_POOL_SIZE = 4
+# Сколько секунд запрос ждет свободную страницу пула, прежде чем получить отдельную
+PLAYWRIGHT_PAGE_POOL_ACQUIRE_TIMEOUT = 30
+PLAYWRIGHT_PAGE_POOL_VIEWPORT = {"width": 1920, "height": 1080}
+# Страница для прогрева: на ней закрывается диалог согласия и появляются cookies
+PLAYWRIGHT_PAGE_POOL_WARMUP_URL = "https://market.yandex.ru/"
+PLAYWRIGHT_PAGE_POOL_CONSENT_SELECTORS = [
+    "button[data-id='button-all']",
+    "button:has-text('Принять')",
+    "button:has-text('Allow all')",
+]
+
+# Долгоживущий сервис обхода (app/scraping/crawl_service.py):
+# сколько обходов может выполняться одновременно в одном реакторе
+CRAWL_SERVICE_MAX_PARALLEL_CRAWLS = 4
+# Общий бюджет параллельных запросов для мульти-запросного обхода (run_spider_multi)
+MULTI_QUERY_CONCURRENT_REQUESTS = 6
+# Потоковая выдача (stream_spider): сколько несъеденных элементов может
+# накопиться, прежде чем обход будет приостановлен
+STREAM_MAX_BUFFERED_ITEMS = 100
+
+# Кэш результатов обходов (app/scraping/cache.py): LRU в памяти поверх SQLite-файла RESULT_CACHE_FILE
+RESULT_CACHE_FILE = os.path.join('results', 'cache.sqlite')
+# Предельный общий размер сжатых результатов в файле; сверх него вытесняются давно не использованные
+RESULT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+# Сколько ключей держать в памяти
+RESULT_CACHE_MEMORY_SIZE = 32
+# Срок жизни результатов по классу запроса (секунды): обычный поиск и цели наблюдения
+RESULT_CACHE_TTL = {'search': 3600, 'target': 1800}
+RESULT_CACHE_DEFAULT_TTL = 3600
+# Stale-while-revalidate: результат с истекшим сроком жизни отдается сразу и обновляется в фоне,
+# но только пока он не старше RESULT_CACHE_MAX_STALE для своего класса; дальше пользователь ждет обхода
+RESULT_CACHE_STALE_WHILE_REVALIDATE = True
+RESULT_CACHE_MAX_STALE = {'search': 6 * 3600}
+
+# Кэш декомпозиции названий (app/scraping/decomposition_cache.py): LRU в памяти поверх SQLite-файла,
+# ключ - хэш названия; при изменении правил LaptopDecomposer файл очищается
+DECOMPOSITION_CACHE_FILE = os.path.join('results', 'decomposition.sqlite')
+# Сколько названий держать в памяти и сколько хранить в файле (лишние вытесняются по давности использования)
+DECOMPOSITION_CACHE_MEMORY_SIZE = 20000
+DECOMPOSITION_CACHE_MAX_ENTRIES = 200000
+
+# Параллельная декомпозиция (LaptopDecomposer в app/scraping/decomposer.py).
+# Число рабочих процессов: 0 - по числу ядер, 1 - всегда в процессе бота
+DECOMPOSER_PROCESSES = 0
+# С какого числа новых (не найденных в кэше) названий включать пул процессов
+DECOMPOSER_PARALLEL_THRESHOLD = 5000
+# Минимум названий в одном задании пула, чтобы передача данных между процессами окупалась
+DECOMPOSER_CHUNK_SIZE = 1000
+
+# Контрольные точки долгих обходов (app/scraping/checkpoint.py).
+# Очередь запросов, отпечатки и собранные элементы хранятся в CHECKPOINT_DIR/<задание>;
+# прерванный обход продолжается с места остановки, каталог удаляется после успешного завершения
+CHECKPOINT_ENABLED = True
+CHECKPOINT_DIR = os.path.join('results', 'jobs')
+# Фильтр повторов, который не теряет отпечатки при аварийной остановке
+DUPEFILTER_CLASS = 'app.scraping.checkpoint.CheckpointDupeFilter'
+# Контрольная точка старше этого срока (секунды) отбрасывается: цены в ней уже устарели
+CHECKPOINT_MAX_AGE = 24 * 3600
+# Как часто (секунды) сохранять список запросов, которые еще не скачаны
+CHECKPOINT_FLUSH_INTERVAL = 5
+
+# Пул рабочих процессов обхода (app/scraping/worker_pool.py).
+# 0 - обходы выполняются в процессе бота; N > 0 - в N процессах со своим реактором и браузером
+CRAWL_WORKER_PROCESSES = 0
+# Через сколько заданий рабочий процесс перезапускается, чтобы ограничить рост памяти Chromium
+CRAWL_WORKER_MAX_JOBS = 20
+
 # Set log encoding to UTF-8 to fix garbled output in Windows console
 LOG_ENCODING = 'utf-8'
 LOG_STDOUT = True
 
+# Карта фильтров, которую собирает StructureSpider. Паук сравнивает новую карту
+# с этим файлом и не перезаписывает его, если фильтры не изменились
+FILTERS_ID_FILE = os.path.join('results', 'dictionaries', 'filters_ID.csv')
+# Значения фильтра "Производитель" с ID (FilterSpider). Вместе с картой фильтров
+# используются QueryPlanner (app/scraping/query_planner.py) для URL с фильтрами
+BRANDS_FILE = os.path.join('results', 'dictionaries', 'brands.csv')
+
 # Настройки экспорта данных (Feeds)
 FEEDS = {
-    'results\dictionaries\filters_ID.csv': {
+    FILTERS_ID_FILE: {
         'format': 'csv',
         'encoding': 'utf8',
         'store_empty': False,
@@ -2,15 +2,132 @@ import scrapy
 from scrapy.http import HtmlResponse
 from scrapy_playwright.page import PageMethod
 from ..items import BrandItem
-import asyncio
+from ..page_pool import release_page
+import logging
+
+# Границы корзин гистограммы задержек отрисовки (мс)
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500]
+
+# Сборщик виртуализированного списка, выполняется внутри страницы за один вызов.
+# MutationObserver собирает бренды по мере отрисовки, а следующая прокрутка
+# делается сразу, как только после предыдущей появились новые элементы.
+# Если после прокрутки ничего не появилось за idleMs, а список уже прокручен
+# до конца - сбор окончен. Для каждой прокрутки замеряется задержка до появления
+# новых брендов.
+HARVEST_BRANDS_JS = """
+async ({scrollerSelector, itemSelector, textSelector, idleMs, maxMs}) => {
+    const scroller = document.querySelector(scrollerSelector);
+    const brands = new Map();
+    const latencies = [];
+    const startedAt = performance.now();
+    let scrolls = 0;
+    let scrolledAt = null;
+
+    const collect = () => {
+        let added = 0;
+        for (const label of document.querySelectorAll(itemSelector)) {
+            const text = label.querySelector(textSelector);
+            const name = text ? text.innerText.trim() : '';
+            if (name && !brands.has(name)) {
+                const id = (label.getAttribute('data-auto') || '').replace('filter-list-item-', '');
+                brands.set(name, id);
+                added++;
+            }
+        }
+        if (added && scrolledAt !== null) {
+            latencies.push(performance.now() - scrolledAt);
+            scrolledAt = null;
+        }
+        return added;
+    };
+
+    const finish = (timedOut) => ({
+        brands: Array.from(brands, ([name, id]) => ({name, id})),
+        latencies,
+        scrolls,
+        timedOut,
+        elapsedMs: performance.now() - startedAt,
+    });
+
+    collect();
+    if (!scroller) {
+        return finish(false);
+    }
+
+    return await new Promise((resolve) => {
+        let idleTimer = null;
+        const deadline = setTimeout(() => done(true), maxMs);
+
+        const done = (timedOut) => {
+            observer.disconnect();
+            clearTimeout(idleTimer);
+            clearTimeout(deadline);
+            collect();
+            resolve(finish(timedOut));
+        };
+
+        const scrollNext = () => {
+            clearTimeout(idleTimer);
+            const atBottom = scroller.scrollTop + scroller.clientHeight >= scroller.scrollHeight - 1;
+            if (!atBottom) {
+                scroller.scrollTop += scroller.clientHeight;
+                scrolls++;
+                scrolledAt = performance.now();
+            }
+            idleTimer = setTimeout(() => {
+                const stillAtBottom = scroller.scrollTop + scroller.clientHeight >= scroller.scrollHeight - 1;
+                if (stillAtBottom) {
+                    done(false);
+                } else {
+                    // Новых брендов нет, но список еще не кончился (элементы уже были в DOM)
+                    scrollNext();
+                }
+            }, idleMs);
+        };
+
+        const observer = new MutationObserver(() => {
+            if (collect()) {
+                requestAnimationFrame(scrollNext);
+            }
+        });
+        observer.observe(scroller, {childList: true, subtree: true});
+        scrollNext();
+    });
+}
+"""
+
+
+def latency_histogram(latencies, buckets):
+    """
+    Раскладывает задержки по корзинам: '<=50', '<=100', ..., '>2500'.
+    """
+    histogram = {f'<={bound}': 0 for bound in buckets}
+    histogram[f'>{buckets[-1]}'] = 0
+    for latency in latencies:
+        bucket = next((f'<={bound}' for bound in buckets if latency <= bound), f'>{buckets[-1]}')
+        histogram[bucket] += 1
+    return histogram
 
 class FilterSpider(scrapy.Spider):
     name = 'filter_spider'
     allowed_domains = ['market.yandex.ru']
 
+    # Стили не блокируем: без них виртуализированный список фильтров
+    # неправильно считает высоту элементов и не подгружает их при скролле
+    custom_settings = {
+        'RESOURCE_BLOCKING_TYPES': ['image', 'media', 'font'],
+    }
+
+    # Фильтр "Производитель" и селекторы его виртуализированного списка
+    brand_filter_id = "7893318"
+    scroller_selector = f'div[data-filter-id="{brand_filter_id}"] div[data-test-id="virtuoso-scroller"]'
+    brand_item_selector = f'div[data-filter-id="{brand_filter_id}"] div[data-test-id="virtuoso-item-list"] label[data-auto^="filter-list-item-"]'
+    brand_text_selector = 'span._1-LFf._2KcG8'
+
     def __init__(self, *args, **kwargs):
         super(FilterSpider, self).__init__(*args, **kwargs)
-        self.successful_sleeps = {}
+        # Задержки (мс) от прокрутки списка до появления в нем новых брендов
+        self.render_latencies = []
 
     # Стартуем на странице со всеми фильтрами. Этот URL используется для всех версий.
     start_urls = ["https://market.yandex.ru/catalog--noutbuki/26895412/list-filters"]
@@ -44,8 +161,8 @@ class FilterSpider(scrapy.Spider):
             #      },
             #      callback=self.parse_brands)
             
-            # --- ВЕРСИЯ 3 (АКТИВНАЯ): Клик + ожидание + скроллинг ---
-            self.log("ЗАПУСК ВЕРСИИ 3: Клик + ожидание + скроллинг.")
+            # --- ВЕРСИЯ 3 (АКТИВНАЯ): Клик + сбор всего списка внутри страницы ---
+            self.log("ЗАПУСК ВЕРСИИ 3: Клик + сбор списка внутри страницы.")
             yield scrapy.Request(
                 url,
                 meta={"playwright": True, "playwright_include_page": True, "errback": self.errback},
@@ -56,127 +173,89 @@ class FilterSpider(scrapy.Spider):
     async def parse_and_scroll(self, response):
         """
         CALLBACK ДЛЯ ВЕРСИИ 3.
-        Управляет страницей: кликает, ждет, скроллит и затем вызывает parse_brands.
+        Кликает "показать все" и собирает весь список брендов одним вызовом
+        page.evaluate (см. HARVEST_BRANDS_JS).
         """
-        page = response.meta["playwright_page"]
+        page = response.meta.get("playwright_page")
+        if page is None:
+            # Ответ без живой страницы (например, воспроизведение записанного обхода):
+            # доступны только бренды, попавшие в отрисованный HTML
+            for brand_name, brand_id in sorted(self.parse_brands_from_html(response).items()):
+                item = BrandItem()
+                item['brand'] = brand_name
+                item['brand_id'] = brand_id
+                yield item
+            return
+
         self.log(f"Загружена страница '{await page.title()}'. Начинаем манипуляции.")
-        
-        all_brands = set()
 
         try:
             # Шаг 1: Кликнуть на кнопку "показать все"
-            show_all_button_selector = 'div[data-filter-id="7893318"] button[aria-expanded="false"]'
+            show_all_button_selector = f'div[data-filter-id="{self.brand_filter_id}"] button[aria-expanded="false"]'
             await page.click(show_all_button_selector, timeout=5000)
             self.log("Кнопка 'показать все' нажата.")
-            await page.wait_for_selector('div[data-test-id="virtuoso-scroller"]', timeout=5000)
+            await page.wait_for_selector(self.scroller_selector, timeout=5000)
             self.log("Список брендов раскрыт, virtuoso-scroller появился.")
 
-            # Шаг 2: Скроллинг и парсинг на лету
-            scroll_container_selector = 'div[data-test-id="virtuoso-scroller"]'
-            scrolls_without_new_brands = 0
-            max_scrolls_without_new = 3  # Количество "пустых" прокруток для завершения
-            
-            initial_sleep_time = 0.1 # Начальная пауза
-            max_sleep_time = 2.5     # Максимальная пауза
-            sleep_increase_factor = 5 # Коэффициент увеличения паузы
-            current_sleep_time = initial_sleep_time
-
-            while True:
-                brands_before = len(all_brands)
-
-                # Парсим видимые бренды напрямую через Playwright API
-                newly_found_brands = await self.parse_brands(page)
-                all_brands.update(newly_found_brands)
-                
-                brands_after = len(all_brands)
-                new_brands_count = brands_after - brands_before
-
-                self.log(f"Найдено {len(newly_found_brands)} на экране. Добавлено {new_brands_count} новых. Всего: {brands_after}.")
-
-                # Проверяем, были ли найдены новые бренды
-                if new_brands_count == 0:
-                    scrolls_without_new_brands += 1
-                    self.log(f"Новых брендов не найдено. Счетчик 'пустых' прокруток: {scrolls_without_new_brands}.")
-                    # Увеличиваем паузу, если новые бренды не найдены, но не превышаем максимум
-                    if current_sleep_time < max_sleep_time:
-                        current_sleep_time = min(current_sleep_time * sleep_increase_factor, max_sleep_time)
-                        self.log(f"Увеличиваем паузу до {current_sleep_time:.2f} сек.")
-                else:
-                    scrolls_without_new_brands = 0  # Сбрасываем счетчик, если что-то нашли
-                    # Записываем статистику успешной паузы
-                    sleep_key = f"{current_sleep_time:.2f}"
-                    self.successful_sleeps[sleep_key] = self.successful_sleeps.get(sleep_key, 0) + 1
-                    current_sleep_time = initial_sleep_time # Сбрасываем паузу до начального значения
-                    self.log(f"Новые бренды найдены. Сбрасываем паузу до {current_sleep_time:.2f} сек.")
-
-                # Условие выхода из цикла:
-                # Завершаем, если достигнуто max_scrolls_without_new "пустых" прокруток
-                # И текущая пауза достигла максимального значения (чтобы дать сайту время на загрузку)
-                if scrolls_without_new_brands >= max_scrolls_without_new and current_sleep_time >= max_sleep_time:
-                    self.log(f"После {max_scrolls_without_new} прокруток без новых брендов и при максимальной паузе завершаем скроллинг.")
-                    break
-
-                # Прокручиваем контейнер трижды за итерацию
-                scroll_count = 2 # Количество прокруток за один раз
-                await page.evaluate(f'''
-                    const container = document.querySelector('{scroll_container_selector}');
-                    if (container) {{
-                        for (let i = 0; i < {scroll_count}; i++) {{
-                            container.scrollTop += container.clientHeight;
-                        }}
-                    }}
-                ''')
-                await asyncio.sleep(current_sleep_time) # Пауза после всех прокруток
-            
-            self.log(f"Скроллинг завершен. Всего собрано {len(all_brands)} уникальных брендов.")
+            # Шаг 2: Сбор всего списка внутри страницы за один вызов
+            harvest = await page.evaluate(HARVEST_BRANDS_JS, {
+                "scrollerSelector": self.scroller_selector,
+                "itemSelector": self.brand_item_selector,
+                "textSelector": self.brand_text_selector,
+                "idleMs": self.settings.getint('FILTER_HARVEST_IDLE_MS', 700),
+                "maxMs": self.settings.getint('FILTER_HARVEST_MAX_MS', 60000),
+            })
+            self.render_latencies.extend(harvest['latencies'])
+            self.crawler.stats.inc_value('filter_harvest/scrolls', harvest['scrolls'])
+            self.crawler.stats.set_value('filter_harvest/elapsed_ms', int(harvest['elapsedMs']))
+            if harvest['timedOut']:
+                self.log("Сбор брендов остановлен по общему лимиту времени.", level=logging.WARNING)
+            self.log(f"Сбор завершен за {harvest['elapsedMs'] / 1000:.1f} сек. и {harvest['scrolls']} прокруток. "
+                     f"Всего собрано {len(harvest['brands'])} уникальных брендов.")
 
             # Шаг 3: Генерируем BrandItem из собранного набора
-            for brand_name in sorted(list(all_brands)):
+            for brand in sorted(harvest['brands'], key=lambda brand: brand['name']):
                 item = BrandItem()
-                item['brand'] = brand_name
+                item['brand'] = brand['name']
+                item['brand_id'] = brand['id']
                 yield item
 
         except Exception as e:
             self.log(f"Произошла ошибка в parse_and_scroll: {e}")
         finally:
-            self.log("Закрываем страницу Playwright.")
-            await page.close()
+            self.log("Возвращаем страницу Playwright в пул.")
+            await release_page(self, page, response.meta)
 
-    async def parse_brands(self, page):
+    def parse_brands_from_html(self, response):
         """
-        ПАРСЕР, РАБОТАЮЩИЙ НАПРЯМУЮ С PLAYWRIGHT.
-        Извлекает текст брендов, используя page.locator.
+        Извлекает бренды из HTML ответа, без Playwright.
+
+        Returns:
+            dict: Название бренда -> ID значения фильтра.
         """
-        self.log(f"Парсим бренды напрямую со страницы: {page.url}")
-        
-        # Селектор для текстовых элементов брендов
-        brand_selector = 'div[data-filter-id="7893318"] div[data-test-id="virtuoso-item-list"] label[data-auto^="filter-list-item-"] span._1-LFf._2KcG8'
-        
-        try:
-            # Находим все элементы, соответствующие селектору
-            brand_elements = await page.locator(brand_selector).all_inner_texts()
-            self.log(f"Найдено {len(brand_elements)} текстовых элементов брендов на текущем экране.")
-            
-            # Очищаем и добавляем в set
-            found_brands = {name.strip() for name in brand_elements}
-            return found_brands
-            
-        except Exception as e:
-            self.log(f"Ошибка при парсинге брендов через Playwright: {e}")
-            return set()
+        found_brands = {}
+        for label in response.css(self.brand_item_selector):
+            name = ''.join(label.css(f'{self.brand_text_selector} ::text').getall()).strip()
+            if name:
+                found_brands.setdefault(name, label.attrib.get('data-auto', '').replace('filter-list-item-', ''))
+        self.log(f"Найдено {len(found_brands)} брендов в HTML страницы {response.url}.")
+        return found_brands
 
     def close(self, reason):
         self.log("Паук завершает работу.")
-        if self.successful_sleeps:
-            self.log("Статистика по успешным паузам (время в сек.: кол-во успешных находок):")
-            sorted_sleeps = sorted(self.successful_sleeps.items(), key=lambda item: float(item[0]))
-            for sleep_time, count in sorted_sleeps:
-                self.log(f"- {sleep_time}: {count} раз")
-        else:
-            self.log("Статистика по успешным паузам не собрана.")
+        if not self.render_latencies:
+            self.log("Статистика задержек отрисовки не собрана.")
+            return
+
+        # Гистограмма задержек: от прокрутки до появления новых брендов в списке
+        histogram = latency_histogram(self.render_latencies, LATENCY_BUCKETS_MS)
+        self.log(f"Задержка отрисовки после прокрутки ({len(self.render_latencies)} замеров):")
+        for bucket, count in histogram.items():
+            self.crawler.stats.set_value(f'filter_harvest/render_latency_ms/{bucket}', count)
+            self.log(f"- {bucket} мс: {count}")
 
     async def errback(self, failure):
         self.log(f"Playwright-запрос провалился: {failure.value}")
         page = failure.request.meta.get("playwright_page")
         if page:
-            await page.close()
\ No newline at end of file
+            await release_page(self, page, failure.request.meta)
\ No newline at end of file
@@ -2,11 +2,26 @@
 import scrapy
 from scrapy_playwright.page import PageMethod
 from ..items import FilterInfoItem
+from ..page_pool import release_page
+from ..json_capture import collect_captured_json, extract_filters_from_json
 import asyncio
+import csv
 import logging
 import os
 import json
 
+# Читает все контейнеры фильтров за один вызов: тип фильтра и сырой JSON
+# из data-zone-data дочернего элемента (разбирается уже в Python)
+EXTRACT_FILTER_CONTAINERS_JS = """
+(selector) => Array.from(document.querySelectorAll(selector), (container) => {
+    const zone = container.querySelector(':scope > div[data-zone-data]');
+    return {
+        filterType: container.getAttribute('data-filter-type'),
+        zoneData: zone ? zone.getAttribute('data-zone-data') : null,
+    };
+})
+"""
+
 class StructureSpider(scrapy.Spider):
     """
     Этот паук предназначен для анализа структуры страницы фильтров на Яндекс.Маркете.
@@ -16,9 +31,26 @@ class StructureSpider(scrapy.Spider):
     name = 'structure_spider'
     allowed_domains = ['market.yandex.ru']
 
+    # Стили не блокируем: без них виртуализированный список фильтров
+    # неправильно считает высоту элементов и не подгружает их при скролле
+    custom_settings = {
+        'RESOURCE_BLOCKING_TYPES': ['image', 'media', 'font'],
+    }
+
     # URL страницы, на которой находятся все фильтры
     start_urls = ["https://market.yandex.ru/catalog--noutbuki/26895412/list-filters"]
 
+    # Общий атрибут всех контейнеров фильтров. Это самый надежный способ,
+    # так как он не зависит от тегов.
+    filter_containers_selector = "div[data-filter-id]"
+
+    def __init__(self, force=False, *args, **kwargs):
+        super(StructureSpider, self).__init__(*args, **kwargs)
+        # force=True - перезаписать карту фильтров, даже если она не изменилась
+        if isinstance(force, str):
+            force = force.lower() in ('1', 'true', 'yes')
+        self.force = bool(force)
+
     def start_requests(self):
         """
         Запускает начальный запрос к странице.
@@ -26,71 +58,146 @@ class StructureSpider(scrapy.Spider):
         """
         self.log("ЗАПУСК: Анализ структуры фильтров.")
         for url in self.start_urls:
+            meta = {
+                "playwright": True,
+                "playwright_include_page": True, # Дает нам доступ к объекту страницы Playwright
+                "errback": self.errback
+            }
+            if self.settings.getbool('JSON_CAPTURE_ENABLED'):
+                # Перехватываем JSON-ответы страницы: описания фильтров могут прийти прямо из API
+                meta["playwright_page_init_callback"] = "app.scraping.json_capture.start_json_capture"
             yield scrapy.Request(
                 url,
-                meta={
-                    "playwright": True,
-                    "playwright_include_page": True, # Дает нам доступ к объекту страницы Playwright
-                    "errback": self.errback
-                },
+                meta=meta,
                 callback=self.parse_structure
             )
 
     async def parse_structure(self, response):
         """
         Основной метод для парсинга структуры фильтров.
-        Извлекает ID, название и тип для каждого фильтра на странице.
+        Извлекает ID, название и тип для каждого фильтра на странице
+        и отдает карту фильтров, только если она изменилась.
         """
-        page = response.meta["playwright_page"]
-        self.log(f"Страница '{await page.title()}' загружена. Начинаем анализ структуры.")
+        page = response.meta.get("playwright_page")
+        if page is None:
+            # Ответ без живой страницы (например, воспроизведение записанного обхода)
+            filters = list(self.parse_structure_from_html(response))
+        else:
+            try:
+                self.log(f"Страница '{await page.title()}' загружена. Начинаем анализ структуры.")
+                filters = await self.extract_filters(response, page)
+            finally:
+                # В конце обязательно возвращаем страницу в пул
+                await release_page(self, page, response.meta)
+                self.log("Страница Playwright возвращена в пул.")
+
+        if not filters:
+            self.log("Фильтры не найдены. Проверьте селектор.", level=logging.WARNING)
+            return
 
-        # Шаг 1: Найти все контейнеры фильтров по общему атрибуту.
-        # Это самый надежный способ, так как он не зависит от тегов.
-        filter_containers_selector = "div[data-filter-id]"
-        filter_containers = await page.locator(filter_containers_selector).all()
-        self.log(f"Найдено {len(filter_containers)} потенциальных контейнеров фильтров.")
+        for item in self.changed_filters(filters):
+            yield item
 
-        if not filter_containers:
-            self.log("Контейнеры фильтров не найдены. Проверьте селектор.", level=logging.WARNING)
-            await page.close()
+    async def extract_filters(self, response, page):
+        """
+        Собирает описания фильтров со страницы.
+        """
+        # Шаг 0: Если фильтры пришли в JSON-ответах API, берем их оттуда без обхода DOM
+        captured_filters = extract_filters_from_json(await collect_captured_json(response))
+        if captured_filters:
+            self.log(f"Найдено {len(captured_filters)} фильтров в JSON-ответах страницы.")
+            return captured_filters
+
+        # Шаг 1: Все контейнеры фильтров (div[data-filter-id]) читаются за один вызов
+        # page.evaluate: тип фильтра и JSON из data-zone-data, где лежат ID и название
+        containers = await page.evaluate(EXTRACT_FILTER_CONTAINERS_JS, self.filter_containers_selector)
+        self.log(f"Найдено {len(containers)} потенциальных контейнеров фильтров.")
+
+        # Шаг 2: Разбираем данные каждого контейнера
+        filters = []
+        for container in containers:
+            filter_data = self.build_filter(container['filterType'], container['zoneData'])
+            if filter_data:
+                filters.append(filter_data)
+        return filters
+
+    def parse_structure_from_html(self, response):
+        """
+        Извлекает фильтры из HTML ответа, без Playwright: те же атрибуты
+        data-filter-type и data-zone-data, что и в основном разборе.
+        """
+        for container in response.css(self.filter_containers_selector):
+            filter_data = self.build_filter(
+                container.attrib.get('data-filter-type'),
+                container.xpath('./div[@data-zone-data]/@data-zone-data').get(),
+            )
+            if filter_data:
+                yield filter_data
+
+    def build_filter(self, filter_type, zone_data_str):
+        """
+        Собирает описание фильтра из его типа и JSON из data-zone-data.
+        Возвращает None, если каких-то данных не хватает.
+        """
+        if not zone_data_str:
+            self.log("Не найден элемент с data-zone-data, пропускаем.", level=logging.INFO)
+            return None
+        try:
+            zone_data = json.loads(zone_data_str)
+        except ValueError as e:
+            self.log(f"Не удалось разобрать data-zone-data: {e}", level=logging.INFO)
+            return None
+
+        filter_id = zone_data.get('filterId')
+        filter_name = zone_data.get('filterName')
+        if not (filter_id and filter_name and filter_type):
+            self.log(f"Пропущен блок: не удалось извлечь все данные (id={filter_id}, name={filter_name}, type={filter_type})", level=logging.INFO)
+            return None
+
+        self.log(f"Найден фильтр: ID='{filter_id}', Имя='{filter_name}', Тип='{filter_type}'")
+        return {'filter_id': str(filter_id), 'filter_name': filter_name, 'filter_type': filter_type}
+
+    def load_known_filters(self):
+        """
+        Читает карту фильтров, сохраненную предыдущим обходом (FILTERS_ID_FILE).
+        """
+        path = self.settings.get('FILTERS_ID_FILE')
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                return {row['filter_id']: row for row in csv.DictReader(f)}
+        except Exception as e:
+            self.log(f"Не удалось прочитать {path}: {e}", level=logging.ERROR)
+            return {}
+
+    def changed_filters(self, filters):
+        """
+        Сравнивает новую карту фильтров с сохраненной. Если изменений нет,
+        ничего не отдает, и файл карты остается нетронутым.
+        """
+        current = {filter_data['filter_id']: filter_data for filter_data in filters}
+        known = self.load_known_filters()
+
+        added = current.keys() - known.keys()
+        removed = known.keys() - current.keys()
+        changed = {
+            filter_id for filter_id in current.keys() & known.keys()
+            if (current[filter_id]['filter_name'], current[filter_id]['filter_type'])
+            != (known[filter_id].get('filter_name'), known[filter_id].get('filter_type'))
+        }
+
+        if not (added or removed or changed) and not self.force:
+            self.log(f"Карта фильтров не изменилась ({len(current)} фильтров), файл не перезаписывается.")
+            self.crawler.stats.set_value('structure/unchanged', True)
             return
 
-        # Шаг 2: Обработать каждый контейнер.
-        for container in filter_containers:
-            try:
-                # Извлекаем тип фильтра. Это поможет нам понять, как с ним работать.
-                filter_type = await container.get_attribute('data-filter-type')
-
-                # Всю остальную информацию берем из data-zone-data, где она в удобном JSON-формате.
-                zone_data_element = container.locator('> div[data-zone-data]')
-                if not zone_data_element:
-                    self.log("Не найден элемент с data-zone-data, пропускаем.", level=logging.INFO)
-                    continue
-                
-                zone_data_str = await zone_data_element.get_attribute('data-zone-data')
-                zone_data = json.loads(zone_data_str)
-
-                filter_id = zone_data.get('filterId')
-                filter_name = zone_data.get('filterName')
-
-                # Если у нас есть все три компонента, создаем и возвращаем Item.
-                if filter_id and filter_name and filter_type:
-                    item = FilterInfoItem()
-                    item['filter_id'] = filter_id
-                    item['filter_name'] = filter_name
-                    item['filter_type'] = filter_type
-                    
-                    self.log(f"Найден фильтр: ID='{filter_id}', Имя='{filter_name}', Тип='{filter_type}'")
-                    yield item
-                else:
-                    self.log(f"Пропущен блок: не удалось извлечь все данные (id={filter_id}, name={filter_name}, type={filter_type})", level=logging.INFO)
-
-            except Exception as e:
-                self.log(f"Ошибка при обработке контейнера: {e}", level=logging.ERROR)
-
-        # В конце обязательно закрываем страницу
-        await page.close()
-        self.log("Страница Playwright закрыта.")
+        self.log(f"Карта фильтров изменилась: добавлено {len(added)}, удалено {len(removed)}, изменено {len(changed)}.")
+        self.crawler.stats.set_value('structure/added', len(added))
+        self.crawler.stats.set_value('structure/removed', len(removed))
+        self.crawler.stats.set_value('structure/changed', len(changed))
+        for filter_data in filters:
+            yield FilterInfoItem(**filter_data)
 
     async def errback(self, failure):
         """
@@ -99,7 +206,7 @@ class StructureSpider(scrapy.Spider):
         self.log(f"Playwright-запрос провалился: {failure.value}", level=logging.ERROR)
         page = failure.request.meta.get("playwright_page")
         if page:
-            await page.close()
+            await release_page(self, page, failure.request.meta)
 
     def close(self, reason):
         """
@@ -1,78 +1,200 @@
 import scrapy
+from urllib.parse import quote
 from scrapy_playwright.page import PageMethod
 from ..items import ProductItem
+from ..json_capture import (PRODUCT_CARD_SELECTOR, collect_captured_json, extract_products_from_json,
+                            wait_for_product_cards)
+from ..delta import PriceSnapshot
 
 class YandexMarketSpider(scrapy.Spider):
     name = 'yandex_market'
     allowed_domains = ['market.yandex.ru']
 
+    # Шаблон URL поиска для мульти-запросного режима
+    search_url_template = "https://market.yandex.ru/search?text={text}&hid=91013"
+
+    def __init__(self, search_queries=None, search_urls=None, incremental=False, unchanged_pages_limit=None,
+                 *args, **kwargs):
+        super(YandexMarketSpider, self).__init__(*args, **kwargs)
+        # Список запросов можно передать списком или строкой через запятую (scrapy crawl -a)
+        if isinstance(search_queries, str):
+            search_queries = [q.strip() for q in search_queries.split(',') if q.strip()]
+        self.search_queries = list(search_queries or [])
+
+        # Готовые URL поиска с фильтрами (QueryPlanner): название цели -> URL.
+        # Список URL тоже подходит, тогда названием служит сам URL
+        if isinstance(search_urls, str):
+            search_urls = [url.strip() for url in search_urls.split(',') if url.strip()]
+        if isinstance(search_urls, (list, tuple)):
+            search_urls = {url: url for url in search_urls}
+        self.search_urls = dict(search_urls or {})
+
+        # Инкрементальный режим: отдаются только новые и изменившиеся предложения,
+        # пагинация останавливается после K страниц подряд без изменений
+        if isinstance(incremental, str):
+            incremental = incremental.lower() in ('1', 'true', 'yes')
+        self.incremental = bool(incremental)
+        self.unchanged_pages_limit = unchanged_pages_limit
+        self.snapshot = None
+        # Число страниц подряд без изменений для каждого источника (source, query)
+        self.unchanged_pages = {}
+
+    def playwright_meta(self, **extra):
+        """
+        Формирует meta запроса Playwright.
+        В режиме перехвата JSON (JSON_CAPTURE_ENABLED) страница слушает ответы API,
+        а карточки в DOM ждет не дольше JSON_CAPTURE_CARDS_WAIT_MS: если в JSON
+        не нашлось списка результатов, разбор DOM идет по отрисованной странице.
+        """
+        meta = {"playwright": True}
+        if self.settings.getbool('JSON_CAPTURE_ENABLED'):
+            meta["playwright_page_init_callback"] = "app.scraping.json_capture.start_json_capture"
+            meta["playwright_page_methods"] = [
+                PageMethod(wait_for_product_cards, PRODUCT_CARD_SELECTOR,
+                           self.settings.getint('JSON_CAPTURE_CARDS_WAIT_MS', 5000)),
+            ]
+        else:
+            meta["playwright_page_methods"] = [
+                PageMethod("wait_for_selector", PRODUCT_CARD_SELECTOR),
+            ]
+        meta.update(extra)
+        return meta
+
     def start_requests(self):
+        if self.incremental:
+            if self.unchanged_pages_limit is None:
+                self.unchanged_pages_limit = self.settings.getint('INCREMENTAL_UNCHANGED_PAGES_LIMIT', 2)
+            self.unchanged_pages_limit = int(self.unchanged_pages_limit)
+            self.snapshot = PriceSnapshot.from_database()
+
+        if self.search_urls:
+            # Режим целей наблюдения: сайт сам отбирает товары по фильтрам в URL,
+            # результаты группируются по названию цели (поле query)
+            for label, url in self.search_urls.items():
+                yield scrapy.Request(
+                    url=url,
+                    meta=self.playwright_meta(
+                        source="search",
+                        search_query=label,
+                        download_slot=f"{self.allowed_domains[0]}#{label}",
+                    ),
+                    callback=self.parse
+                )
+            return
+
+        if self.search_queries:
+            # Мульти-запросный режим: все запросы идут в одном запуске паука
+            # отдельными стартовыми запросами. У каждого запроса свой download slot,
+            # поэтому задержки считаются независимо, а общий бюджет параллельности
+            # задается CONCURRENT_REQUESTS.
+            for search_query in self.search_queries:
+                yield scrapy.Request(
+                    url=self.search_url_template.format(text=quote(search_query)),
+                    meta=self.playwright_meta(
+                        source="search",
+                        search_query=search_query,
+                        download_slot=f"{self.allowed_domains[0]}#{search_query}",
+                    ),
+                    callback=self.parse
+                )
+            return
+
         # URL для выборки из каталога
         catalog_url = "https://market.yandex.ru/catalog--noutbuki/26895412/list?hid=91013"
         yield scrapy.Request(
             url=catalog_url,
-            meta={
-                "playwright": True,
-                "playwright_page_methods": [
-                    PageMethod("wait_for_selector", "article[data-auto='searchOrganic']"),
-                ],
-                "source": "catalog"
-            },
+            meta=self.playwright_meta(source="catalog"),
             callback=self.parse
         )
-        
+
         # URL для выборки через поиск
         search_url = "https://market.yandex.ru/search?text=ноутбуки%20lenovo&hid=91013"
         yield scrapy.Request(
             url=search_url,
-            meta={
-                "playwright": True,
-                "playwright_page_methods": [
-                    PageMethod("wait_for_selector", "article[data-auto='searchOrganic']"),
-                ],
-                "source": "search"
-            },
+            meta=self.playwright_meta(source="search"),
             callback=self.parse
         )
 
+    def parse_products_from_dom(self, response):
+        """
+        Извлекает товары из отрисованного HTML (карточки searchOrganic).
+        """
+        for product in response.css('article[data-auto="searchOrganic"]'):
+            title = product.css('span[data-auto="snippet-title"]::attr(title)').get(default='').strip()
+            price_text = product.css('span[data-auto="snippet-price-current"] span::text').get()
+            price = ''.join(filter(str.isdigit, price_text)) if price_text else '0'
+            link = product.css('a[data-auto="snippet-image"]::attr(href)').get()
+            yield {'title': title, 'price': price, 'link': response.urljoin(link) if link else 'N/A'}
+
+    def filter_changed(self, products):
+        """
+        Оставляет только предложения, которых нет в снимке или у которых изменилась цена.
+        """
+        changed = []
+        for product in products:
+            status = self.snapshot.compare(product['link'], product['price'])
+            self.crawler.stats.inc_value(f'delta/{status}')
+            if status != 'unchanged':
+                changed.append(product)
+        return changed
+
+    def should_stop_paginating(self, source, search_query, changed):
+        """
+        Считает страницы подряд без новых и изменившихся предложений.
+        """
+        key = (source, search_query)
+        self.unchanged_pages[key] = 0 if changed else self.unchanged_pages.get(key, 0) + 1
+        return self.unchanged_pages[key] >= self.unchanged_pages_limit
+
     async def parse(self, response):
         source = response.meta['source']
+        search_query = response.meta.get('search_query')
         page_number = response.meta.get('page_number', 1)
         self.log(f"Парсим страницу {page_number} для источника '{source}': {response.url}")
 
-        # Извлекаем данные с текущей страницы
-        products = response.css('article[data-auto="searchOrganic"]')
+        # Сначала пробуем данные из перехваченных JSON-ответов, затем - разбор DOM
+        products = extract_products_from_json(await collect_captured_json(response))
+        if products:
+            self.log(f"Найдено {len(products)} товаров в JSON-ответах страницы {page_number}.")
+            self.crawler.stats.inc_value('json_capture/pages_from_json')
+        else:
+            products = list(self.parse_products_from_dom(response))
+            self.crawler.stats.inc_value('json_capture/pages_from_dom')
+
         if not products:
             self.log(f"Товары не найдены на странице {page_number}. Завершаем парсинг для источника '{source}'.")
             return
-            
+
+        if self.incremental:
+            products = self.filter_changed(products)
+
         for product in products:
-            item = ProductItem()
-            item['title'] = product.css('span[data-auto="snippet-title"]::attr(title)').get(default='').strip()
-            price_text = product.css('span[data-auto="snippet-price-current"] span::text').get()
-            item['price'] = ''.join(filter(str.isdigit, price_text)) if price_text else '0'
-            link = product.css('a[data-auto="snippet-image"]::attr(href)').get()
-            item['link'] = response.urljoin(link) if link else 'N/A'
+            item = ProductItem(**product)
             item['source'] = source
+            if search_query is not None:
+                item['query'] = search_query
             yield item
 
+        if self.incremental and self.should_stop_paginating(source, search_query, changed=bool(products)):
+            self.log(f"{self.unchanged_pages_limit} стр. подряд без изменений для источника '{source}'. "
+                     f"Останавливаем пагинацию на странице {page_number}.")
+            self.crawler.stats.inc_value('delta/early_stops')
+            return
+
         # Пагинация с помощью response.follow и сохранением meta Playwright
         next_page_url = response.css('a[data-auto="pagination-next"]::attr(href)').get()
 
         if next_page_url:
             next_page_number = page_number + 1
             self.log(f"Найдена следующая страница ({next_page_number}) для источника '{source}'")
+            meta = self.playwright_meta(source=source, page_number=next_page_number)
+            if search_query is not None:
+                meta["search_query"] = search_query
+                meta["download_slot"] = response.meta.get("download_slot")
             yield response.follow(
                 url=next_page_url,
                 callback=self.parse,
-                meta={
-                    "playwright": True,
-                    "playwright_page_methods": [
-                        PageMethod("wait_for_selector", "article[data-auto='searchOrganic']"),
-                    ],
-                    "source": source,
-                    "page_number": next_page_number
-                }
+                meta=meta
             )
         else:
-            self.log(f"Больше страниц для источника '{source}' не найдено или достигнут лимит в 5 страниц.")
\ No newline at end of file
+            self.log(f"Больше страниц для источника '{source}' не найдено или достигнут лимит в 5 страниц.")
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+_DIGITS_RE = re.compile(r'\d+')
+
+
+def url_pattern(url: str) -> str:
+    """
+    Сводит URL к шаблону маршрута: хост + путь, где числа заменены на {n}.
+    Например, /catalog--noutbuki/26895412/list -> /catalog--noutbuki/{n}/list.
+    """
+    parsed = urlparse(url)
+    return f"{parsed.netloc}{_DIGITS_RE.sub('{n}', parsed.path)}"
+
+
+class RouteStats:
+    """
+    Статистика по шаблонам URL: сколько раз простой HTTP-запрос дал пригодную
+    страницу, а сколько раз пришлось обращаться к браузеру.
+    Сохраняется в JSON-файл, чтобы знания о маршрутах переживали перезапуск.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.routes: Dict[str, Dict[str, int]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.routes = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке статистики маршрутов {path}: {e}", exc_info=True)
+
+    def get(self, pattern: str) -> Dict[str, int]:
+        return self.routes.setdefault(pattern, {'http_ok': 0, 'http_fail': 0, 'browser_only': 0})
+
+    def record(self, pattern: str, key: str) -> None:
+        self.get(pattern)[key] += 1
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.routes, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении статистики маршрутов {self.path}: {e}", exc_info=True)
+
+
+class TieredFetchMiddleware:
+    """
+    Downloader middleware: сначала простой HTTP-запрос, браузер - только при необходимости.
+
+    Запрос Playwright сначала уходит без браузера. Если в ответе нет ожидаемых
+    элементов (например, ни одной карточки searchOrganic), запрос повторяется
+    через Playwright. Для шаблонов URL, которым HTTP почти никогда не хватает,
+    простой запрос пропускается сразу (с периодической перепроверкой).
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.validate_selector = settings.get('TIERED_FETCH_VALIDATE_SELECTOR')
+        self.min_samples = settings.getint('TIERED_FETCH_MIN_SAMPLES', 5)
+        self.min_success_rate = settings.getfloat('TIERED_FETCH_MIN_SUCCESS_RATE', 0.5)
+        self.reprobe_every = settings.getint('TIERED_FETCH_REPROBE_EVERY', 20)
+        self.route_stats = RouteStats(settings.get('TIERED_FETCH_STATE_FILE'))
+        self.stats = crawler.stats
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('TIERED_FETCH_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def spider_closed(self, spider):
+        self.route_stats.save()
+
+    def needs_browser(self, pattern: str) -> bool:
+        """
+        По накопленной статистике решает, стоит ли сразу идти в браузер.
+        """
+        route = self.route_stats.get(pattern)
+        attempts = route['http_ok'] + route['http_fail']
+        if attempts < self.min_samples:
+            return False
+        if route['http_ok'] / attempts >= self.min_success_rate:
+            return False
+        # Время от времени все же пробуем HTTP: сайт мог начать отдавать готовый HTML
+        route['browser_only'] += 1
+        return not (self.reprobe_every and route['browser_only'] % self.reprobe_every == 0)
+
+    def is_valid(self, request, response) -> bool:
+        selector = request.meta.get('tiered_fetch_validate_selector', self.validate_selector)
+        if response.status != 200 or not hasattr(response, 'css'):
+            return False
+        return not selector or bool(response.css(selector))
+
+    def process_request(self, request, spider):
+        meta = request.meta
+        # Страница, с которой паук работает сам, есть только у браузера
+        if not meta.get('playwright') or meta.get('playwright_include_page') or meta.get('tiered_fetch_escalated'):
+            return None
+
+        pattern = url_pattern(request.url)
+        if self.needs_browser(pattern):
+            self.stats.inc_value('tiered_fetch/browser_direct')
+            return None
+
+        meta['playwright'] = False
+        meta['tiered_fetch_http'] = True
+        return None
+
+    def process_response(self, request, response, spider):
+        if not request.meta.pop('tiered_fetch_http', False):
+            return response
+
+        pattern = url_pattern(request.url)
+        if self.is_valid(request, response):
+            self.route_stats.record(pattern, 'http_ok')
+            self.stats.inc_value('tiered_fetch/http_ok')
+            return response
+
+        self.route_stats.record(pattern, 'http_fail')
+        self.stats.inc_value('tiered_fetch/escalated')
+        logger.info(f"HTTP-ответ для {request.url} не прошел проверку, повторяем через браузер.")
+        meta = dict(request.meta, playwright=True, tiered_fetch_escalated=True)
+        return request.replace(meta=meta, dont_filter=True)
+
+    def process_exception(self, request, exception, spider):
+        if not request.meta.pop('tiered_fetch_http', False):
+            return None
+
+        self.route_stats.record(url_pattern(request.url), 'http_fail')
+        self.stats.inc_value('tiered_fetch/escalated')
+        meta = dict(request.meta, playwright=True, tiered_fetch_escalated=True)
+        return request.replace(meta=meta, dont_filter=True)
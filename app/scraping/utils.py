@@ -1,153 +1,392 @@
 import asyncio
 import logging
 import csv
-import os
-import json
-import time
+import hashlib
 import sys
-from typing import List, Dict
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional
 
 # В Windows для Scrapy и asyncio требуется SelectorEventLoop
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from scrapy.crawler import CrawlerRunner
-from scrapy.utils.project import get_project_settings
-from twisted.internet import reactor, defer
-from twisted.internet.task import deferLater
+from app.scraping.cache import ResultCache, normalize_query
+from app.scraping.checkpoint import CrawlJob, item_key, merge_items
+from app.scraping.decomposer import LaptopDecomposer
+from app.scraping.crawl_service import crawl_service
+from app.scraping.worker_pool import CrawlWorkerPool
+from app.scraping.query_planner import QueryPlanner
 from app.scraping.spiders.yandex_market import YandexMarketSpider
 
 logger = logging.getLogger(__name__)
 
-# Константа для времени жизни кэша (в секундах) - 1 час
-CACHE_TTL = 3600
+def get_cache_key(search_query: str) -> str:
+    """
+    Ключ кэша результатов для поискового запроса (без учета регистра,
+    лишних пробелов и порядка слов).
+    """
+    return f"search:{normalize_query(search_query)}"
 
-def get_cache_filename(search_query: str) -> str:
+def get_target_cache_key(label: str, url: str) -> str:
     """
-    Генерирует имя файла для кэширования результатов поиска.
+    Ключ кэша для цели наблюдения. В ключ входит и URL:
+    при изменении цели или словарей фильтров старый кэш не подходит.
     """
-    # Очищаем поисковый запрос от недопустимых символов для имени файла
-    safe_query = "".join(c for c in search_query if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    return f"cache_{safe_query}.json"
+    return f"target:{normalize_query(label)}:{hashlib.md5(url.encode('utf-8')).hexdigest()[:8]}"
 
-def is_cache_valid(cache_filename: str) -> bool:
+class SpiderRunner:
     """
-    Проверяет, действителен ли кэш (не истек ли срок его жизни).
+    Класс для запуска пауков Scrapy в асинхронном режиме без использования subprocess.
+    Сами обходы выполняет долгоживущий сервис CrawlService: реактор и браузер
+    запускаются один раз, поэтому повторные запросы в том же процессе работают.
+    Если в настройках задан CRAWL_WORKER_PROCESSES, обходы уходят в пул
+    рабочих процессов CrawlWorkerPool с тем же интерфейсом.
     """
-    if not os.path.exists(cache_filename):
-        return False
+    def __init__(self, service=None):
+        self.service = service or crawl_service
     
-    # Проверяем время модификации файла
-    file_mod_time = os.path.getmtime(cache_filename)
-    current_time = time.time()
+    def _checkpoint_job(self, spider_kwargs: Dict) -> Optional[CrawlJob]:
+        """
+        Возвращает контрольную точку обхода или None, если она выключена
+        или такой же обход уже выполняется.
+        """
+        settings = self.service.settings
+        if not settings.getbool('CHECKPOINT_ENABLED'):
+            return None
+        job = CrawlJob.for_spider(settings.get('CHECKPOINT_DIR'), YandexMarketSpider.name, spider_kwargs,
+                                  max_age=settings.getfloat('CHECKPOINT_MAX_AGE') or None)
+        if not job.acquire():
+            logger.info("Обход с теми же аргументами уже выполняется, запускаем без контрольной точки.")
+            return None
+        return job
     
-    return (current_time - file_mod_time) < CACHE_TTL
+    async def _crawl_with_retries(self, description: str, settings_overrides: Dict = None, **spider_kwargs) -> List[Dict]:
+        """
+        Запускает YandexMarketSpider с повторными попытками при ошибках.
+        Состояние обхода сохраняется в контрольной точке (CHECKPOINT_DIR): повторная
+        попытка или следующий запуск после остановки процесса продолжают обход.
+        """
+        max_retries = 3
+        retry_delay = 5  # seconds
+        
+        job = self._checkpoint_job(spider_kwargs)
+        if job is not None:
+            settings_overrides = {**(settings_overrides or {}), **job.settings_overrides()}
+        
+        try:
+            for attempt in range(max_retries):
+                try:
+                    logger.info(f"Запуск паука в асинхронном режиме для {description} (попытка {attempt + 1}/{max_retries})")
+                    
+                    previous_items = job.load_items() if job is not None else []
+                    items = await self.service.crawl(YandexMarketSpider, settings_overrides=settings_overrides, **spider_kwargs)
+                    if previous_items:
+                        logger.info(f"Обход продолжен с контрольной точки: {len(previous_items)} товаров "
+                                    f"собраны до остановки, {len(items)} - сейчас.")
+                        items = merge_items(previous_items, items)
+                    if job is not None:
+                        job.finish()
+                    
+                    logger.info(f"Скрапинг для {description} успешно завершен. Найдено {len(items)} товаров.")
+                    return items
+                    
+                except Exception as e:
+                    logger.error(f"Ошибка при запуске паука (попытка {attempt + 1}/{max_retries}): {e}", exc_info=True)
+                    if attempt < max_retries - 1:
+                        logger.info(f"Ожидание {retry_delay} секунд перед следующей попыткой...")
+                        await asyncio.sleep(retry_delay)
+                    else:
+                        logger.error(f"Все попытки запуска паука для {description} исчерпаны.")
+                        return []
+        finally:
+            if job is not None:
+                job.release()
+    
+    async def run_spider(self, search_query: str) -> List[Dict]:
+        """
+        Запускает паука в асинхронном режиме и возвращает результаты.
+        """
+        return await self._crawl_with_retries(f"запроса '{search_query}'", search_query=search_query)
+    
+    def stream_spider(self, search_query: str, job: Optional[CrawlJob] = None):
+        """
+        Запускает паука и возвращает асинхронный итератор по элементам по мере их сбора.
+        С контрольной точкой job обход продолжается с места, где остановился прошлый запуск.
+        """
+        logger.info(f"Запуск паука в потоковом режиме для запроса '{search_query}'")
+        settings_overrides = job.settings_overrides() if job is not None else None
+        return self.service.stream(YandexMarketSpider, settings_overrides=settings_overrides,
+                                   search_query=search_query)
+    
+    async def run_spider_incremental(self, search_query: str) -> List[Dict]:
+        """
+        Инкрементальный обход: возвращает только новые и изменившиеся по цене предложения
+        и останавливает пагинацию, когда страницы перестают приносить изменения.
+        """
+        return await self._crawl_with_retries(
+            f"инкрементального обновления '{search_query}'",
+            search_queries=[search_query],
+            incremental=True,
+        )
+    
+    async def run_spider_multi(self, search_queries: List[str], max_concurrency: int = None) -> Dict[str, List[Dict]]:
+        """
+        Запускает один обход, в котором каждый запрос - отдельный стартовый запрос паука.
+        Все запросы делят общий бюджет параллельности (CONCURRENT_REQUESTS).
+        
+        Returns:
+            Dict[str, List[Dict]]: Результаты, сгруппированные по запросу, который их нашел.
+        """
+        settings_overrides = {'CONCURRENT_REQUESTS': max_concurrency} if max_concurrency else None
+        items = await self._crawl_with_retries(
+            f"{len(search_queries)} запросов в одном обходе",
+            settings_overrides=settings_overrides,
+            search_queries=search_queries,
+        )
+        
+        return self._group_by_query(items, search_queries)
+    
+    async def run_spider_urls(self, search_urls: Dict[str, str], max_concurrency: int = None) -> Dict[str, List[Dict]]:
+        """
+        Запускает один обход по готовым URL поиска с фильтрами (название цели -> URL).
+        
+        Returns:
+            Dict[str, List[Dict]]: Результаты, сгруппированные по названию цели.
+        """
+        settings_overrides = {'CONCURRENT_REQUESTS': max_concurrency} if max_concurrency else None
+        items = await self._crawl_with_retries(
+            f"{len(search_urls)} целей наблюдения в одном обходе",
+            settings_overrides=settings_overrides,
+            search_urls=search_urls,
+        )
+        return self._group_by_query(items, list(search_urls))
+    
+    @staticmethod
+    def _group_by_query(items: List[Dict], queries: List[str]) -> Dict[str, List[Dict]]:
+        results = {query: [] for query in queries}
+        for item in items:
+            query = item.get('query')
+            if query in results:
+                results[query].append(item)
+        return results
 
-def load_from_cache(cache_filename: str) -> List[Dict]:
+def create_crawl_backend():
     """
-    Загружает результаты из кэш-файла.
+    Выбирает, где выполнять обходы: в пуле процессов или в текущем процессе.
     """
-    try:
-        with open(cache_filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            logger.info(f"Результаты загружены из кэша: {cache_filename}")
-            return data
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке данных из кэша {cache_filename}: {e}", exc_info=True)
-        return []
+    worker_processes = crawl_service.settings.getint('CRAWL_WORKER_PROCESSES')
+    if worker_processes > 0:
+        logger.info(f"Обходы будут выполняться в пуле из {worker_processes} процессов.")
+        return CrawlWorkerPool(processes=worker_processes)
+    return crawl_service
+
+# Глобальный экземпляр runner
+spider_runner = SpiderRunner(service=create_crawl_backend())
+
+# Кэш результатов: LRU в памяти поверх SQLite, одинаковые одновременные обходы объединяются
+result_cache = ResultCache.from_settings(crawl_service.settings)
 
-def save_to_cache(cache_filename: str, data: List[Dict]) -> None:
+# Общий экземпляр декомпозиции для всех отчетов: уже разобранные названия берутся из кэша,
+# большие выгрузки разбираются в пуле процессов
+laptop_decomposer = LaptopDecomposer.from_settings(crawl_service.settings)
+
+async def run_spider(search_query: str) -> List[Dict]:
     """
-    Сохраняет результаты в кэш-файл.
+    Запускает паука в асинхронном режиме и возвращает результаты.
+    Использует кэширование для избежания повторных запросов; если такой же
+    запрос уже обходится, ждет его результат вместо второго обхода.
+    Устаревший, но не слишком старый результат возвращается сразу
+    (CachedResult с возрастом), а обход для обновления кэша идет в фоне.
     """
-    try:
-        with open(cache_filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            logger.info(f"Результаты сохранены в кэш: {cache_filename}")
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении данных в кэш {cache_filename}: {e}", exc_info=True)
+    return await result_cache.get_or_fetch(
+        get_cache_key(search_query),
+        lambda: spider_runner.run_spider(search_query),
+        query_class='search',
+    )
 
-class SpiderRunner:
+async def stream_spider(search_query: str, cache_info: Optional[Dict] = None,
+                        allow_stale: Optional[bool] = None) -> AsyncIterator[Dict]:
     """
-    Класс для запуска пауков Scrapy в асинхронном режиме без использования subprocess.
+    Отдает товары по мере сбора, не дожидаясь конца обхода:
+
+        async for item in stream_spider(search_query):
+            ...
+
+    Если потребитель отстает, обход приостанавливается (обратное давление).
+    При действительном кэше элементы отдаются из кэша, а если такой же запрос
+    уже обходится - из его результата. Устаревший кэш (в пределах
+    RESULT_CACHE_MAX_STALE) отдается сразу и обновляется в фоне; возраст
+    отданных из кэша данных записывается в cache_info ('age', 'stale').
+    allow_stale=False отключает выдачу устаревшего кэша для этого вызова.
+    Обход идет с контрольной точкой (CHECKPOINT_DIR): после остановки бота
+    сначала отдаются товары, собранные до нее, а обход продолжается с места
+    остановки; повторы со страницы, которая была в работе, отбрасываются.
+    Без контрольной точки обход повторяется при ошибке, только если ни одного
+    элемента еще не было отдано.
     """
-    def __init__(self):
-        self.runner = None
-        self.items = []
+    cache_key = get_cache_key(search_query)
+    if allow_stale is None:
+        allow_stale = result_cache.stale_while_revalidate
+    cached = result_cache.lookup(cache_key, query_class='search', allow_stale=allow_stale)
+    if cached is not None:
+        if cached.stale:
+            result_cache.revalidate(cache_key, lambda: spider_runner.run_spider(search_query))
+        if cache_info is not None:
+            cache_info.update(age=cached.age, stale=cached.stale)
+        for item in cached:
+            yield item
+        return
     
-    def item_scraped(self, item, response, spider):
-        """Callback для обработки собранных элементов."""
-        self.items.append(item)
+    future, leader = result_cache.begin(cache_key)
+    if not leader:
+        logger.info(f"Обход для запроса '{search_query}' уже выполняется, ждем его результат.")
+        for item in await asyncio.wrap_future(future):
+            yield item
+        return
     
-    async def run_spider(self, search_query: str) -> List[Dict]:
-        """
-        Запускает паука в асинхронном режиме и возвращает результаты.
-        """
-        max_retries = 3
-        retry_delay = 5  # seconds
+    max_retries = 3
+    retry_delay = 5  # seconds
+    items = []
+    seen = set()
+    completed = False
+    job = spider_runner._checkpoint_job({'search_query': search_query})
+    try:
+        previous_items = job.load_items() if job is not None else []
+        if previous_items:
+            logger.info(f"Обход для запроса '{search_query}' продолжается с контрольной точки: "
+                        f"{len(previous_items)} товаров собраны до остановки.")
+        for item in previous_items:
+            key = item_key(item)
+            if key not in seen:
+                seen.add(key)
+                items.append(item)
+                yield item
         
         for attempt in range(max_retries):
+            item_stream = spider_runner.stream_spider(search_query, job)
             try:
-                logger.info(f"Запуск паука в асинхронном режиме для запроса: {search_query} (попытка {attempt + 1}/{max_retries})")
-                
-                # Очищаем список элементов перед новым запуском
-                self.items = []
-                
-                # Создаем новый процесс для каждого запуска
-                settings = get_project_settings()
-                settings.set('SPIDER_MODULES', ['app.scraping.spiders'])
-                # Отключаем логи Scrapy, чтобы не засорять вывод
-                settings.set('LOG_LEVEL', 'ERROR')
-                
-                from scrapy.crawler import CrawlerProcess
-                process = CrawlerProcess(settings)
-                
-                # Подписываемся на событие item_scraped
-                from scrapy import signals
-                from scrapy.signalmanager import dispatcher
-                dispatcher.connect(self.item_scraped, signal=signals.item_scraped)
-                
-                # Запускаем паука
-                process.crawl(YandexMarketSpider, search_query=search_query)
-                process.start()  # Блокирующий вызов
-                
-                logger.info(f"Скрапинг для '{search_query}' успешно завершен. Найдено {len(self.items)} товаров.")
-                return self.items
-                
+                async for item in item_stream:
+                    key = item_key(item)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    items.append(item)
+                    yield item
+                completed = True
+                break
             except Exception as e:
-                logger.error(f"Ошибка при запуске паука (попытка {attempt + 1}/{max_retries}): {e}", exc_info=True)
-                if attempt < max_retries - 1:
-                    logger.info(f"Ожидание {retry_delay} секунд перед следующей попыткой...")
-                    await asyncio.sleep(retry_delay)
-                else:
-                    logger.error(f"Все попытки запуска паука для запроса '{search_query}' исчерпаны.")
-                    return []
+                logger.error(f"Ошибка потокового обхода (попытка {attempt + 1}/{max_retries}): {e}", exc_info=True)
+                # С контрольной точкой повтор продолжает обход, а отданные товары отбрасываются как повторы
+                if (items and job is None) or attempt == max_retries - 1:
+                    logger.error(f"Потоковый обход для запроса '{search_query}' прерван.")
+                    return
+                await asyncio.sleep(retry_delay)
+            finally:
+                await item_stream.aclose()
+        
+        if job is not None:
+            job.finish()
+        logger.info(f"Потоковый обход для запроса '{search_query}' завершен. Найдено {len(items)} товаров.")
+    finally:
+        if job is not None:
+            job.release()
+        # Ожидающие получают и неполный результат, но в кэш попадает только полный
+        result_cache.complete(cache_key, future, items, store=completed)
 
-# Глобальный экземпляр runner
-spider_runner = SpiderRunner()
+async def _crawl_coalesced(cache_keys: Dict[str, str], query_class: str,
+                           crawl: Callable[[List[str]], Awaitable[Dict[str, List[Dict]]]]) -> Dict[str, List[Dict]]:
+    """
+    Общая часть run_spider_multi и run_spider_targets.
+    cache_keys: название (запрос или цель) -> ключ кэша.
+    Названия с действительным кэшем берутся из кэша. Для остальных
+    регистрируется обход (result_cache.begin): названия, которые уже обходит
+    другой вызов, ждут его результат, а один обход crawl(названия) запускается
+    только для тех, где этот вызов стал ведущим.
+    """
+    results = {}
+    leading = {}
+    waiting = {}
+    for name, cache_key in cache_keys.items():
+        cached = result_cache.get(cache_key, query_class=query_class)
+        if cached is not None:
+            results[name] = cached
+            continue
+        future, leader = result_cache.begin(cache_key)
+        (leading if leader else waiting)[name] = future
+    
+    if waiting:
+        logger.info(f"Уже обходятся другим вызовом, ждем их результат: {list(waiting)}")
+    
+    if leading:
+        try:
+            crawled = await crawl(list(leading))
+        except BaseException as e:
+            for name, future in leading.items():
+                result_cache.complete(cache_keys[name], future, error=e)
+            raise
+        for name, future in leading.items():
+            items = crawled.get(name, [])
+            # Пустой результат ожидающие получают, но в кэш он не попадает
+            result_cache.complete(cache_keys[name], future, items)
+            results[name] = items
+    
+    for name, future in waiting.items():
+        try:
+            results[name] = await asyncio.wrap_future(future) or []
+        except Exception as e:
+            logger.error(f"Обход '{name}', запущенный другим вызовом, завершился ошибкой: {e}")
+            results[name] = []
+    return results
 
-async def run_spider(search_query: str) -> List[Dict]:
+async def run_spider_multi(search_queries: List[str]) -> Dict[str, List[Dict]]:
     """
-    Запускает паука в асинхронном режиме и возвращает результаты.
-    Использует кэширование для избежания повторных запросов.
+    Запускает все запросы одним параллельным обходом и возвращает результаты по каждому запросу.
+    Запросы с действительным кэшем в обход не попадают, а запросы, которые уже
+    обходятся (например, фоновым обновлением), ждут результат того обхода.
     """
-    # Генерируем имя файла для кэша
-    cache_filename = get_cache_filename(search_query)
+    settings = spider_runner.service.settings
     
-    # Проверяем, есть ли действительный кэш
-    if is_cache_valid(cache_filename):
-        logger.info(f"Найден действительный кэш для запроса '{search_query}'. Загружаем данные из кэша.")
-        return load_from_cache(cache_filename)
+    async def crawl(queries_to_crawl: List[str]) -> Dict[str, List[Dict]]:
+        logger.info(f"Запускаем один обход для {len(queries_to_crawl)} запросов без кэша: {queries_to_crawl}")
+        return await spider_runner.run_spider_multi(
+            queries_to_crawl,
+            max_concurrency=settings.getint('MULTI_QUERY_CONCURRENT_REQUESTS') or None,
+        )
     
-    # Если кэш недействителен или отсутствует, запускаем паука
-    logger.info(f"Кэш для запроса '{search_query}' отсутствует или недействителен. Запускаем паука.")
-    results = await spider_runner.run_spider(search_query)
+    cache_keys = {search_query: get_cache_key(search_query) for search_query in search_queries}
+    results = await _crawl_coalesced(cache_keys, 'search', crawl)
     
-    # Сохраняем результаты в кэш
-    if results:
-        save_to_cache(cache_filename, results)
+    # Сохраняем порядок запросов, переданный вызывающим кодом
+    return {search_query: results.get(search_query, []) for search_query in search_queries}
+
+async def run_spider_incremental(search_query: str) -> List[Dict]:
+    """
+    Инкрементально обновляет данные по запросу, минуя кэш результатов.
+    Снимком служит таблица products, поэтому вызывающий код должен сохранить
+    полученные изменения (save_products_to_db), чтобы следующий обход сравнивался с ними.
+    """
+    logger.info(f"Запускаем инкрементальное обновление для запроса '{search_query}'.")
+    return await spider_runner.run_spider_incremental(search_query)
+
+async def run_spider_targets(targets: Dict[str, Dict[str, str]]) -> Dict[str, List[Dict]]:
+    """
+    Собирает товары по целям наблюдения (название -> {'brand': ..., 'series': ..., 'cpu': ..., ...}).
+    QueryPlanner превращает каждую цель в URL поиска с фильтрами на стороне сайта,
+    и все цели без действительного кэша обходятся одним параллельным обходом.
+    """
+    settings = spider_runner.service.settings
+    search_urls = QueryPlanner.from_settings(settings).plan_all(targets)
     
-    return results
+    async def crawl(labels: List[str]) -> Dict[str, List[Dict]]:
+        logger.info(f"Запускаем один обход для {len(labels)} целей без кэша: {labels}")
+        return await spider_runner.run_spider_urls(
+            {label: search_urls[label] for label in labels},
+            max_concurrency=settings.getint('MULTI_QUERY_CONCURRENT_REQUESTS') or None,
+        )
+    
+    cache_keys = {label: get_target_cache_key(label, url) for label, url in search_urls.items()}
+    results = await _crawl_coalesced(cache_keys, 'target', crawl)
+    
+    return {label: results.get(label, []) for label in targets}
 
 def save_to_csv(items, filename):
     """
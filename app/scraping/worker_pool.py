@@ -0,0 +1,307 @@
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from scrapy.utils.project import get_project_settings
+
+from .crawl_service import CrawlHandle, ItemStream
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в секундах) диспетчер проверяет, живы ли рабочие процессы
+WORKER_POLL_INTERVAL = 1.0
+
+
+def _listen_for_cancel(control_queue, current: Dict[str, Any], lock: threading.Lock) -> None:
+    """
+    Поток рабочего процесса: получает от родителя ('cancel', job_id)
+    и отменяет обход, если это текущее задание процесса.
+    """
+    while True:
+        message = control_queue.get()
+        if message is None:
+            return
+        kind, job_id = message
+        with lock:
+            handle = current.get('handle') if current.get('job_id') == job_id else None
+        if kind == 'cancel' and handle is not None:
+            handle.cancel()
+
+
+def _worker_main(worker_id: int, job_queue, result_queue, control_queue, max_jobs: int) -> None:
+    """
+    Тело рабочего процесса: свой реактор и браузер (через CrawlService),
+    задания берутся из общей очереди, элементы сразу отправляются родителю.
+    По своей очереди control_queue процесс получает отмену текущего задания.
+    После max_jobs заданий процесс завершается, чтобы освободить память Chromium.
+    """
+    from app.scraping.crawl_service import CrawlService
+
+    service = CrawlService()
+    jobs_done = 0
+    current: Dict[str, Any] = {}
+    current_lock = threading.Lock()
+    threading.Thread(target=_listen_for_cancel, args=(control_queue, current, current_lock),
+                     name="crawl-worker-control", daemon=True).start()
+
+    try:
+        while not max_jobs or jobs_done < max_jobs:
+            job = job_queue.get()
+            if job is None:
+                break
+
+            job_id, spider_cls, spider_kwargs, settings_overrides = job
+            handle = CrawlHandle()
+            # Текущее задание известно до сообщения 'started': отмена после него не потеряется
+            with current_lock:
+                current.update(job_id=job_id, handle=handle)
+            result_queue.put(('started', job_id, worker_id))
+
+            def send_item(item, job_id=job_id):
+                result_queue.put(('item', job_id, item))
+
+            try:
+                items = asyncio.run(service.crawl(spider_cls, settings_overrides=settings_overrides,
+                                                  on_item=send_item, handle=handle, **spider_kwargs))
+                result_queue.put(('done', job_id, len(items)))
+            except Exception as e:
+                result_queue.put(('error', job_id, f"{type(e).__name__}: {e}"))
+            with current_lock:
+                current.clear()
+            jobs_done += 1
+    finally:
+        service.stop()
+        result_queue.put(('retired', None, worker_id))
+
+
+class _Job:
+    """
+    Состояние задания на стороне родительского процесса.
+    """
+    def __init__(self, on_item: Optional[Callable[[Dict[str, Any]], None]] = None, collect_items: bool = True):
+        self.future = concurrent.futures.Future()
+        self.items = []
+        self.on_item = on_item
+        self.collect_items = collect_items
+        self.worker_id = None
+        self.cancelled = False
+
+
+class CrawlWorkerPool:
+    """
+    Пул рабочих процессов для обхода сайтов.
+
+    Каждый процесс держит свой реактор и свой браузер, поэтому рендеринг
+    Playwright и разбор страниц Scrapy распределяются по ядрам процессора.
+    Задания берутся из общей очереди, результаты приходят родителю по мере сбора.
+    Интерфейс crawl() совпадает с CrawlService.crawl().
+    """
+    def __init__(self, processes: Optional[int] = None, max_jobs_per_worker: Optional[int] = None):
+        self.settings = get_project_settings()
+        self.processes = processes or self.settings.getint('CRAWL_WORKER_PROCESSES') or multiprocessing.cpu_count()
+        if max_jobs_per_worker is None:
+            max_jobs_per_worker = self.settings.getint('CRAWL_WORKER_MAX_JOBS', 20)
+        self.max_jobs_per_worker = max_jobs_per_worker
+
+        # spawn: дочерний процесс не должен наследовать реактор и потоки родителя
+        self._context = multiprocessing.get_context('spawn')
+        self._job_queue = None
+        self._result_queue = None
+        self._workers = {}
+        # Очередь отмен каждого рабочего процесса
+        self._control_queues = {}
+        self._jobs = {}
+        self._job_ids = itertools.count(1)
+        self._worker_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._stopping = False
+
+    def start(self) -> None:
+        """
+        Запускает рабочие процессы и поток-диспетчер результатов.
+        """
+        with self._lock:
+            if self._dispatcher is not None:
+                return
+            self._stopping = False
+            self._job_queue = self._context.Queue()
+            self._result_queue = self._context.Queue()
+            for _ in range(self.processes):
+                self._spawn_worker()
+            self._dispatcher = threading.Thread(target=self._dispatch_results, name="crawl-pool-dispatcher", daemon=True)
+            self._dispatcher.start()
+        logger.info(f"Пул обхода запущен: {self.processes} процессов, "
+                    f"перезапуск после {self.max_jobs_per_worker or 'бесконечного числа'} заданий.")
+
+    def stop(self) -> None:
+        """
+        Останавливает рабочие процессы. Незавершенные задания завершаются ошибкой.
+        """
+        with self._lock:
+            if self._dispatcher is None:
+                return
+            self._stopping = True
+            for _ in self._workers:
+                self._job_queue.put(None)
+            workers = list(self._workers.values())
+
+        for process in workers:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+        with self._lock:
+            self._fail_jobs(lambda job: True, "Пул обхода остановлен.")
+            self._workers.clear()
+            self._control_queues.clear()
+            self._dispatcher = None
+        logger.info("Пул обхода остановлен.")
+
+    def _spawn_worker(self) -> None:
+        worker_id = next(self._worker_ids)
+        control_queue = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self._job_queue, self._result_queue, control_queue, self.max_jobs_per_worker),
+            name=f"crawl-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = process
+        self._control_queues[worker_id] = control_queue
+        logger.info(f"Запущен рабочий процесс обхода #{worker_id} (PID {process.pid}).")
+
+    async def crawl(self, spider_cls, settings_overrides: Optional[Dict[str, Any]] = None,
+                    on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    collect_items: bool = True, handle: Optional[CrawlHandle] = None,
+                    **spider_kwargs) -> List[Dict[str, Any]]:
+        """
+        Ставит обход в общую очередь пула и ждет его завершения.
+
+        Args:
+            spider_cls: Класс паука (передается в процесс по ссылке на модуль).
+            settings_overrides (dict, optional): Настройки Scrapy только для этого обхода.
+            on_item (callable, optional): Вызывается для каждого элемента по мере его
+                поступления от рабочего процесса (в потоке-диспетчере).
+            collect_items (bool): Копить ли элементы для возврата.
+            handle (CrawlHandle, optional): Через него обход можно отменить до завершения.
+            **spider_kwargs: Аргументы паука.
+        """
+        self.start()
+        job = _Job(on_item, collect_items)
+        with self._lock:
+            job_id = next(self._job_ids)
+            self._jobs[job_id] = job
+        self._job_queue.put((job_id, spider_cls, spider_kwargs, settings_overrides))
+        if handle is not None:
+            handle.bind(lambda: self.cancel(job_id))
+        return await asyncio.wrap_future(job.future)
+
+    def stream(self, spider_cls, settings_overrides: Optional[Dict[str, Any]] = None,
+               max_buffered_items: Optional[int] = None, **spider_kwargs) -> ItemStream:
+        """
+        Отдает элементы обхода по мере их поступления от рабочего процесса.
+        Движок находится в другом процессе, поэтому обход не приостанавливается:
+        элементы копятся в буфере потока, пока потребитель их не заберет.
+        Если потребитель закрыл поток (aclose), рабочий процесс отменяет обход.
+        """
+        item_stream = ItemStream(max_buffered_items or self.settings.getint('STREAM_MAX_BUFFERED_ITEMS', 100))
+        item_stream.run(self.crawl(spider_cls, settings_overrides, on_item=item_stream.push,
+                                   collect_items=False, handle=item_stream, **spider_kwargs))
+        return item_stream
+
+    def cancel(self, job_id: int) -> None:
+        """
+        Отменяет задание: рабочий процесс, который его выполняет, закрывает паука.
+        Если задание еще ждет в очереди, отмена отправляется, как только процесс его возьмет.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.cancelled = True
+            if job.worker_id is not None:
+                self._send_cancel(job_id, job.worker_id)
+
+    def _send_cancel(self, job_id: int, worker_id: int) -> None:
+        # Вызывается под self._lock
+        control_queue = self._control_queues.get(worker_id)
+        if control_queue is not None:
+            control_queue.put(('cancel', job_id))
+            logger.info(f"Задание {job_id} отменено, отмена отправлена рабочему процессу #{worker_id}.")
+
+    def _dispatch_results(self) -> None:
+        """
+        Поток-диспетчер: раздает сообщения рабочих процессов заданиям
+        и заменяет завершившиеся процессы новыми.
+        """
+        while True:
+            with self._lock:
+                if self._dispatcher is None:
+                    return
+            try:
+                kind, job_id, payload = self._result_queue.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                self._check_workers()
+                continue
+
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if kind == 'started' and job:
+                    job.worker_id = payload
+                    if job.cancelled:
+                        self._send_cancel(job_id, payload)
+                elif kind == 'item' and job and job.collect_items:
+                    job.items.append(payload)
+                elif kind == 'done' and job:
+                    del self._jobs[job_id]
+                    job.future.set_result(job.items)
+                elif kind == 'error' and job:
+                    del self._jobs[job_id]
+                    job.future.set_exception(RuntimeError(payload))
+                elif kind == 'retired':
+                    self._replace_worker(payload)
+
+            if kind == 'item' and job and job.on_item is not None:
+                try:
+                    job.on_item(payload)
+                except Exception as e:
+                    logger.error(f"Ошибка в обработчике элемента задания {job_id}: {e}", exc_info=True)
+
+    def _replace_worker(self, worker_id: int) -> None:
+        """
+        Убирает отработавший процесс и, если пул не останавливается, запускает замену.
+        """
+        process = self._workers.pop(worker_id, None)
+        self._control_queues.pop(worker_id, None)
+        if process is not None:
+            process.join(timeout=30)
+        if not self._stopping:
+            logger.info(f"Рабочий процесс #{worker_id} отработал свой лимит заданий, запускаем замену.")
+            self._spawn_worker()
+
+    def _check_workers(self) -> None:
+        """
+        Находит аварийно завершившиеся процессы: их задания завершаются ошибкой,
+        а сами процессы заменяются новыми.
+        """
+        with self._lock:
+            for worker_id, process in list(self._workers.items()):
+                if process.is_alive():
+                    continue
+                logger.error(f"Рабочий процесс обхода #{worker_id} неожиданно завершился (код {process.exitcode}).")
+                self._fail_jobs(lambda job: job.worker_id == worker_id,
+                                f"Рабочий процесс #{worker_id} завершился во время обхода.")
+                self._replace_worker(worker_id)
+
+    def _fail_jobs(self, predicate: Callable[[_Job], bool], reason: str) -> None:
+        for job_id, job in list(self._jobs.items()):
+            if predicate(job):
+                del self._jobs[job_id]
+                job.future.set_exception(RuntimeError(reason))
@@ -21,12 +21,16 @@ import threading
 
 # config: Наш собственный файл (config.py), где хранятся константы.
 # Импортируем оттуда токен бота и ID пользователя, чтобы не "светить" их в основном коде.
-from ..config import BOT_TOKEN, YOUR_TELEGRAM_CHAT_ID
+from ..config import BOT_TOKEN, YOUR_TELEGRAM_CHAT_ID, SCHEDULER_ENABLED
 
 # handlers: Наш собственный файл (handlers.py), где хранятся обработчики сообщений.
 # Импортируем оттуда функцию регистрации обработчиков.
 from .handlers import register_all_handlers
 
+# scheduler: Наш собственный файл (scheduler.py) с планировщиком, который
+# обновляет отчеты в фоне, чтобы по кнопке "Запрос" сразу отдавать готовый файл.
+from .scheduler import report_scheduler
+
 # --- Начало основного кода ---
 
 # Шаг 1: Подготовка окружения
@@ -93,6 +97,11 @@ def start_bot():
     startup_thread.daemon = True
     startup_thread.start()
     
+    # Запускаем фоновое обновление отчетов (в своем потоке, поллинг не блокирует).
+    if SCHEDULER_ENABLED:
+        print("[Основной поток]: Запуск планировщика отчетов...")
+        report_scheduler.start()
+    
     # Самая важная часть: запуск "поллинга".
     # bot.polling() - это блокирующая функция, которая устанавливает бесконечный цикл.
     # В этом цикле бот постоянно опрашивает серверы Telegram на наличие новых сообщений.
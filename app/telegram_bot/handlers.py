@@ -14,6 +14,7 @@ from .handlers_telegram_utils import send_telegram_message
 from .handlers_data_processing import filter_and_sort_results
 from .handlers_database_utils import save_products_to_db
 from .handlers_reporting import create_results_html
+from .scheduler import report_scheduler
 
 # Настройка логирования
 setup_logging()
@@ -37,13 +38,15 @@ def send_file_handler(message):
     logger.info(f"Получен запрос на файл от пользователя ID: {user_id}, Username: {username}.")
     
     relative_path = "results/results.html"
+    # Запрос повышает приоритет отчета в планировщике; устаревший отчет обновится сразу
+    report_scheduler.record_request("basic")
     
     if os.path.exists(relative_path):
         send_telegram_message(user_id, "Вот ваш файл.", file_path=relative_path)
     else:
         error_message = f"Файл не найден по пути: {relative_path}"
         logger.error(error_message)
-        send_telegram_message(user_id, error_message)
+        send_telegram_message(user_id, "Отчет еще готовится, попробуйте через несколько минут.")
 
 def register_all_handlers(bot):
     """
@@ -1,15 +1,131 @@
 # Этот файл содержит функции для обработки данных
 # Перенесено из app/telegram_bot/handlers.py
 
-def filter_and_sort_results(items, keywords, exclude_keywords=None):
-    """Фильтрует и сортирует список товаров по заданным ключевым словам."""
-    filtered = []
-    for item in items:
-        title_lower = item.get('title', '').lower()
-        # Проверяем, что все ключевые слова есть в названии
-        if all(k in title_lower for k in keywords):
-            # Если есть слова для исключения, проверяем, что их нет
-            if exclude_keywords and any(ex_k in title_lower for ex_k in exclude_keywords):
-                continue
-            filtered.append(item)
-    return sorted(filtered, key=lambda x: x['price'])[:3]
\ No newline at end of file
+import heapq
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+def numeric_price(item: Dict[str, Any]) -> float:
+    """
+    Цена товара числом: из price_numeric (после декомпозиции) или из цифр price.
+    Товары без цены оказываются в конце сортировки.
+    """
+    for key in ('price_numeric', 'price'):
+        value = item.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            digits = ''.join(filter(str.isdigit, value))
+            if digits:
+                return float(digits)
+    return math.inf
+
+
+class TitleIndex:
+    """
+    Инвертированный индекс названий для отбора товаров по ключевым словам.
+
+    Строится один раз на набор товаров и обслуживает любое число правил отбора:
+    - название в нижнем регистре делится по пробелам на слова, для каждого
+      слова хранится множество номеров товаров (posting list);
+    - ключевое слово ищется как подстрока, как и раньше: подходящие товары -
+      объединение списков всех слов словаря, содержащих ключевое слово.
+      Словарь намного меньше числа товаров, а результат запоминается,
+      поэтому одно и то же слово в разных правилах ищется один раз;
+    - по полям attribute_fields (параметры декомпозиции) строятся такие же
+      списки по значениям, для условий правил наблюдения;
+    - обязательные слова и условия пересекаются начиная с самого короткого
+      списка, исключения вычитаются, цена проверяется только у оставшихся,
+      а лучшие по цене выбираются кучей (heapq.nsmallest) без сортировки
+      всех подходящих товаров.
+    """
+    def __init__(self, items: List[Dict[str, Any]], attribute_fields: Iterable[str] = ()):
+        self.items = items
+        self.titles = [(item.get('title') or '').lower() for item in items]
+        self.prices = [numeric_price(item) for item in items]
+        self.postings: Dict[str, Set[int]] = {}
+        # (поле, значение в нижнем регистре) -> номера товаров, для условий на параметры декомпозиции
+        self.attributes: Dict[Tuple[str, str], Set[int]] = {}
+        attribute_fields = tuple(attribute_fields)
+        for item_id, title in enumerate(self.titles):
+            for token in set(title.split()):
+                self.postings.setdefault(token, set()).add(item_id)
+            for field in attribute_fields:
+                value = items[item_id].get(field)
+                if value:
+                    self.attributes.setdefault((field, str(value).lower()), set()).add(item_id)
+        self._matches: Dict[str, Set[int]] = {}
+
+    def matching(self, keyword: str) -> Set[int]:
+        """
+        Номера товаров, в названии которых есть подстрока keyword.
+        """
+        matches = self._matches.get(keyword)
+        if matches is not None:
+            return matches
+        if not keyword or any(char.isspace() for char in keyword):
+            # Подстрока может захватывать несколько слов - проверяем названия целиком
+            matches = {item_id for item_id, title in enumerate(self.titles) if keyword in title}
+        else:
+            matches = set()
+            for token, item_ids in self.postings.items():
+                if keyword in token:
+                    matches |= item_ids
+        self._matches[keyword] = matches
+        return matches
+
+    def with_attribute(self, field: str, values: Iterable[str]) -> Set[int]:
+        """
+        Номера товаров, у которых параметр field равен одному из values (без учета регистра).
+        Поле должно быть в attribute_fields индекса.
+        """
+        matches = set()
+        for value in values:
+            matches |= self.attributes.get((field, str(value).lower()), set())
+        return matches
+
+    def select(self, keywords: Iterable[str], exclude_keywords: Optional[Iterable[str]] = None,
+               attributes: Optional[Dict[str, List[str]]] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None) -> Set[int]:
+        """
+        Номера товаров, в названии которых есть все keywords и нет ни одного из exclude_keywords,
+        параметры совпадают с attributes (поле -> допустимые значения), а цена в заданных границах.
+        """
+        required = [self.matching(keyword) for keyword in keywords]
+        required.extend(self.with_attribute(field, values) for field, values in (attributes or {}).items())
+        required.sort(key=len)
+        if required:
+            selected = set(required[0])
+            for matches in required[1:]:
+                selected &= matches
+                if not selected:
+                    break
+        else:
+            selected = set(range(len(self.items)))
+        for keyword in exclude_keywords or ():
+            if not selected:
+                break
+            selected -= self.matching(keyword)
+        if min_price is not None or max_price is not None:
+            low = -math.inf if min_price is None else min_price
+            high = math.inf if max_price is None else max_price
+            selected = {item_id for item_id in selected if low <= self.prices[item_id] <= high}
+        return selected
+
+    def top(self, item_ids: Iterable[int], limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        limit самых дешевых товаров; при равной цене - в исходном порядке.
+        """
+        best = heapq.nsmallest(limit, item_ids, key=lambda item_id: (self.prices[item_id], item_id))
+        return [self.items[item_id] for item_id in best]
+
+
+def filter_and_sort_results(items, keywords, exclude_keywords=None, index: Optional[TitleIndex] = None, limit: int = 3):
+    """
+    Фильтрует товары по заданным ключевым словам и возвращает limit самых дешевых.
+    Для нескольких правил над одним набором товаров передавайте общий index (TitleIndex(items)).
+    """
+    if index is None:
+        index = TitleIndex(items)
+    return index.top(index.select(keywords, exclude_keywords), limit)
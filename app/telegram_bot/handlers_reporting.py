@@ -4,14 +4,23 @@
 import logging
 import os
 from datetime import datetime
-from ..scraping.utils import run_spider, save_to_csv
-from ..scraping.decomposer import LaptopDecomposer
+from ..scraping.utils import stream_spider, run_spider_targets, save_to_csv, laptop_decomposer
 from .handlers_telegram_utils import send_telegram_message
-from .handlers_data_processing import filter_and_sort_results
+from .watch_rules import select_best_offers
 from .handlers_database_utils import save_products_to_db
 
 logger = logging.getLogger(__name__)
 
+# Сколько товаров сохранять в БД за раз при потоковом сборе
+DB_BATCH_SIZE = 50
+
+# Цели наблюдения расширенного режима (см. app/scraping/query_planner.py)
+WATCH_TARGETS = {
+    "Lenovo ThinkBook 16, Ryzen AI 9 365": {'brand': 'Lenovo', 'series': 'ThinkBook', 'diagonal': '16', 'cpu': 'Ryzen AI 9 365'},
+    "Lenovo ThinkBook 16, Core Ultra 285H": {'brand': 'Lenovo', 'series': 'ThinkBook', 'diagonal': '16', 'cpu': 'Core Ultra 9 285H'},
+    "Lenovo ThinkBook 16, Ryzen AI 7 350": {'brand': 'Lenovo', 'series': 'ThinkBook', 'diagonal': '16', 'cpu': 'Ryzen AI 7 350'},
+}
+
 async def create_results_html(chat_id: str, search_query: str, search_mode: str = "basic"):
     """
     Запускает скрапинг, обрабатывает результаты и отправляет HTML-файл в Telegram.
@@ -27,21 +36,32 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
         logger.info(message)
         send_telegram_message(chat_id, message)
         
-        all_lenovo_laptops = await run_spider(search_query=search_query)
+        # Товары декомпозируются и сохраняются в БД партиями по мере сбора,
+        # не дожидаясь окончания обхода
+        decomposed_laptops = []
+        pending_batch = []
+        # Пользователю можно сразу отдать устаревший кэш; фоновое обновление
+        # планировщика (без chat_id) должно строить отчет по свежим данным
+        cache_info = {}
+        async for laptop in stream_spider(search_query, cache_info=cache_info, allow_stale=bool(chat_id)):
+            pending_batch.append(laptop)
+            if len(pending_batch) >= DB_BATCH_SIZE:
+                decomposed_batch = laptop_decomposer.decompose_all_laptops(pending_batch)
+                save_products_to_db(decomposed_batch)
+                decomposed_laptops.extend(decomposed_batch)
+                pending_batch = []
+        if pending_batch:
+            decomposed_batch = laptop_decomposer.decompose_all_laptops(pending_batch)
+            save_products_to_db(decomposed_batch)
+            decomposed_laptops.extend(decomposed_batch)
         
-        if not all_lenovo_laptops:
+        if not decomposed_laptops:
             message = "Не удалось собрать данные о ноутбуках Lenovo Thinkbook. Поиск остановлен."
             logger.warning(message)
             send_telegram_message(chat_id, message)
             return
 
-        # Декомпозиция
-        decomposer = LaptopDecomposer()
-        message = "Начинаю декомпозицию данных о ноутбуках..."
-        logger.info(message)
-        send_telegram_message(chat_id, message)
-        decomposed_laptops = decomposer.decompose_all_laptops(all_lenovo_laptops)
-        message = f"Декомпозиция завершена. Обработано {len(decomposed_laptops)} ноутбуков."
+        message = f"Сбор и декомпозиция завершены. Обработано {len(decomposed_laptops)} ноутбуков, результаты сохранены в базу данных."
         logger.info(message)
         send_telegram_message(chat_id, message)
 
@@ -49,30 +69,12 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
         save_to_csv(decomposed_laptops, "results/lenovo_laptops.csv")
         logger.info(f"Полный список ноутбуков сохранен в results/lenovo_laptops.csv.")
 
-        # Сохранение в БД
-        message = "Сохраняю результаты в базу данных..."
-        logger.info(message)
-        send_telegram_message(chat_id, message)
-        save_products_to_db(decomposed_laptops)
-        logger.info(f"Полный список ноутбуков сохранен в базу данных.")
-
         # Фильтрация
         message = "Фильтрую и ищу лучшие предложения..."
         logger.info(message)
         send_telegram_message(chat_id, message)
-        models_to_find = {
-            "Thinkbook 16, Ryzen AI 9 365": {'keywords': ['thinkbook', 'ryzen', 'ai', '365'], 'exclude': ['rtx', '5060']},
-            "Thinkbook 16, Core Ultra 285H": {'keywords': ['thinkbook', 'core', 'ultra', '285h'], 'exclude': ['rtx', '5060']},
-            "Thinkbook 16, Ryzen AI 7 350": {'keywords': ['thinkbook', 'ryzen', '350'], 'exclude': ['rtx', '5060']},
-            "Thinkbook 16, Ryzen AI 9 365 + RTX 5060": {'keywords': ['thinkbook', 'ryzen', 'ai', '365', 'rtx', '5060'], 'exclude': None},
-            "Thinkbook 16, Core Ultra 285H + RTX 5060": {'keywords': ['thinkbook', 'core', 'ultra', '285h', 'rtx', '5060'], 'exclude': None},
-            "Thinkbook 16, Ryzen AI 7 350 + RTX 5060": {'keywords': ['thinkbook', 'ryzen', '350', 'rtx', '5060'], 'exclude': None},
-        }
-        
-        final_results = {}
-        for model_name, filters in models_to_find.items():
-            final_results[model_name] = filter_and_sort_results(decomposed_laptops, filters['keywords'], filters['exclude'])
-            logger.info(f"Для модели '{model_name}' найдено {len(final_results[model_name])} лучших предложений.")
+        # Лучшие предложения по правилам наблюдения (общим и правилам этого чата)
+        final_results = select_best_offers(chat_id, decomposed_laptops)
 
         # Сохраняем отфильтрованные результаты в CSV
         filtered_data = []
@@ -137,7 +139,10 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
             logger.info(f"Файл {filepath} был последний раз изменен: {iso_time}")
             
             # Отправляем результат пользователю
-            send_telegram_message(chat_id, "Поиск завершен! Отправляю таблицу с результатами.", file_path=filepath)
+            message = "Поиск завершен! Отправляю таблицу с результатами."
+            if cache_info.get('stale'):
+                message += f" Данные собраны {cache_info['age'] / 60:.0f} мин. назад, обновление уже запущено."
+            send_telegram_message(chat_id, message, file_path=filepath)
             
         else:
             message = f"Файл {filepath} не был найден после сохранения."
@@ -150,34 +155,23 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
         logger.info(message)
         send_telegram_message(chat_id, message)
         
-        # Определяем конкретные комбинации для поиска
-        # Оптимизированная стратегия поиска с меньшим количеством запросов
-        search_combinations = [
-            # Более общие запросы, которые затем фильтруются
-            "lenovo thinkbook 16 ryzen",
-            "lenovo thinkbook 16 core",
-            "lenovo thinkbook 16 rtx",
-            # Дополнительные запросы для охвата всех вариантов
-            "lenovo thinkbook 16 ai 9",
-            "lenovo thinkbook 16 ultra 285",
-            "lenovo thinkbook 16 ai 7",
-        ]
+        # Цели наблюдения: QueryPlanner превращает их в URL поиска с фильтрами,
+        # и сайт сам отбирает подходящие товары. Варианты с RTX 5060 входят
+        # в выдачу по процессору и отделяются при локальной фильтрации
+        message = f"Поиск по {len(WATCH_TARGETS)} целям одновременно..."
+        logger.info(message)
+        send_telegram_message(chat_id, message)
+        results_by_query = await run_spider_targets(WATCH_TARGETS)
         
-        # Собираем данные по каждой комбинации
         all_laptops = []
-        for i, search_query in enumerate(search_combinations, 1):
-            message = f"[{i}/{len(search_combinations)}] Поиск по запросу: *{search_query}*"
-            logger.info(message)
-            send_telegram_message(chat_id, message)
-            
-            laptops = await run_spider(search_query=search_query)
+        for search_query, laptops in results_by_query.items():
             if laptops:
-                message = f"Найдено {len(laptops)} ноутбуков по запросу: *{search_query}*"
+                message = f"Найдено {len(laptops)} ноутбуков по цели: *{search_query}*"
                 logger.info(message)
                 send_telegram_message(chat_id, message)
                 all_laptops.extend(laptops)
             else:
-                message = f"По запросу '{search_query}' ничего не найдено."
+                message = f"По цели '{search_query}' ничего не найдено."
                 logger.warning(message)
                 send_telegram_message(chat_id, message)
         
@@ -204,11 +198,10 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
         send_telegram_message(chat_id, message)
         
         # Декомпозиция
-        decomposer = LaptopDecomposer()
         message = "Начинаю декомпозицию данных о ноутбуках..."
         logger.info(message)
         send_telegram_message(chat_id, message)
-        decomposed_laptops = decomposer.decompose_all_laptops(unique_laptops_list)
+        decomposed_laptops = laptop_decomposer.decompose_all_laptops(unique_laptops_list)
         message = f"Декомпозиция завершена. Обработано {len(decomposed_laptops)} ноутбуков."
         logger.info(message)
         send_telegram_message(chat_id, message)
@@ -228,19 +221,8 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
         message = "Фильтрую и ищу лучшие предложения..."
         logger.info(message)
         send_telegram_message(chat_id, message)
-        models_to_find = {
-            "Thinkbook 16, Ryzen AI 9 365": {'keywords': ['thinkbook', 'ryzen', 'ai', '365'], 'exclude': ['rtx', '5060']},
-            "Thinkbook 16, Core Ultra 285H": {'keywords': ['thinkbook', 'core', 'ultra', '285h'], 'exclude': ['rtx', '5060']},
-            "Thinkbook 16, Ryzen AI 7 350": {'keywords': ['thinkbook', 'ryzen', '350'], 'exclude': ['rtx', '5060']},
-            "Thinkbook 16, Ryzen AI 9 365 + RTX 5060": {'keywords': ['thinkbook', 'ryzen', 'ai', '365', 'rtx', '5060'], 'exclude': None},
-            "Thinkbook 16, Core Ultra 285H + RTX 5060": {'keywords': ['thinkbook', 'core', 'ultra', '285h', 'rtx', '5060'], 'exclude': None},
-            "Thinkbook 16, Ryzen AI 7 350 + RTX 5060": {'keywords': ['thinkbook', 'ryzen', '350', 'rtx', '5060'], 'exclude': None},
-        }
-        
-        final_results = {}
-        for model_name, filters in models_to_find.items():
-            final_results[model_name] = filter_and_sort_results(decomposed_laptops, filters['keywords'], filters['exclude'])
-            logger.info(f"Для модели '{model_name}' найдено {len(final_results[model_name])} лучших предложений.")
+        # Лучшие предложения по правилам наблюдения (общим и правилам этого чата)
+        final_results = select_best_offers(chat_id, decomposed_laptops)
 
         # Сохраняем отфильтрованные результаты в CSV
         filtered_data = []
@@ -305,7 +287,8 @@ async def create_results_html(chat_id: str, search_query: str, search_mode: str
             logger.info(f"Файл {filepath} был последний раз изменен: {iso_time}")
             
             # Отправляем результат пользователю
-            send_telegram_message(chat_id, "Поиск завершен! Отправляю таблицу с результатами.", file_path=filepath)
+            message = "Поиск завершен! Отправляю таблицу с результатами."
+            send_telegram_message(chat_id, message, file_path=filepath)
 
         else:
             message = f"Файл {filepath} не был найден после сохранения."
@@ -26,7 +26,8 @@ def send_telegram_message(chat_id: str, message_text: str, file_path: str = None
         file_path (str, optional): Путь к файлу для отправки. Defaults to None.
     """
     if not chat_id:
-        logger.error("Cannot send message: chat_id is not provided.")
+        # Фоновые обновления отчетов (scheduler.py) выполняются без чата
+        logger.debug("Message not sent: chat_id is not provided.")
         return False
     try:
         logger.info(f"Sending message to chat_id: {chat_id}")
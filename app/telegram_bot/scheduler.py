@@ -0,0 +1,256 @@
+# Этот файл содержит планировщик фонового обновления отчетов
+
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ..config import (SCHEDULED_REPORTS, SCHEDULER_JITTER, SCHEDULER_MAX_CONCURRENT_JOBS,
+                      SCHEDULER_STATE_FILE)
+from .handlers_reporting import create_results_html
+
+logger = logging.getLogger(__name__)
+
+# Как часто планировщик просыпается, даже если ближайший запуск еще не скоро (секунды)
+POLL_INTERVAL = 60
+# Через сколько повторить отчет, который завершился ошибкой (секунды)
+RETRY_DELAY = 600
+
+
+class ScheduledReport:
+    """
+    Отчет, который планировщик обновляет в фоне.
+    """
+    def __init__(self, search_query: str, search_mode: str = "basic", interval: int = 3600):
+        self.search_query = search_query
+        self.search_mode = search_mode
+        self.interval = interval
+        self.key = f"{search_mode}:{search_query}"
+        self.last_run: Optional[float] = None
+        self.next_run = 0.0
+        # Сколько раз отчет запрашивали пользователи (с затуханием после каждого обновления)
+        self.requests = 0.0
+        self.running = False
+
+    def is_stale(self, now: float) -> bool:
+        return self.last_run is None or now - self.last_run >= self.interval
+
+
+class ReportScheduler:
+    """
+    Планировщик фонового обновления отчетов внутри процесса бота.
+
+    - У каждого отчета свой интервал обновления, время следующего запуска
+      сдвигается на случайную долю интервала (jitter), чтобы запуски не совпадали.
+    - Из отчетов, которым пора обновиться, первыми запускаются самые устаревшие
+      и самые востребованные (очередь с приоритетом на heapq).
+    - Одновременно выполняется не больше max_concurrent_jobs фоновых отчетов.
+      Обходы идут через общий CrawlService, поэтому вместе с запросами
+      пользователей они не превышают CRAWL_SERVICE_MAX_PARALLEL_CRAWLS,
+      а оставшиеся слоты остаются для запросов по требованию.
+    - Время последних запусков сохраняется в state_file: после перезапуска
+      пропущенные обновления выполняются сразу, по одному на отчет.
+    """
+    def __init__(self, reports: List[ScheduledReport], state_file: Optional[str] = None,
+                 max_concurrent_jobs: int = 1, jitter: float = 0.1, runner=create_results_html):
+        self.reports: Dict[str, ScheduledReport] = {report.key: report for report in reports}
+        self.state_file = state_file
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.jitter = jitter
+        self.runner = runner
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+
+    @classmethod
+    def from_config(cls) -> 'ReportScheduler':
+        reports = [ScheduledReport(**report) for report in SCHEDULED_REPORTS]
+        return cls(reports, state_file=SCHEDULER_STATE_FILE,
+                   max_concurrent_jobs=SCHEDULER_MAX_CONCURRENT_JOBS, jitter=SCHEDULER_JITTER)
+
+    # --- Управление из других потоков ---
+
+    def start(self) -> None:
+        """
+        Запускает планировщик в отдельном потоке со своим циклом событий.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self.load_state()
+        self._thread = threading.Thread(target=self._thread_main, name="report-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Планировщик отчетов запущен: {', '.join(self.reports)}.")
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def record_request(self, search_mode: str) -> None:
+        """
+        Отмечает, что пользователь запросил отчет. Повышает приоритет отчета,
+        а если он устарел, ставит его в очередь немедленно.
+        """
+        now = time.time()
+        with self._lock:
+            for report in self.reports.values():
+                if report.search_mode != search_mode:
+                    continue
+                report.requests += 1
+                if report.is_stale(now) and not report.running:
+                    report.next_run = min(report.next_run, now)
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- Состояние ---
+
+    def load_state(self) -> None:
+        """
+        Восстанавливает время последних запусков и считает, когда запускать отчеты.
+        """
+        state = {}
+        if self.state_file and os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке состояния планировщика {self.state_file}: {e}", exc_info=True)
+
+        now = time.time()
+        for key, report in self.reports.items():
+            saved = state.get(key, {})
+            report.last_run = saved.get('last_run')
+            report.requests = saved.get('requests', 0.0)
+            if report.last_run is None:
+                report.next_run = now
+            else:
+                # Пропущенный запуск выполняется сразу, но только один раз
+                report.next_run = max(now, self._next_run_after(report, report.last_run))
+                if report.is_stale(now):
+                    logger.info(f"Отчет '{key}' устарел за время простоя, обновим его в первую очередь.")
+
+    def save_state(self) -> None:
+        if not self.state_file:
+            return
+        with self._lock:
+            state = {key: {'last_run': report.last_run, 'requests': report.requests}
+                     for key, report in self.reports.items()}
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+            tmp_path = f"{self.state_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния планировщика {self.state_file}: {e}", exc_info=True)
+
+    # --- Планирование ---
+
+    def _next_run_after(self, report: ScheduledReport, start: float) -> float:
+        return start + report.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    @staticmethod
+    def priority(report: ScheduledReport, now: float) -> float:
+        """
+        Чем больше, тем раньше запуск: устаревание (в интервалах) с поправкой на популярность.
+        """
+        if report.last_run is None:
+            staleness = 10.0
+        else:
+            staleness = min((now - report.last_run) / report.interval, 10.0)
+        return staleness * (1 + math.log1p(report.requests))
+
+    def _pop_due_reports(self, now: float, free_slots: int) -> List[ScheduledReport]:
+        with self._lock:
+            queue = [(-self.priority(report, now), key) for key, report in self.reports.items()
+                     if not report.running and report.next_run <= now]
+            heapq.heapify(queue)
+            due = []
+            while queue and len(due) < free_slots:
+                _, key = heapq.heappop(queue)
+                report = self.reports[key]
+                report.running = True
+                due.append(report)
+            return due
+
+    def _seconds_until_next_run(self, now: float) -> float:
+        with self._lock:
+            pending = [report.next_run for report in self.reports.values() if not report.running]
+        if not pending:
+            return POLL_INTERVAL
+        return min(max(min(pending) - now, 1.0), POLL_INTERVAL)
+
+    # --- Цикл планировщика ---
+
+    def _thread_main(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._run())
+        finally:
+            loop.close()
+
+    async def _run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        running = set()
+
+        while not self._stopping:
+            now = time.time()
+            for report in self._pop_due_reports(now, self.max_concurrent_jobs - len(running)):
+                task = asyncio.create_task(self._run_report(report))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._seconds_until_next_run(now))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def _run_report(self, report: ScheduledReport) -> None:
+        logger.info(f"Фоновое обновление отчета '{report.key}'.")
+        started = time.time()
+        succeeded = False
+        try:
+            # Без chat_id отчет строится молча: сообщения в Telegram не отправляются
+            await self.runner(None, report.search_query, report.search_mode)
+            succeeded = True
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления отчета '{report.key}': {e}", exc_info=True)
+        finally:
+            now = time.time()
+            with self._lock:
+                report.running = False
+                if succeeded:
+                    report.last_run = now
+                    report.requests /= 2
+                    report.next_run = self._next_run_after(report, now)
+                else:
+                    report.next_run = now + min(RETRY_DELAY, report.interval)
+            self.save_state()
+            self._wake()
+        if succeeded:
+            logger.info(f"Отчет '{report.key}' обновлен за {time.time() - started:.0f} сек. "
+                        f"Следующее обновление через {(report.next_run - time.time()) / 60:.0f} мин.")
+
+
+# Глобальный экземпляр планировщика; запускается вместе с ботом
+report_scheduler = ReportScheduler.from_config()
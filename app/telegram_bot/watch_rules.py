@@ -0,0 +1,145 @@
+# Этот файл содержит правила наблюдения: какие предложения попадают в отчет
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..database.database import init_db, SessionLocal
+from ..database.models import WatchRule
+from .handlers_data_processing import TitleIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GROUP = 'ThinkBook 16'
+
+# Общие правила, которыми заполняется пустая таблица watch_rules
+DEFAULT_WATCH_RULES = [
+    {'name': "Thinkbook 16, Ryzen AI 9 365", 'keywords': ['thinkbook', 'ryzen', 'ai', '365'], 'exclude': ['rtx', '5060']},
+    {'name': "Thinkbook 16, Core Ultra 285H", 'keywords': ['thinkbook', 'core', 'ultra', '285h'], 'exclude': ['rtx', '5060']},
+    {'name': "Thinkbook 16, Ryzen AI 7 350", 'keywords': ['thinkbook', 'ryzen', '350'], 'exclude': ['rtx', '5060']},
+    {'name': "Thinkbook 16, Ryzen AI 9 365 + RTX 5060", 'keywords': ['thinkbook', 'ryzen', 'ai', '365', 'rtx', '5060']},
+    {'name': "Thinkbook 16, Core Ultra 285H + RTX 5060", 'keywords': ['thinkbook', 'core', 'ultra', '285h', 'rtx', '5060']},
+    {'name': "Thinkbook 16, Ryzen AI 7 350 + RTX 5060", 'keywords': ['thinkbook', 'ryzen', '350', 'rtx', '5060']},
+]
+
+
+class CompiledWatchRule:
+    """
+    Правило наблюдения в виде, готовом для TitleIndex: слова в нижнем регистре,
+    условия на параметры - списки допустимых значений.
+    """
+    def __init__(self, name: str, keywords: Iterable[str], exclude: Optional[Iterable[str]] = None,
+                 attributes: Optional[Dict[str, Any]] = None, min_price: Optional[float] = None,
+                 max_price: Optional[float] = None, limit: int = 3, group_name: str = DEFAULT_GROUP,
+                 chat_id: Optional[str] = None):
+        self.name = name
+        self.keywords = [keyword.lower() for keyword in keywords or []]
+        self.exclude = [keyword.lower() for keyword in exclude or []]
+        self.attributes = {
+            field: [values] if isinstance(values, str) else list(values)
+            for field, values in (attributes or {}).items()
+        }
+        self.min_price = min_price
+        self.max_price = max_price
+        self.limit = limit
+        self.group_name = group_name
+        self.chat_id = chat_id
+
+    @classmethod
+    def from_model(cls, rule: WatchRule) -> 'CompiledWatchRule':
+        return cls(rule.name, rule.keywords, rule.exclude, rule.attributes, rule.min_price, rule.max_price,
+                   rule.limit or 3, rule.group_name, rule.chat_id)
+
+
+class WatchRuleMatcher:
+    """
+    Набор правил наблюдения, который применяется к товарам отчета.
+
+    Товары проходятся один раз: строится общий TitleIndex по названиям и по всем
+    параметрам, которые встречаются в условиях правил. Каждое правило дальше
+    работает только с множествами номеров товаров (пересечение, вычитание,
+    границы цены) и выбирает лучшие предложения кучей, поэтому новые правила
+    не добавляют проходов по товарам, а одинаковые слова разных правил
+    ищутся в индексе один раз.
+    """
+    def __init__(self, rules: List[CompiledWatchRule]):
+        self.rules = rules
+        self.attribute_fields = sorted({field for rule in rules for field in rule.attributes})
+
+    def evaluate(self, items: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Лучшие предложения по каждому правилу: название правила -> товары.
+        """
+        index = TitleIndex(items, self.attribute_fields)
+        results = {}
+        for rule in self.rules:
+            label = rule.name if rule.name not in results else f"{rule.group_name}: {rule.name}"
+            selected = index.select(rule.keywords, rule.exclude, rule.attributes, rule.min_price, rule.max_price)
+            results[label] = index.top(selected, rule.limit)
+            logger.info(f"Для модели '{label}' найдено {len(results[label])} лучших предложений.")
+        return results
+
+
+def seed_default_watch_rules(db) -> None:
+    """
+    Заполняет пустую таблицу общими правилами DEFAULT_WATCH_RULES.
+    """
+    if db.query(WatchRule).count():
+        return
+    for position, rule in enumerate(DEFAULT_WATCH_RULES):
+        db.add(WatchRule(group_name=DEFAULT_GROUP, position=position, **rule))
+    db.commit()
+    logger.info(f"Добавлено {len(DEFAULT_WATCH_RULES)} правил наблюдения по умолчанию.")
+
+
+def load_watch_rules(chat_id: Optional[str] = None) -> List[CompiledWatchRule]:
+    """
+    Включенные правила для отчета: общие и правила чата chat_id.
+    Если базу прочитать не удалось, используются правила по умолчанию.
+    """
+    init_db()
+    db = SessionLocal()
+    try:
+        seed_default_watch_rules(db)
+        query = db.query(WatchRule).filter(WatchRule.enabled.is_(True))
+        if chat_id:
+            query = query.filter((WatchRule.chat_id.is_(None)) | (WatchRule.chat_id == str(chat_id)))
+        else:
+            query = query.filter(WatchRule.chat_id.is_(None))
+        rules = query.order_by(WatchRule.chat_id.isnot(None), WatchRule.group_name,
+                               WatchRule.position, WatchRule.id).all()
+        return [CompiledWatchRule.from_model(rule) for rule in rules]
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке правил наблюдения: {e}", exc_info=True)
+        db.rollback()
+        return [CompiledWatchRule(group_name=DEFAULT_GROUP, **rule) for rule in DEFAULT_WATCH_RULES]
+    finally:
+        db.close()
+
+
+def add_watch_rule(name: str, keywords: List[str], chat_id: Optional[str] = None, group_name: str = DEFAULT_GROUP,
+                   exclude: Optional[List[str]] = None, attributes: Optional[Dict[str, Any]] = None,
+                   min_price: Optional[float] = None, max_price: Optional[float] = None, limit: int = 3) -> int:
+    """
+    Сохраняет новое правило наблюдения и возвращает его id.
+    """
+    init_db()
+    db = SessionLocal()
+    try:
+        seed_default_watch_rules(db)
+        position = db.query(WatchRule).filter(WatchRule.group_name == group_name).count()
+        rule = WatchRule(name=name, keywords=keywords, chat_id=str(chat_id) if chat_id else None,
+                         group_name=group_name, exclude=exclude or [], attributes=attributes or {},
+                         min_price=min_price, max_price=max_price, limit=limit, position=position)
+        db.add(rule)
+        db.commit()
+        logger.info(f"Добавлено правило наблюдения '{name}' (группа '{group_name}', чат {chat_id}).")
+        return rule.id
+    finally:
+        db.close()
+
+
+def select_best_offers(chat_id: Optional[str], items: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Применяет к товарам отчета правила наблюдения чата (и общие).
+    """
+    return WatchRuleMatcher(load_watch_rules(chat_id)).evaluate(items)
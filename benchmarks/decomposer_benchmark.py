@@ -0,0 +1,122 @@
+"""
+Замер скорости разбора названий ноутбуков: однопроходный TitleTokenizer
+против эталонной реализации на регулярных выражениях.
+
+Запуск из корня проекта:
+    python -m benchmarks.decomposer_benchmark --titles 5000 --csv results/search_results.csv
+
+Перед замером проверяется, что оба способа дают одинаковый результат
+на каждом названии; при расхождении скрипт завершается с ошибкой.
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+from typing import List
+
+from app.scraping.decomposer import LaptopDecomposer
+
+BRANDS = ['Lenovo', 'HP', 'ASUS', 'Acer', 'MSI', 'Huawei', 'Xiaomi', 'Dell', 'Apple']
+SERIES = ['ThinkBook 16', 'IdeaPad Slim 5', 'Legion 5 Pro', 'LOQ 15', 'VivoBook 15', 'ZenBook 14', 'Pavilion 14',
+          'Victus 16', 'Aspire 7', 'Nitro V', 'Katana 15', 'MateBook D 16', 'RedmiBook Pro', 'MacBook Air']
+CPUS = ['Intel Core i5-12450H', 'Intel Core i7-13620H', 'Intel Core i3-1125G4', 'AMD Ryzen 5 5500U',
+        'Ryzen AI 9 365', 'AMD Ryzen 7 7840HS', 'Intel Celeron N4500', 'Intel N100', 'Apple M2', 'R7 8845H']
+SCREENS = ['16"', '15.6"', '14”', '13.3″', "17.3'", '16" 3.2k/165hz', '15.6" FHD IPS', '14" 2.8K OLED']
+MEMORY = ['8Гб', '16Гб', '32 ГБ', '16GB', '8 GB DDR4', '16 Гб LPDDR5']
+STORAGE = ['256Гб SSD', '512Гб SSD', '1Тб', 'SSD 512GB', '1 TB NVMe', '512 ГБ M.2', 'eMMC 128GB']
+GPUS = ['RTX4060', 'GeForce RTX 4050 6GB', 'NVIDIA GTX1650 4 ГБ', 'Intel UHD Graphics', 'Radeon Graphics',
+        'Iris Xe', 'MX550 2GB', 'Radeon 780M', 'Intel Arc A370M']
+TAILS = ['Win 11 Home', 'DOS', 'без ОС', 'Win 11 Pro', '']
+COLORS = ['Серый', 'Серебристый', 'Черный', 'Синий']
+
+
+def generate_titles(count: int, seed: int = 42) -> List[str]:
+    """
+    Синтетические названия в духе карточек Маркета, с перестановками и пропусками параметров.
+    """
+    rnd = random.Random(seed)
+    titles = []
+    for _ in range(count):
+        parts = [
+            f"{rnd.choice(BRANDS)} {rnd.choice(SERIES)}",
+            rnd.choice(CPUS),
+            rnd.choice(SCREENS),
+            f"{rnd.choice(MEMORY)}/{rnd.choice(STORAGE)}",
+            rnd.choice(GPUS),
+            rnd.choice(TAILS),
+            rnd.choice(COLORS),
+        ]
+        head = parts[:1]
+        rest = [part for part in parts[1:] if part and rnd.random() > 0.15]
+        rnd.shuffle(rest)
+        code = ''.join(rnd.choice('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789') for _ in range(10))
+        titles.append(f"{rnd.choice(['Ноутбук ', ''])}{', '.join(head + rest)} [{code}]")
+    return titles
+
+
+def load_titles(path: str) -> List[str]:
+    """
+    Названия из CSV с результатами обхода (колонка title).
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return [row['title'] for row in csv.DictReader(f) if row.get('title')]
+
+
+def measure(decomposer: LaptopDecomposer, titles: List[str], repeat: int) -> float:
+    """
+    Лучшее из repeat время разбора всех названий (секунды).
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for title in titles:
+            decomposer.decompose_laptop(title)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--titles', type=int, default=5000, help='сколько синтетических названий сгенерировать')
+    parser.add_argument('--csv', action='append', default=[], help='CSV с реальными названиями (можно несколько)')
+    parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторить замер')
+    args = parser.parse_args()
+
+    titles = generate_titles(args.titles)
+    for path in args.csv:
+        if os.path.exists(path):
+            titles.extend(load_titles(path))
+        else:
+            print(f"Файл {path} не найден, пропускаем.")
+
+    tokens = LaptopDecomposer(engine='tokens')
+    regex = LaptopDecomposer(engine='regex')
+
+    mismatches = 0
+    for title in titles:
+        expected = regex.decompose_laptop(title)
+        actual = tokens.decompose_laptop(title)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                diff = {key: (expected[key], actual[key]) for key in expected if expected[key] != actual[key]}
+                print(f"Расхождение: {title!r}: {diff}")
+    if mismatches:
+        print(f"Результаты различаются на {mismatches} из {len(titles)} названий.")
+        return 1
+    print(f"Результаты совпадают на всех {len(titles)} названиях.")
+
+    regex_time = measure(regex, titles, args.repeat)
+    tokens_time = measure(tokens, titles, args.repeat)
+    print(f"regex:  {len(titles) / regex_time:10.0f} названий/сек")
+    print(f"tokens: {len(titles) / tokens_time:10.0f} названий/сек")
+    print(f"Ускорение: x{regex_time / tokens_time:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())